@@ -1,20 +1,39 @@
 # Functions for the curation app
+import asyncio
+import codecs
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 import csv
+from datetime import datetime, timedelta, timezone
 from dateutil.parser import parse
-from functools import reduce
+from email.utils import parsedate_to_datetime
 import json
 import glob
+import hashlib
+import heapq
+from itertools import chain, count as counter, groupby, islice, product
+import numpy as np
+from operator import itemgetter
 import os
 from os import listdir
 import pandas as pd
 from pathlib import Path
+import queue
+import random
 import re
 import requests
+import sqlite3
+import tempfile
+import threading
 import time
 from tkinter import Tk, ttk, Frame, Label, IntVar, Checkbutton, filedialog, NORMAL, DISABLED
 from tkinter import Listbox, MULTIPLE, StringVar, END, INSERT, N, E, S, W
 from tkinter.ttk import Entry, Progressbar, OptionMenu, Combobox
-from urllib.parse import urlparse
+from urllib.parse import unquote_plus, urlparse
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 
 # Class for custom collapsiblePanel frame using tkinter widgets
@@ -115,6 +134,623 @@ def get_installation_url(string):
         return installationUrl
 
 
+# Enter a user agent and email address to send with every API call. Some Dataverse installations
+# block requests from scripts. If left empty, the requests library's user agent is sent
+userAgent = ''
+emailAddress = ''
+
+# Seconds to wait for an installation to accept a connection and to send a response
+defaultTimeout = (30, 300)
+
+
+# File that stores API responses between sessions and the most bytes of responses it stores
+responseCacheFilePath = str(Path(Path.home(), '.dataverse_repository_curation_assistant', 'response_cache.sqlite3'))
+responseCacheMaxBytes = 200 * 1024 * 1024
+
+# Seconds that a call to the cache waits for the cache file to be unlocked by other processes
+responseCacheBusyTimeout = 10
+
+# Seconds that the responses of each API endpoint stay fresh in the cache.
+# Responses of endpoints not listed here aren't cached
+responseCacheTtls = [
+    (re.compile(r'/api/(v1/)?metadatablocks(/[^/]+)?/?$'), 7 * 24 * 60 * 60),
+    (re.compile(r'/api/(v1/)?info/version/?$'), 24 * 60 * 60),
+    (re.compile(r'/api/(v1/)?dataverses/[^/]+/?$'), 24 * 60 * 60)
+]
+
+# Response headers that are saved with cached responses
+responseCacheHeaders = ['Content-Type', 'ETag', 'Last-Modified']
+
+
+# Function for getting how many seconds the response of a given URL stays fresh in the cache,
+# or None if responses of the URL shouldn't be cached
+def get_response_cache_ttl(url):
+    path = urlparse(url).path
+    for pathPattern, ttl in responseCacheTtls:
+        if pathPattern.search(path):
+            return ttl
+
+
+# Class for a cache of API responses, saved in an SQLite file so that re-runs against the same installation
+# can use responses from earlier sessions. When the responses in the file are bigger than maxBytes,
+# the least recently used responses are removed. The file can be used by other processes at the same time, so
+# each call waits up to busyTimeout seconds for the file to be unlocked, and if the cache still can't be used,
+# a lookup is treated as a cache miss and a change to the cache is skipped instead of failing the API call
+class responseCache(object):
+
+    def __init__(self, filePath=responseCacheFilePath, maxBytes=responseCacheMaxBytes, busyTimeout=responseCacheBusyTimeout):
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        self.connection = sqlite3.connect(filePath, timeout=busyTimeout, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'cache_key TEXT PRIMARY KEY, url TEXT, status_code INTEGER, headers TEXT, content BLOB, '
+            'expires_time REAL, last_used_time REAL, size INTEGER)')
+        self.connection.commit()
+
+    # Undoes the changes of a call that failed, so that the next call starts a new transaction
+    def rollback(self):
+        try:
+            self.connection.rollback()
+        except sqlite3.Error:
+            pass
+
+    # Returns the cached response of a cache key and if it's still fresh, or None if it isn't cached
+    def get(self, cacheKey):
+        with self.lock:
+            try:
+                row = self.connection.execute(
+                    'SELECT url, status_code, headers, content, expires_time FROM responses WHERE cache_key = ?',
+                    (cacheKey,)).fetchone()
+                if row is None:
+                    return None
+                self.connection.execute(
+                    'UPDATE responses SET last_used_time = ? WHERE cache_key = ?', (time.time(), cacheKey))
+                self.connection.commit()
+            except sqlite3.Error:
+                self.rollback()
+                return None
+
+        url, statusCode, headers, content, expiresTime = row
+
+        response = requests.models.Response()
+        response.url = url
+        response.status_code = statusCode
+        response.headers = requests.structures.CaseInsensitiveDict(json.loads(headers))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = content
+
+        return response, time.time() < expiresTime
+
+    def set(self, cacheKey, response, ttl):
+        headers = {
+            header: response.headers[header] for header in responseCacheHeaders if header in response.headers}
+        content = response.content
+
+        with self.lock:
+            try:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (cacheKey, response.url, response.status_code, json.dumps(headers), content,
+                        time.time() + ttl, time.time(), len(content)))
+
+                # Remove the least recently used responses until the cached responses fit in maxBytes
+                totalBytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if totalBytes > self.maxBytes:
+                    for oldCacheKey, size in self.connection.execute(
+                        'SELECT cache_key, size FROM responses ORDER BY last_used_time').fetchall():
+                        if totalBytes <= self.maxBytes:
+                            break
+                        self.connection.execute('DELETE FROM responses WHERE cache_key = ?', (oldCacheKey,))
+                        totalBytes -= size
+
+                self.connection.commit()
+            except sqlite3.Error:
+                self.rollback()
+
+    # Make a cached response fresh again, e.g. when the installation says the response hasn't changed
+    def refresh(self, cacheKey, ttl):
+        with self.lock:
+            try:
+                self.connection.execute(
+                    'UPDATE responses SET expires_time = ?, last_used_time = ? WHERE cache_key = ?',
+                    (time.time() + ttl, time.time(), cacheKey))
+                self.connection.commit()
+            except sqlite3.Error:
+                self.rollback()
+
+    # Remove the cached responses of every URL that starts with urlPrefix, e.g. all responses of an installation
+    # after a call that changes something in it
+    def invalidate(self, urlPrefix):
+        with self.lock:
+            try:
+                self.connection.execute(
+                    'DELETE FROM responses WHERE substr(url, 1, ?) = ?', (len(urlPrefix), urlPrefix))
+                self.connection.commit()
+            except sqlite3.Error:
+                self.rollback()
+
+
+# Cache shared by all clients, created the first time it's used. Set useResponseCache
+# to False to always get responses from the installations
+useResponseCache = True
+sharedResponseCache = None
+sharedResponseCacheLock = threading.Lock()
+
+
+# Function for getting the cache shared by all clients, or None if the cache file can't be used
+def get_response_cache():
+    global sharedResponseCache
+    global useResponseCache
+
+    with sharedResponseCacheLock:
+        if useResponseCache and sharedResponseCache is None:
+            try:
+                sharedResponseCache = responseCache()
+            except (OSError, sqlite3.Error):
+                useResponseCache = False
+
+    return sharedResponseCache
+
+
+# Settings for the rate governors that control how many API calls are made at the same time to each host.
+# Each governor starts at initialConcurrency calls, adds about one call for each round of successful calls and
+# halves the calls when the host returns errors or its responses slow down to slowResponseFactor times its fastest
+governorInitialConcurrency = 4
+governorMinConcurrency = 1
+governorMaxConcurrency = 100
+governorSlowResponseFactor = 4
+
+# Response status codes that mean a host is overloaded
+overloadedStatusCodes = (429, 502, 503, 504)
+
+
+# Function for getting how many seconds a Retry-After header asks to wait, given as seconds or as a date
+def get_retry_after_seconds(retryAfter):
+    if not retryAfter:
+        return None
+    try:
+        return max(float(retryAfter), 0)
+    except ValueError:
+        pass
+    try:
+        retryAfterDate = parsedate_to_datetime(retryAfter)
+        return max(retryAfterDate.timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+# Class for a governor that tracks the latency and error rate of API calls to one host and grows or shrinks the
+# number of calls allowed at the same time AIMD-style (additive increase, multiplicative decrease). It also stops
+# all calls to the host for as long as the host asks in a Retry-After header
+class hostRateGovernor(object):
+
+    def __init__(
+        self, host, initialConcurrency=governorInitialConcurrency,
+        minConcurrency=governorMinConcurrency, maxConcurrency=governorMaxConcurrency):
+        self.host = host
+        self.concurrency = float(initialConcurrency)
+        self.minConcurrency = minConcurrency
+        self.maxConcurrency = maxConcurrency
+
+        self.inFlight = 0
+        self.blockedUntil = 0
+        self.lastDecreaseTime = 0
+        self.averageLatency = None
+        self.fastestLatency = None
+        self.errorRate = 0.0
+        self.completedTimes = deque()
+        self.condition = threading.Condition()
+
+    # Returns how many seconds a new call has to wait before it can be made, or 0 if it can be made now
+    def get_wait_time(self):
+        now = time.time()
+        if now < self.blockedUntil:
+            return self.blockedUntil - now
+        if self.inFlight >= int(self.concurrency):
+            return 0.05
+        return 0
+
+    # Reserves a place for a new call if one is free and returns True, or returns False
+    def try_acquire(self):
+        with self.condition:
+            if self.get_wait_time() > 0:
+                return False
+            self.inFlight += 1
+            return True
+
+    # Waits until there's a place for a new call and reserves it
+    def acquire(self):
+        with self.condition:
+            waitTime = self.get_wait_time()
+            while waitTime > 0:
+                self.condition.wait(timeout=waitTime)
+                waitTime = self.get_wait_time()
+            self.inFlight += 1
+
+    # Frees the place of a finished call and records its latency and outcome. statusCode is None if the call failed
+    # without a response, e.g. because it timed out
+    def release(self, latency, statusCode=None, retryAfter=None):
+        with self.condition:
+            now = time.time()
+            self.inFlight -= 1
+            self.completedTimes.append(now)
+            while self.completedTimes and self.completedTimes[0] < now - 60:
+                self.completedTimes.popleft()
+
+            isError = statusCode is None or statusCode in overloadedStatusCodes
+            self.errorRate = self.errorRate * 0.9 + (0.1 if isError else 0)
+
+            if not isError:
+                if self.averageLatency is None:
+                    self.averageLatency = latency
+                else:
+                    self.averageLatency = self.averageLatency * 0.8 + latency * 0.2
+                if self.fastestLatency is None or latency < self.fastestLatency:
+                    self.fastestLatency = latency
+
+            retryAfterSeconds = get_retry_after_seconds(retryAfter)
+            if retryAfterSeconds is not None and statusCode in overloadedStatusCodes:
+                self.blockedUntil = max(self.blockedUntil, now + retryAfterSeconds)
+
+            isSlow = (
+                self.fastestLatency is not None and latency > 1
+                and latency > self.fastestLatency * governorSlowResponseFactor)
+
+            # Halve the calls allowed at the same time on errors or slow responses, but only once for all of the calls
+            # that were in flight together, and otherwise add about one call for each round of successful calls
+            if isError or isSlow:
+                if now - self.lastDecreaseTime > max(self.averageLatency or 0, 1):
+                    self.concurrency = max(self.concurrency / 2, self.minConcurrency)
+                    self.lastDecreaseTime = now
+            else:
+                self.concurrency = min(self.concurrency + 1 / self.concurrency, self.maxConcurrency)
+
+            self.condition.notify_all()
+
+    # Frees the place of a call that failed for a reason that has nothing to do with the host, without recording
+    # the call's latency or outcome
+    def cancel(self):
+        with self.condition:
+            self.inFlight -= 1
+            self.condition.notify_all()
+
+    # Returns the governor's current state, including the calls allowed at the same time and the calls per second
+    # completed in the last minute
+    def get_status(self):
+        with self.condition:
+            now = time.time()
+            recentCompletedTimes = [t for t in self.completedTimes if t >= now - 60]
+            if recentCompletedTimes:
+                requestsPerSecond = len(recentCompletedTimes) / max(now - recentCompletedTimes[0], 1)
+            else:
+                requestsPerSecond = 0.0
+
+            return {
+                'host': self.host,
+                'concurrency': int(self.concurrency),
+                'inFlight': self.inFlight,
+                'requestsPerSecond': round(requestsPerSecond, 2),
+                'averageLatency': self.averageLatency,
+                'errorRate': round(self.errorRate, 3),
+                'blockedSeconds': max(self.blockedUntil - now, 0)}
+
+
+# Governors that have been created, keyed by host
+hostRateGovernors = {}
+hostRateGovernorsLock = threading.Lock()
+
+
+# Function for getting the rate governor of the host of a given URL, creating the governor the first time the host is used
+def get_host_rate_governor(url):
+    host = urlparse(url).netloc
+    with hostRateGovernorsLock:
+        if host not in hostRateGovernors:
+            hostRateGovernors[host] = hostRateGovernor(host)
+        return hostRateGovernors[host]
+
+
+# Settings for retrying API calls that fail for reasons that might not last, like timeouts and overloaded hosts.
+# Each retry waits a random time of up to retryBackoffBase * 2 ** retry seconds (capped at retryBackoffMax), or
+# longer if the host's Retry-After header asks for longer
+retryMaxAttempts = 5
+retryBackoffBase = 1
+retryBackoffMax = 60
+
+# HTTP methods whose calls don't change anything in an installation. After calls with other methods, like deleting
+# a collection or moving a dataset, the cached responses of the installation are removed, since they may be out of date
+safeMethods = ('GET', 'HEAD', 'OPTIONS')
+
+# HTTP methods whose calls can be made more than once without changing the result. Calls with other methods, like POST,
+# are retried only if the host didn't get the call, i.e. the connection couldn't be made or the host answered 429
+idempotentMethods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# Settings for the circuit breakers that stop calls to a host that seems to be down. After circuitBreakerFailureThreshold
+# failed calls in a row, calls to the host fail right away for circuitBreakerResetTimeout seconds. Then one call is let
+# through to check if the host is back
+circuitBreakerFailureThreshold = 5
+circuitBreakerResetTimeout = 60
+
+
+# Exception raised instead of calling a host whose circuit breaker is open
+class circuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+# Function for checking if a failed API call should be retried, given the call's method and either the exception
+# raised by the call or the call's response status code
+def is_retryable(method, exception=None, statusCode=None):
+    isIdempotent = method.upper() in idempotentMethods
+    if exception is not None:
+        if isinstance(exception, circuitOpenError):
+            return False
+        if isinstance(exception, requests.exceptions.ConnectTimeout):
+            return True
+        return isIdempotent and isinstance(exception, (
+            requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError))
+    if statusCode == 429:
+        return True
+    return isIdempotent and statusCode in overloadedStatusCodes
+
+
+# Function for getting how many seconds to wait before retrying a call, given how many times the call has been retried
+# and the Retry-After header of the call's response, if any
+def get_retry_wait_time(retryCount, retryAfter=None):
+    waitTime = random.uniform(0, min(retryBackoffBase * 2 ** retryCount, retryBackoffMax))
+    retryAfterSeconds = get_retry_after_seconds(retryAfter)
+    if retryAfterSeconds is not None:
+        waitTime = max(waitTime, min(retryAfterSeconds, retryBackoffMax))
+    return waitTime
+
+
+# Class for a circuit breaker that counts the failed calls in a row to one host. Failed calls are ones without a
+# response or with a 502, 503 or 504 response. Other errors, like the 500 responses of Search API pages with misindexed
+# objects, mean the host is up, so they don't count
+class hostCircuitBreaker(object):
+
+    def __init__(
+        self, host, failureThreshold=circuitBreakerFailureThreshold, resetTimeout=circuitBreakerResetTimeout):
+        self.host = host
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.failureCount = 0
+        self.openedAt = None
+        self.isTrialCallInFlight = False
+        self.lock = threading.Lock()
+
+    # Raises circuitOpenError if calls to the host should not be made right now
+    def check(self):
+        with self.lock:
+            if self.openedAt is None:
+                return
+            if time.time() - self.openedAt >= self.resetTimeout and not self.isTrialCallInFlight:
+                self.isTrialCallInFlight = True
+                return
+            raise circuitOpenError('Calls to %s stopped after %s failed calls in a row' % (self.host, self.failureCount))
+
+    def record_success(self):
+        with self.lock:
+            self.failureCount = 0
+            self.openedAt = None
+            self.isTrialCallInFlight = False
+
+    # Lets another call check if the host is back, when a call that was let through for that failed for a reason
+    # that has nothing to do with the host
+    def cancel_trial_call(self):
+        with self.lock:
+            self.isTrialCallInFlight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failureCount += 1
+            if self.isTrialCallInFlight or self.failureCount >= self.failureThreshold:
+                self.openedAt = time.time()
+            self.isTrialCallInFlight = False
+
+    # Records the outcome of a call, given its response status code, or None if the call failed without a response
+    def record(self, statusCode):
+        if statusCode is None or statusCode in (502, 503, 504):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def get_state(self):
+        with self.lock:
+            if self.openedAt is None:
+                return 'closed'
+            if time.time() - self.openedAt >= self.resetTimeout:
+                return 'half-open'
+            return 'open'
+
+
+# Circuit breakers that have been created, keyed by host
+hostCircuitBreakers = {}
+hostCircuitBreakersLock = threading.Lock()
+
+
+# Function for getting the circuit breaker of the host of a given URL, creating it the first time the host is used
+def get_host_circuit_breaker(url):
+    host = urlparse(url).netloc
+    with hostCircuitBreakersLock:
+        if host not in hostCircuitBreakers:
+            hostCircuitBreakers[host] = hostCircuitBreaker(host)
+        return hostCircuitBreakers[host]
+
+
+# Function for getting the scope that cached responses and indexed collection trees are saved under for a given
+# API key. Only a hash of the API key is used, so the key itself isn't saved
+def get_api_key_scope(apiKey=''):
+    if apiKey:
+        return hashlib.sha256(apiKey.encode('utf-8')).hexdigest()[:16]
+    return ''
+
+
+# Class for a client that calls the APIs of one Dataverse installation over a pool of kept-alive
+# connections, so that each call doesn't need a new TCP and TLS handshake, and that sends the
+# default headers and timeouts with every call. If a cache is given, responses of the endpoints
+# in responseCacheTtls are saved in the cache. Calls are made only as fast as the host's rate governor allows,
+# calls that fail for reasons that might not last are retried, and calls to a host that seems to be down fail fast
+class installationClient(object):
+
+    def __init__(
+        self, installationUrl, apiKey='', headers=None, timeout=defaultTimeout, poolSize=10, verify=True,
+        cache=None):
+        self.installationUrl = installationUrl
+        self.apiKey = apiKey
+        self.timeout = timeout
+        self.cache = cache
+        self.governor = get_host_rate_governor(installationUrl)
+        self.circuitBreaker = get_host_circuit_breaker(installationUrl)
+
+        # Cached responses are saved per API key, since responses can depend on the key's permissions
+        self.cacheScope = get_api_key_scope(apiKey)
+
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        if userAgent:
+            self.session.headers['User-Agent'] = userAgent
+        if emailAddress:
+            self.session.headers['From'] = emailAddress
+        if headers:
+            self.session.headers.update(headers)
+        if apiKey:
+            self.session.headers['X-Dataverse-key'] = apiKey
+
+    # Makes an API call, retrying it up to maxAttempts times in total if is_retryable says it can be. If the call still
+    # fails, the last exception is raised or the last response is returned. The returned response's retryCount is the
+    # number of times the call was retried, and its earlierAttemptMayHaveSucceeded is True if an earlier attempt timed out
+    # or lost its connection after it was sent, so that the installation may have acted on it, e.g. so that a 404
+    # response to a retried DELETE call can be taken to mean that the earlier attempt deleted the object
+    def request(self, method, url, maxAttempts=retryMaxAttempts, **kwargs):
+        if self.cache is None or method.upper() in safeMethods:
+            return self.request_with_retries(method, url, maxAttempts, **kwargs)
+
+        # Unless the installation says the call failed, remove the installation's cached responses, including when
+        # the call timed out, since the installation may have made the change anyway
+        response = None
+        try:
+            response = self.request_with_retries(method, url, maxAttempts, **kwargs)
+            return response
+        finally:
+            if response is None or response.status_code < 400:
+                self.cache.invalidate(self.installationUrl + '/')
+
+    def request_with_retries(self, method, url, maxAttempts=retryMaxAttempts, **kwargs):
+        if maxAttempts < 1:
+            raise ValueError('maxAttempts must be at least 1, not %s' % (maxAttempts))
+        kwargs.setdefault('timeout', self.timeout)
+
+        earlierAttemptMayHaveSucceeded = False
+        for attempt in range(maxAttempts):
+            self.circuitBreaker.check()
+            self.governor.acquire()
+            startTime = time.time()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.governor.release(time.time() - startTime)
+                self.circuitBreaker.record(None)
+                if attempt + 1 >= maxAttempts or not is_retryable(method, exception=e):
+                    raise
+
+                # Calls that couldn't connect never reached the installation
+                if not isinstance(e, requests.exceptions.ConnectTimeout):
+                    earlierAttemptMayHaveSucceeded = True
+                time.sleep(get_retry_wait_time(attempt))
+                continue
+
+            # Free the call's place in the governor if the call fails for any other reason, like an invalid URL or
+            # the user stopping the script, which doesn't say anything about the host
+            except BaseException:
+                self.governor.cancel()
+                self.circuitBreaker.cancel_trial_call()
+                raise
+
+            retryAfter = response.headers.get('Retry-After')
+            self.governor.release(time.time() - startTime, statusCode=response.status_code, retryAfter=retryAfter)
+            self.circuitBreaker.record(response.status_code)
+            if attempt + 1 >= maxAttempts or not is_retryable(method, statusCode=response.status_code):
+                response.retryCount = attempt
+                response.earlierAttemptMayHaveSucceeded = earlierAttemptMayHaveSucceeded
+                return response
+            time.sleep(get_retry_wait_time(attempt, retryAfter))
+
+    # Makes a GET call, using a cached response if there's a fresh one. If refresh is True, the installation is always
+    # called and the cached response is replaced with the new one
+    def get(self, url, refresh=False, **kwargs):
+        ttl = get_response_cache_ttl(url)
+        if self.cache is None or ttl is None:
+            return self.request('GET', url, **kwargs)
+
+        preparedUrl = requests.Request('GET', url, params=kwargs.get('params')).prepare().url
+        cacheKey = hashlib.sha256(('%s %s' % (self.cacheScope, preparedUrl)).encode('utf-8')).hexdigest()
+
+        cached = None if refresh else self.cache.get(cacheKey)
+        if cached is not None:
+            cachedResponse, isFresh = cached
+            if isFresh:
+                return cachedResponse
+
+            # If the cached response is stale, ask the installation to send the response only if it's changed
+            revalidationHeaders = dict(kwargs.get('headers') or {})
+            if 'ETag' in cachedResponse.headers:
+                revalidationHeaders['If-None-Match'] = cachedResponse.headers['ETag']
+            if 'Last-Modified' in cachedResponse.headers:
+                revalidationHeaders['If-Modified-Since'] = cachedResponse.headers['Last-Modified']
+            kwargs['headers'] = revalidationHeaders
+
+        response = self.request('GET', url, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            self.cache.refresh(cacheKey, ttl)
+            return cachedResponse
+        if response.status_code == 200:
+            self.cache.set(cacheKey, response, ttl)
+
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# Clients that have been created, keyed by installation URL and API key
+installationClients = {}
+installationClientsLock = threading.Lock()
+
+
+# Function for getting the client of the installation of a given URL and API key,
+# creating the client the first time the installation and API key are used
+def get_installation_client(url, apiKey=''):
+    installationUrl = get_installation_url(url)
+    clientKey = (installationUrl, apiKey or '')
+
+    with installationClientsLock:
+        if clientKey not in installationClients:
+            # Keep at least as many connections as the Search API pages requested at the same time
+            poolSize = max(10, get_search_api_worker_count(installationUrl))
+            installationClients[clientKey] = installationClient(
+                installationUrl, apiKey=apiKey, poolSize=poolSize, cache=get_response_cache())
+        client = installationClients[clientKey]
+
+    return client
+
+
 # Gets list of URLs from Dataverse map JSON data and add Demo Dataverse url
 def get_installation_list():
     installationsList = []
@@ -134,26 +770,18 @@ def get_installation_list():
     return installationsList
 
 
-# Function for getting name of installation's root collection 
+# Function for getting name of installation's root collection from the collection tree index
 # (assumming root dataverse's ID is 1, which isn't the case with UVA Dataverse)
 def get_root_alias_name(url):
+    installationUrl = get_installation_url(url)
 
     # If it's the UVA homepage URL, it's root alias is uva (whose database ID is not 1)
     if 'dataverse.lib.virginia.edu' in url:
         rootAlias = 'uva'
 
     # If's it's not the UVA homepage URL, get the alias of the collection whose database is 1
-    elif '/dataverse/' in url:
-        parsed = urlparse(url)
-        url = parsed.scheme + '://' + parsed.netloc + '/api/dataverses/1'
-        response = requests.get(url)
-        dataverseData = response.json()
-        rootAlias = dataverseData['data']['alias']
-    elif '/dataverse/' not in url:
-        url = '%s/api/dataverses/1' % (url)
-        response = requests.get(url)
-        dataverseData = response.json()
-        rootAlias = dataverseData['data']['alias']
+    else:
+        rootAlias = get_indexed_collection(installationUrl, 1)['alias']
 
     return rootAlias
 
@@ -162,19 +790,9 @@ def get_root_alias_name(url):
 # including the "Root" collection
 def get_alias_from_collection_url(url):
 
-    # If /dataverse/ is not in the URL, assume it's the installation's server url...
+    # If /dataverse/ is not in the URL, assume it's the installation's server url and get its root alias
     if '/dataverse/' not in url:
-        # If it's the UVA homepage URL, get it's root alias, whose database ID is not 1
-        if 'dataverse.lib.virginia.edu' in url:
-            alias = 'uva'
-
-        # If's it's not the UVA homepage URL, get the alias of the collection whose database is 1
-        elif 'dataverse.lib.virginia.edu' not in url:
-            installationUrl = get_installation_url(url)
-            url = '%s/api/dataverses/1' % (installationUrl)
-            response = requests.get(url)
-            dataverseData = response.json()
-            alias = dataverseData['data']['alias']
+        alias = get_root_alias_name(url)
 
     # If /dataverse/ is in the url, assume it's a collection URL and parse string to get its alias...
     elif '/dataverse/' in url:
@@ -189,30 +807,32 @@ def get_alias_from_collection_url(url):
 
 
 # Returns True if collection alias is the installation's root collection or
-# False if not (doesn't work with UVA)
+# False if not
 def is_root_collection(url):
-    if get_alias_from_collection_url(url) == get_root_alias_name(url):
-        return True
-    elif get_alias_from_collection_url(url) != get_root_alias_name(url):
-        return False
+    return get_alias_from_collection_url(url) == get_root_alias_name(url)
+
+
+# Patterns for parsing collection and search URLs, compiled once since saved URLs are parsed in batches
+jsessionidPattern = re.compile(r';jsessionid=[^?]*')
+collectionAliasPattern = re.compile(r'/dataverse/([^/?#&]*)')
+collectionSearchPattern = re.compile(r'/dataverse/[^?]*\?q')
+numberedFqPattern = re.compile(r'fq\d+')
+typesPattern = re.compile(r'types=.*?&')
+dvObjectTypePattern = re.compile(r'fq=dvObjectType:\([^)]*\)&')
 
 
 # Function that turns Dataverse installation URL, instalation URL or search URL into a Search API URL
 def get_search_api_url(url, apiKey=None):
 
+    # Remove the jsessionidString that sometimes appears in the URL
+    url = jsessionidPattern.sub('', url)
+
     # If URL is not a search url (doesn't contain 'q=') and contains /dataverse/, it's a Dataverse collection URL
     if 'q=' not in url and '/dataverse/' in url:
-        # Remove the jsessionidString that sometimes appears in the URL
-        try:
-            jsessionidString = re.search(r';jsessionid=.*', url).group()
-            url = url.replace(jsessionidString, '?')
-        except AttributeError:
-            pass
-        # Get the Dataverse Collection name in the search URL
-        dataversePart = re.search(r'\/dataverse\/.*', url).group()
-        dataverseName = dataversePart.replace('/dataverse/', '')
-        # Repalce '/dataverse/' and the dataverse name with '/api/search?q=*' and add subtree parameter with dataverse name
-        apiSearchURL = url.replace(dataversePart, '/api/search?q=*') + '&subtree=%s' % (dataverseName)
+        # Get the Dataverse Collection name in the URL
+        dataverseName = collectionAliasPattern.search(url).group(1)
+        # Repalce '/dataverse/' and everything after it with '/api/search?q=*' and add subtree parameter with dataverse name
+        apiSearchURL = url[:url.index('/dataverse/')] + '/api/search?q=*&subtree=%s' % (dataverseName)
 
     # If URL is not a search URL (doesn't contain 'q=') and doesn't have /dataverse/, assume it's the URL of the installation
     if 'q=' not in url and '/dataverse/' not in url:
@@ -227,23 +847,23 @@ def get_search_api_url(url, apiKey=None):
         # Sometimes there's a slash before the ?q. If so, remove it
         url = url.replace('/?q', '?q')
 
-        # If there's a jsessionid string, remove it
-        try:
-            jsessionidString = re.search(r';jsessionid=.*\?', url).group()
-            url = url.replace(jsessionidString, '?')
-        except AttributeError:
-            pass
-        
         # Get the Dataverse Collection name in the search URL
-        # dataverseName = re.search(r'\/dataverse\/\w*\?q', url)
-        dataverseName = re.search(r'\/dataverse\/.*\?q', url)
-        dataverseName = dataverseName.group()
+        dataverseName = collectionSearchPattern.search(url)
 
-        subtree = dataverseName.replace('/dataverse/', '&subtree=').replace('?q', '')
+        if dataverseName is not None:
+            dataverseName = dataverseName.group()
+            subtree = dataverseName.replace('/dataverse/', '&subtree=').replace('?q', '')
+            apiSearchURL = url.replace(dataverseName, '/api/search?q')
+
+        # If there's no /dataverse/ before the ?q, it's a search of the installation's root collection,
+        # e.g. https://demo.dataverse.org/?q=surveys or https://demo.dataverse.org/dataverse.xhtml?q=surveys
+        else:
+            subtree = ''
+            parsed = urlparse(url)
+            apiSearchURL = '%s://%s/api/search?%s' % (parsed.scheme, parsed.netloc, parsed.query)
 
         apiSearchURL = (
-            url
-                .replace(dataverseName, '/api/search?q')
+            apiSearchURL
                 .replace('?q=&', '?q=*&')
                 .replace('%3A', ':')
                 .replace('%22', '"')
@@ -254,24 +874,22 @@ def get_search_api_url(url, apiKey=None):
                 )
 
         # Remove any digits after any fq parameters
-        apiSearchURL = re.sub('fq\d', 'fq', apiSearchURL)
+        apiSearchURL = numberedFqPattern.sub('fq', apiSearchURL)
         apiSearchURL = apiSearchURL + '&per_page=10&start=0'
 
         # Replace values of any "types" parameters into the Search API's "type" paramater
-        try:
-            dTypes = re.search(r'types=.*?&', apiSearchURL).group()
-            dTypesList = dTypes.replace('types=', '').replace('&', '').split(':')
+        dTypes = typesPattern.search(apiSearchURL)
+        if dTypes is not None:
+            dTypesList = dTypes.group().replace('types=', '').replace('&', '').split(':')
             dTypesString = ''
             for dType in dTypesList:
                 dType = '&type=%s' %(re.sub('s$', '', dType))
                 dTypesString = dTypesString + dType
             apiSearchURL = apiSearchURL + dTypesString
-        except AttributeError:
-            pass
 
         # Remove dvObjectType and types parameters, which I think the Search API is ignoring
-        apiSearchURL = re.sub('fq=dvObjectType:\(.*\)&', '', apiSearchURL)
-        apiSearchURL = re.sub('types=.*?&', '', apiSearchURL)
+        apiSearchURL = dvObjectTypePattern.sub('', apiSearchURL)
+        apiSearchURL = typesPattern.sub('', apiSearchURL)
 
     return apiSearchURL
 
@@ -375,6 +993,30 @@ def convert_utf8bytes_to_characters(string):
         )
     return string
 
+
+
+# Error handler for percent-encoded bytes that aren't valid UTF-8, which decodes each byte as Windows-1252,
+# or as Latin-1 if Windows-1252 doesn't define the byte, since some search URLs are encoded that way
+def decode_invalid_utf8_bytes(error):
+    invalidBytes = error.object[error.start:error.end]
+    characters = ''.join(
+        bytes([invalidByte]).decode('cp1252', errors='ignore') or chr(invalidByte) for invalidByte in invalidBytes)
+    return characters, error.end
+
+
+codecs.register_error('percentDecodingFallback', decode_invalid_utf8_bytes)
+
+
+# Function that decodes a percent-encoded string from a URL in one pass, replacing the chained replace calls of
+# convert_utf8bytes_to_characters and convert_common_html_encoding. Every code from %00 to %FF and every UTF-8
+# character is decoded, plus signs are turned into spaces, and decoded characters aren't decoded again,
+# e.g. %2541 becomes %41, not A
+def decode_percent_encoding(string):
+    if '%' not in string and '+' not in string:
+        return string
+    return unquote_plus(string, errors='percentDecodingFallback')
+
+
 # Function that returns the params of a given Search API URL, to be used in requests calls
 def get_params(apiSearchURL):
     params = {
@@ -399,10 +1041,7 @@ def get_params(apiSearchURL):
 
         # Add query to params dict
         if paramValue.startswith('q='):
-            paramValue = convert_utf8bytes_to_characters(paramValue)
-            paramValue = convert_common_html_encoding(paramValue)
-            paramValue = paramValue.replace('+', ' ')
-            params['params']['q'] = paramValue.replace('q=', '')
+            params['params']['q'] = decode_percent_encoding(paramValue[2:])
 
         # Add non-fq queries to params dict
         if not paramValue.startswith('=') and not paramValue.startswith('q='):
@@ -418,10 +1057,7 @@ def get_params(apiSearchURL):
         # Add fq queries to fq dict if paramValue.startswith('='):
         if paramValue.startswith('='):
             key = paramValue.replace('=', '').split(':')[0]
-            value = paramValue.split(':')[1]
-            value = convert_utf8bytes_to_characters(value)
-            value = convert_common_html_encoding(value)
-            value = value.replace('+', ' ')
+            value = decode_percent_encoding(paramValue.split(':', 1)[1])
             paramString = key + ':' + value
             fq.append(paramString)
 
@@ -436,6 +1072,76 @@ def get_params(apiSearchURL):
     return params
 
 
+# Canonical forms of collection and search URLs, keyed by the SHA-256 hash of each URL,
+# so that URLs parsed before aren't parsed again
+canonicalSearchQueries = {}
+canonicalSearchQueriesLock = threading.Lock()
+
+
+# Function for getting the canonical form of a collection or search URL as a tuple of its Search API URL and params,
+# from the cache of canonical forms if the URL was parsed before. Raises ValueError if the URL can't be parsed
+def get_canonical_search_query(url):
+    url = url.strip()
+    urlHash = hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    with canonicalSearchQueriesLock:
+        canonicalSearchQuery = canonicalSearchQueries.get(urlHash)
+
+    if canonicalSearchQuery is None:
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            raise ValueError('Not a collection or search URL')
+        try:
+            requestsGetProperties = get_params(get_search_api_url(url))
+        except (AttributeError, IndexError, ValueError) as error:
+            raise ValueError('Couldn\'t parse URL (%s: %s)' % (type(error).__name__, error))
+        canonicalSearchQuery = (requestsGetProperties['baseUrl'], requestsGetProperties['params'])
+
+        with canonicalSearchQueriesLock:
+            canonicalSearchQueries[urlHash] = canonicalSearchQuery
+
+    # Return a copy of the params, since the functions that use them add params of their own
+    baseUrl, params = canonicalSearchQuery
+    return baseUrl, {key: list(value) if isinstance(value, list) else value for key, value in params.items()}
+
+
+# Function for getting the canonical forms of a batch of collection and search URLs, e.g. saved searches that are
+# re-run every night. Returns a dict of each parsed URL's Search API URL and params, and a list of the URLs that
+# couldn't be parsed along with why. If a cache file path is given, canonical forms saved in the file are used
+# and the canonical forms of all parsed URLs are saved to it
+def normalize_search_urls(urls, cacheFilePath=None):
+    if cacheFilePath is not None and os.path.isfile(cacheFilePath):
+        # Start with an empty cache if the cache file is truncated or corrupt, e.g. after a disk filled up
+        with open(cacheFilePath, mode='r', encoding='utf-8') as f:
+            try:
+                savedSearchQueries = json.load(f)
+            except ValueError as error:
+                print('Ignoring unreadable search query cache file %s: %s' % (cacheFilePath, error))
+                savedSearchQueries = {}
+        with canonicalSearchQueriesLock:
+            for urlHash, (baseUrl, params) in savedSearchQueries.items():
+                canonicalSearchQueries.setdefault(urlHash, (baseUrl, params))
+
+    canonicalSearchQueriesByUrl = {}
+    unparseableUrls = []
+    for url in urls:
+        try:
+            canonicalSearchQueriesByUrl[url] = get_canonical_search_query(url)
+        except ValueError as error:
+            unparseableUrls.append((url, str(error)))
+
+    # Save the cache to a temporary file first so that the cache file is never left half-written
+    if cacheFilePath is not None:
+        with canonicalSearchQueriesLock:
+            savedSearchQueries = dict(canonicalSearchQueries)
+        temporaryFilePath = cacheFilePath + '.tmp'
+        with open(temporaryFilePath, mode='w', encoding='utf-8') as f:
+            json.dump(savedSearchQueries, f)
+        os.replace(temporaryFilePath, cacheFilePath)
+
+    return canonicalSearchQueriesByUrl, unparseableUrls
+
+
 # Gets info from Search API about a given dataverse, dataset or file
 def get_value_row_from_search_api_object(item, installationUrl):
     if item['type'] == 'dataset':
@@ -470,17 +1176,627 @@ def get_value_row_from_search_api_object(item, installationUrl):
     return newRow
 
 
-# Uses Search API to return dataframe containing info about datasets in a Dataverse installation
-# Write progress and results to the tkinter window
-def get_object_dataframe_from_search_api(
-    url, params, objectType, rootWindow=None, progressText=None, progressLabel=None, apiKey=None):
+# Number of Search API pages to request at the same time from each installation.
+# Installations not listed here are paged through one page at a time,
+# e.g. {'https://demo.dataverse.org': 4}
+searchApiWorkerCounts = {}
+defaultSearchApiWorkerCount = 1
+
+
+# Function for getting the number of Search API pages to request at the same time from an installation
+def get_search_api_worker_count(installationUrl):
+    return searchApiWorkerCounts.get(installationUrl, defaultSearchApiWorkerCount)
+
+
+# Most results the Search API returns per call
+searchApiMaxPerPage = 1000
+
+
+# Gets the items of one page of Search API results, starting at the given start offset,
+# and the start offsets of any objects in that page that couldn't be retrieved
+def get_search_api_page_items(url, params, start, perPage, client):
+    pageParams = dict(params)
+    pageParams['start'] = start
+    pageParams['per_page'] = perPage
+
+    # Calls that fail without a response, like calls to a host whose circuit breaker is open, and responses
+    # that the client has already retried, like those of an overloaded host, aren't caused by misindexed objects,
+    # so they're raised instead of narrowed down
+    response = client.get(
+        url,
+        params=pageParams
+    )
+    if response.status_code not in (200, 500):
+        raise requests.exceptions.HTTPError(
+            'Search API call failed with status %s' % (response.status_code), response=response)
+
+    try:
+        if response.status_code == 200:
+            data = response.json()
+            return data['data']['items'], []
+    except (ValueError, KeyError, TypeError):
+        pass
+
+    # If misindexed objects break the Search API call with a server error or a response that isn't
+    # valid JSON, split the page in half and get each half, until the broken calls are narrowed down to the
+    # misindexed objects themselves. This way every object that isn't misindexed is still retrieved
+    # (See https://github.com/IQSS/dataverse/issues/4225)
+    if perPage == 1:
+        return [], [start]
+
+    firstHalfPerPage = perPage // 2
+    firstHalfItems, firstHalfMisindexedOffsets = get_search_api_page_items(
+        url, params, start, firstHalfPerPage, client)
+    secondHalfItems, secondHalfMisindexedOffsets = get_search_api_page_items(
+        url, params, start + firstHalfPerPage, perPage - firstHalfPerPage, client)
+
+    return firstHalfItems + secondHalfItems, firstHalfMisindexedOffsets + secondHalfMisindexedOffsets
+
+
+# Queries with more results than searchApiPartitionMaxSize are split into partitions by date, so that no partition
+# is paged deeper than that, since the Search API gets slower the higher the start offset is. The pages of all
+# partitions are requested at the same time, at least searchApiPartitionWorkerCount pages at a time
+searchApiPartitionMaxSize = 10000
+searchApiPartitionWorkerCount = 4
+
+
+# Function for adding fq params to a copy of a Search API query's params
+def add_search_api_filters(params, filters):
+    fq = params.get('fq', [])
+    if isinstance(fq, str):
+        fq = [fq]
+    return dict(params, fq=list(fq) + list(filters))
+
+
+# Function for splitting a Search API query into partitions that don't overlap, each given as an fq param on the date
+# that the Search API sorts results by (the dateSort field), so that each partition has no more than maxSize results.
+# Date ranges with more results are split in half until they're small enough or a second long. Returns a list of
+# tuples of each partition's fq param and result count, in the order of the query's results if it's sorted by date,
+# followed by a partition of any results without a date
+def get_search_api_date_partitions(url, params, client, maxSize=searchApiPartitionMaxSize, workerCount=searchApiPartitionWorkerCount):
+
+    def get_date_range_filter(rangeStart, rangeEnd):
+        rangeStart = '*' if rangeStart is None else rangeStart.strftime('%Y-%m-%dT%H:%M:%SZ')
+        rangeEnd = '*]' if rangeEnd is None else rangeEnd.strftime('%Y-%m-%dT%H:%M:%SZ') + '}'
+        return 'dateSort:[%s TO %s' % (rangeStart, rangeEnd)
+
+    def get_date_range_count(dateRange):
+        return get_search_api_total_count(url, add_search_api_filters(params, [get_date_range_filter(*dateRange)]), client)
+
+    # Start with the date ranges before 2000, from 2000 until tomorrow, and after tomorrow
+    splitDates = [
+        datetime(2000, 1, 1, tzinfo=timezone.utc),
+        datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=2)]
+    dateRanges = [(None, splitDates[0]), (splitDates[0], splitDates[1]), (splitDates[1], None)]
+    partitions = []
+
+    with ThreadPoolExecutor(max_workers=max(workerCount, 1)) as executor:
+        while dateRanges:
+            nextDateRanges = []
+            for dateRange, count in zip(dateRanges, executor.map(get_date_range_count, dateRanges)):
+                rangeStart, rangeEnd = dateRange
+                if count == 0:
+                    continue
+                if count > maxSize and None not in dateRange and rangeEnd - rangeStart > timedelta(seconds=1):
+                    rangeMiddle = (rangeStart + (rangeEnd - rangeStart) / 2).replace(microsecond=0)
+                    nextDateRanges.extend([(rangeStart, rangeMiddle), (rangeMiddle, rangeEnd)])
+                else:
+                    partitions.append((dateRange, count))
+            dateRanges = nextDateRanges
+
+    partitions.sort(key=lambda partition: partition[0][0] or datetime.min.replace(tzinfo=timezone.utc))
+    if params.get('sort') == 'date' and params.get('order') == 'desc':
+        partitions.reverse()
+    partitions = [(get_date_range_filter(*dateRange), count) for dateRange, count in partitions]
+
+    noDateFilter = '-dateSort:[* TO *]'
+    noDateCount = get_search_api_total_count(url, add_search_api_filters(params, [noDateFilter]), client)
+    if noDateCount > 0:
+        partitions.append((noDateFilter, noDateCount))
+
+    return partitions
+
+
+# Function for getting a key that identifies a Search API item, used to remove items that are returned
+# by more than one partition of a query when the installation's search index changes during a harvest, e.g. when an
+# item's date changes and moves it into the next partition
+def get_search_api_item_key(item):
+    return (
+        item.get('type'), item.get('entity_id'), item.get('global_id'), item.get('file_id'),
+        item.get('identifier'), item.get('versionState'), item.get('identifier_of_dataverse'))
+
+
+# Lazily yields every item of the results of a Search API query with the given total count. The pages of results are
+# requested workerCount pages at a time, and only a few pages per worker are requested ahead of the page being
+# yielded, so that pages don't pile up in memory when items are consumed slower than they're downloaded.
+# Queries with more results than searchApiPartitionMaxSize are split into partitions by date whose pages are requested
+# at the same time. Partitions don't overlap, so items returned more than once are looked for only in the partition
+# being yielded and the one before it, which keeps memory use bounded by the partition size.
+# If a list is passed as misindexedObjectOffsets, the start offsets of items that couldn't be retrieved are added to
+# it, counted from the start of the first partition. When a partitioned query isn't sorted by date, its items are
+# yielded in date order instead of the query's order, so those offsets aren't offsets in the unpartitioned query
+def get_search_api_items(url, params, client, total, workerCount=1, misindexedObjectOffsets=None):
+    if misindexedObjectOffsets is None:
+        misindexedObjectOffsets = []
+
+    partitions = [(None, total)]
+    if total > searchApiPartitionMaxSize:
+        workerCount = max(workerCount, searchApiPartitionWorkerCount)
+        partitions = get_search_api_date_partitions(
+            url, params, client, maxSize=searchApiPartitionMaxSize, workerCount=workerCount)
+    workerCount = max(workerCount, 1)
+
+    # Get the params, start offset and size of every page of every partition, and the offset of the partition's
+    # first item among the items of all partitions
+    perPage = searchApiMaxPerPage
+    pages = []
+    partitionOffset = 0
+    for partitionFilter, partitionCount in partitions:
+        partitionParams = params if partitionFilter is None else add_search_api_filters(params, [partitionFilter])
+        for start in range(0, partitionCount, perPage):
+            pages.append((partitionParams, start, min(perPage, partitionCount - start), partitionOffset))
+        partitionOffset += partitionCount
+    pages = iter(pages)
+    pendingPages = deque()
+
+    # Keys of the items yielded from the partition being yielded and from the partition before it
+    currentPartitionOffset = None
+    currentPartitionItemKeys = set()
+    previousPartitionItemKeys = set()
+
+    with ThreadPoolExecutor(max_workers=workerCount) as executor:
+
+        def request_next_page():
+            page = next(pages, None)
+            if page is not None:
+                pageParams, start, pageSize, partitionOffset = page
+                pendingPages.append((partitionOffset, executor.submit(
+                    get_search_api_page_items, url, pageParams, start, pageSize, client)))
+
+        for i in range(workerCount * 2):
+            request_next_page()
+
+        # Yield the items of each page in order
+        while pendingPages:
+            partitionOffset, pendingPage = pendingPages.popleft()
+            pageItems, pageMisindexedObjectOffsets = pendingPage.result()
+            request_next_page()
+
+            misindexedObjectOffsets.extend(partitionOffset + offset for offset in pageMisindexedObjectOffsets)
+            if partitionOffset != currentPartitionOffset:
+                currentPartitionOffset = partitionOffset
+                previousPartitionItemKeys = currentPartitionItemKeys
+                currentPartitionItemKeys = set()
+
+            for item in pageItems:
+                if len(partitions) > 1:
+                    itemKey = get_search_api_item_key(item)
+                    if itemKey in currentPartitionItemKeys or itemKey in previousPartitionItemKeys:
+                        continue
+                    currentPartitionItemKeys.add(itemKey)
+                yield item
+
+
+# Function for getting the date a Search API item was last published or updated, as a timezone-aware datetime,
+# or None if the item has neither date
+def get_search_api_item_date(item):
+    itemDates = []
+    for key in ('published_at', 'updatedAt'):
+        if item.get(key):
+            itemDate = parse(item[key])
+            if itemDate.tzinfo is None:
+                itemDate = itemDate.replace(tzinfo=timezone.utc)
+            itemDates.append(itemDate)
+    if itemDates:
+        return max(itemDates)
+    return None
+
+
+# Generator function that yields the items of Search API results that were published or updated at or after watermark,
+# the date of the newest item found by an earlier harvest, so that a harvest can get only what's changed since then.
+# The results are filtered on the date the Search API sorts by (the dateSort field) instead of paging until the first
+# item older than watermark, since an older item that's been updated can be sorted after items that are older
+# than watermark. Results are sorted newest first and pages start small and grow, so that a harvest that finds
+# few new items needs only a few quick calls. If watermark is None, all items are yielded. If a list is passed as
+# misindexedObjectOffsets, the Search API start offsets of objects that couldn't be retrieved are added to it
+def get_search_api_items_newer_than(url, params, watermark, client, misindexedObjectOffsets=None):
+    if isinstance(watermark, str):
+        watermark = parse(watermark)
+    if watermark is not None and watermark.tzinfo is None:
+        watermark = watermark.replace(tzinfo=timezone.utc)
+
+    if misindexedObjectOffsets is None:
+        misindexedObjectOffsets = []
+
+    params = dict(params)
+    params['sort'] = 'date'
+    params['order'] = 'desc'
+    if watermark is not None:
+        watermarkString = watermark.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        params = add_search_api_filters(params, ['dateSort:[%s TO *]' % (watermarkString)])
+
+    start = 0
+    perPage = 10
+    while True:
+        pageItems, pageMisindexedObjectOffsets = get_search_api_page_items(url, params, start, perPage, client)
+        misindexedObjectOffsets.extend(pageMisindexedObjectOffsets)
+
+        for item in pageItems:
+            yield item
+
+        # Stop when the page is the last one
+        if len(pageItems) + len(pageMisindexedObjectOffsets) < perPage:
+            return
+
+        start += perPage
+        perPage = min(perPage * 10, searchApiMaxPerPage)
+
+
+# Name of the JSON file that stores the watermark of each installation's last Search API harvest
+searchApiWatermarksFileName = 'search_api_watermarks.json'
+searchApiWatermarksLock = threading.Lock()
+
+
+# Function for getting the watermark of an installation's last Search API harvest, saved by save_search_api_watermark,
+# as a dict with the watermark and the path of the CSV file the harvest's dataset PIDs were saved in.
+# Returns None if the installation hasn't been harvested
+def get_search_api_watermark(watermarksFilePath, installationUrl):
+    with searchApiWatermarksLock:
+        try:
+            with open(watermarksFilePath, mode='r', encoding='utf-8') as f:
+                watermarks = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    return watermarks.get(urlparse(installationUrl).netloc or installationUrl)
+
+
+# Function for saving the watermark of an installation's Search API harvest, the date of the newest item the harvest
+# found, and the path of the CSV file the harvest's dataset PIDs were saved in. Watermarks are saved per host in a
+# JSON file, which is replaced in one step so that a crash can't leave it half-written
+def save_search_api_watermark(watermarksFilePath, installationUrl, watermark, inventoryFilePath):
+    with searchApiWatermarksLock:
+        try:
+            with open(watermarksFilePath, mode='r', encoding='utf-8') as f:
+                watermarks = json.load(f)
+        except (FileNotFoundError, ValueError):
+            watermarks = {}
+
+        watermarks[urlparse(installationUrl).netloc or installationUrl] = {
+            'watermark': watermark.isoformat() if watermark is not None else None,
+            'inventory_file': str(inventoryFilePath),
+            'saved_at': datetime.now(timezone.utc).isoformat()}
+
+        temporaryFilePath = str(watermarksFilePath) + '.tmp'
+        with open(temporaryFilePath, mode='w', encoding='utf-8') as f:
+            json.dump(watermarks, f, indent=4)
+        os.replace(temporaryFilePath, watermarksFilePath)
+
+
+# Function for merging new rows, like the dataset PIDs found by an incremental harvest, into a CSV file from an earlier
+# run and writing the result to mergedFilePath. Rows in newRows replace the earlier rows with the same value in
+# keyColumn and are written first, followed by the earlier rows that weren't replaced. The merged file has the
+# columns of the earlier file, unless fieldnames is given. Returns the count of rows written
+def merge_rows_into_csv_file(previousFilePath, newRows, keyColumn, mergedFilePath, fieldnames=None):
+    with open(previousFilePath, mode='r', encoding='utf-8', newline='') as previousFile:
+        previousRows = csv.DictReader(previousFile)
+        if fieldnames is None:
+            fieldnames = previousRows.fieldnames
+
+        with open(mergedFilePath, mode='w', encoding='utf-8', newline='') as mergedFile:
+            mergedRows = csv.DictWriter(mergedFile, fieldnames=fieldnames, restval='', extrasaction='ignore')
+            mergedRows.writeheader()
+
+            rowCount = 0
+            newKeys = set()
+            for newRow in newRows:
+                if newRow[keyColumn] in newKeys:
+                    continue
+                newKeys.add(newRow[keyColumn])
+                mergedRows.writerow(newRow)
+                rowCount += 1
+
+            for previousRow in previousRows:
+                if previousRow[keyColumn] not in newKeys:
+                    mergedRows.writerow(previousRow)
+                    rowCount += 1
+
+    return rowCount
+
+
+# Class for a journal that records the progress of a long crawl of one or more installations, so that a crawl that
+# stops, e.g. because the script crashes or loses its network connection, can be restarted where it stopped.
+# Each record is a line of JSON appended to the journal file. Records are flushed as they're written but only synced
+# to disk every syncInterval seconds, so that recording progress doesn't slow down the crawl. When the journal is
+# opened, its records are replayed to get the state of the crawl. A half-written last line is ignored
+class crawlJournal(object):
+
+    def __init__(self, filePath, syncInterval=1):
+        self.filePath = filePath
+        self.syncInterval = syncInterval
+        self.lastSyncTime = time.time()
+        self.lock = threading.Lock()
+
+        self.runDirectory = None
+        self.isRunFinished = False
+        self.installations = {}
+        self.finishedInstallations = set()
+
+        isLastLineFinished = True
+        try:
+            with open(filePath, mode='r', encoding='utf-8') as f:
+                for line in f:
+                    isLastLineFinished = line.endswith('\n')
+                    try:
+                        self.replay(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+
+        # If the last run finished, start a new journal for the next run
+        if self.isRunFinished:
+            os.remove(filePath)
+            self.runDirectory = None
+            self.isRunFinished = False
+            self.installations = {}
+            self.finishedInstallations = set()
+
+        self.journalFile = open(filePath, mode='a', encoding='utf-8')
+
+        # Start a new line after a half-written last line, so that the next record isn't added to it
+        if not isLastLineFinished and os.path.exists(filePath) and os.path.getsize(filePath) > 0:
+            self.journalFile.write('\n')
+
+    # Updates the state of the crawl with one record
+    def replay(self, record):
+        event = record['event']
+        if event == 'run_started':
+            self.runDirectory = record['directory']
+        elif event == 'run_finished':
+            self.isRunFinished = True
+        elif event == 'installation_started':
+            self.installations[record['hostname']] = {
+                'files': record['files'], 'searchApiProgress': None, 'isSearchApiFinished': False,
+                'savedPids': set()}
+        elif event == 'search_api_progress':
+            self.installations[record['hostname']]['searchApiProgress'] = record['progress']
+        elif event == 'search_api_finished':
+            self.installations[record['hostname']]['isSearchApiFinished'] = True
+        elif event == 'pid_saved':
+            self.installations[record['hostname']]['savedPids'].add(record['pid'])
+        elif event == 'pids_saved':
+            self.installations[record['hostname']]['savedPids'].update(record['pids'])
+        elif event == 'installation_finished':
+            self.finishedInstallations.add(record['hostname'])
+
+    # Appends a record to the journal and updates the state of the crawl
+    def record(self, event, **fields):
+        record = dict(fields)
+        record['event'] = event
+        with self.lock:
+            self.replay(record)
+            self.journalFile.write(json.dumps(record) + '\n')
+            self.journalFile.flush()
+            if time.time() - self.lastSyncTime >= self.syncInterval:
+                os.fsync(self.journalFile.fileno())
+                self.lastSyncTime = time.time()
+
+    # Starts a new run in directory. The records of any earlier run, e.g. one whose directory has been removed,
+    # are cleared, so that its finished installations and saved files aren't used in the new run
+    def start_run(self, directory):
+        with self.lock:
+            self.journalFile.close()
+            self.journalFile = open(self.filePath, mode='w', encoding='utf-8')
+            self.runDirectory = None
+            self.isRunFinished = False
+            self.installations = {}
+            self.finishedInstallations = set()
+
+        self.record('run_started', directory=directory)
+
+    def finish_run(self):
+        self.record('run_finished')
+        self.close()
+
+    # Records the start of an installation's crawl and the paths of the files and directories it saves things in,
+    # given as a dict, so that a restarted crawl can keep using them
+    def start_installation(self, hostname, files):
+        self.record('installation_started', hostname=hostname, files=files)
+
+    # Returns the dict of the files and directories of an installation whose crawl started but didn't finish, or None
+    def get_installation_files(self, hostname):
+        installation = self.installations.get(hostname)
+        if installation is None or hostname in self.finishedInstallations:
+            return None
+        return installation['files']
+
+    # Records how far the crawl has paged through an installation's Search API results, given as a dict, e.g. the
+    # start offset of the next page and the size of the CSV file the results were written to
+    def record_search_api_progress(self, hostname, progress):
+        self.record('search_api_progress', hostname=hostname, progress=progress)
+
+    def get_search_api_progress(self, hostname):
+        return self.installations[hostname]['searchApiProgress']
+
+    def finish_search_api(self, hostname):
+        self.record('search_api_finished', hostname=hostname)
+
+    def is_search_api_finished(self, hostname):
+        return self.installations[hostname]['isSearchApiFinished']
+
+    # Records a batch of PIDs whose metadata was saved in one record, so that the journal doesn't get a line for
+    # every dataset
+    def record_saved_pids(self, hostname, pids):
+        if pids:
+            self.record('pids_saved', hostname=hostname, pids=list(pids))
+
+    def get_saved_pids(self, hostname):
+        return self.installations[hostname]['savedPids']
+
+    # Records the end of an installation's crawl and compacts the journal, since the PIDs saved in that crawl
+    # aren't needed anymore
+    def finish_installation(self, hostname):
+        self.record('installation_finished', hostname=hostname)
+        self.compact()
+
+    # Rewrites the journal with only the records needed to get back the current state of the crawl: one record for
+    # each installation's files, Search API progress and saved PIDs, and none of the saved PIDs of finished
+    # installations
+    def compact(self):
+        with self.lock:
+            records = []
+            if self.runDirectory is not None:
+                records.append({'event': 'run_started', 'directory': self.runDirectory})
+            for hostname, installation in self.installations.items():
+                records.append({'event': 'installation_started', 'hostname': hostname, 'files': installation['files']})
+                if installation['searchApiProgress'] is not None:
+                    records.append({
+                        'event': 'search_api_progress', 'hostname': hostname,
+                        'progress': installation['searchApiProgress']})
+                if installation['isSearchApiFinished']:
+                    records.append({'event': 'search_api_finished', 'hostname': hostname})
+                if hostname in self.finishedInstallations:
+                    installation['savedPids'] = set()
+                    records.append({'event': 'installation_finished', 'hostname': hostname})
+                elif installation['savedPids']:
+                    records.append({'event': 'pids_saved', 'hostname': hostname, 'pids': sorted(installation['savedPids'])})
+            if self.isRunFinished:
+                records.append({'event': 'run_finished'})
+
+            # Write the records to a new file and then replace the journal with it, so that a crash while
+            # compacting leaves the old journal
+            compactedFilePath = self.filePath + '.compacting'
+            with open(compactedFilePath, mode='w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.journalFile.close()
+            os.replace(compactedFilePath, self.filePath)
+            self.journalFile = open(self.filePath, mode='a', encoding='utf-8')
+            self.lastSyncTime = time.time()
+
+    def is_installation_finished(self, hostname):
+        return hostname in self.finishedInstallations
+
+    def close(self):
+        with self.lock:
+            self.journalFile.close()
+
+
+# Class for a scheduler that runs the tasks of many hosts, like downloads of dataset metadata, on one pool of worker
+# threads. Each host has its own queue of tasks and its own budget of tasks that can run at the same time: at most
+# hostConcurrency, and no more than the host's rate governor allows. A worker that's free takes the next task of any
+# host that's under its budget, preferring the host with the highest priority, e.g. the most datasets, and then the
+# host with the most tasks waiting. This way a slow host can't keep the workers from working on other hosts
+class hostWorkScheduler(object):
+
+    def __init__(self, workerCount=32, hostConcurrency=8):
+        self.hostConcurrency = hostConcurrency
+        self.hostQueues = {}
+        self.hostInFlight = {}
+        self.hostPriorities = {}
+        self.isShutDown = False
+        self.condition = threading.Condition()
+
+        self.workers = []
+        for i in range(workerCount):
+            worker = threading.Thread(target=self.run_worker, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def set_host_priority(self, host, priority):
+        with self.condition:
+            self.hostPriorities[host] = priority
+
+    # Returns how many of a host's tasks can run at the same time
+    def get_host_budget(self, host):
+        budget = self.hostConcurrency
+        governor = hostRateGovernors.get(host)
+        if governor is not None:
+            budget = min(budget, max(int(governor.concurrency), 1))
+        return budget
+
+    # Adds a task that calls function with the given arguments to the host's queue and returns a Future of its result
+    def submit(self, host, function, *args, **kwargs):
+        future = Future()
+        with self.condition:
+            if self.isShutDown:
+                raise RuntimeError('Cannot submit tasks after the scheduler is shut down')
+            self.hostQueues.setdefault(host, deque()).append((future, function, args, kwargs))
+            self.hostInFlight.setdefault(host, 0)
+            self.condition.notify()
+        return future
+
+    # Returns the host and task that a free worker should run next, or None if no host has a task it can run.
+    # Must be called while holding self.condition
+    def get_next_task(self):
+        nextHost = None
+        for host, hostQueue in self.hostQueues.items():
+            if not hostQueue or self.hostInFlight[host] >= self.get_host_budget(host):
+                continue
+            hostRank = (self.hostPriorities.get(host, 0), len(hostQueue))
+            if nextHost is None or hostRank > nextHostRank:
+                nextHost = host
+                nextHostRank = hostRank
+
+        if nextHost is None:
+            return None
+        return nextHost, self.hostQueues[nextHost].popleft()
+
+    def run_worker(self):
+        while True:
+            with self.condition:
+                nextTask = self.get_next_task()
+                while nextTask is None:
+                    if self.isShutDown and not any(self.hostQueues.values()):
+                        return
+
+                    # Wait with a timeout, since hosts' budgets can grow when their rate governors let them
+                    self.condition.wait(timeout=0.1)
+                    nextTask = self.get_next_task()
+
+                host, (future, function, args, kwargs) = nextTask
+                self.hostInFlight[host] += 1
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self.condition:
+                self.hostInFlight[host] -= 1
+                self.condition.notify_all()
+
+    # Lets the workers finish the tasks that are waiting and stops them
+    def shutdown(self, wait=True):
+        with self.condition:
+            self.isShutDown = True
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+
+# Uses Search API to lazily yield a row of info about each object in a Dataverse installation,
+# so that rows can be written or filtered as they arrive instead of being held in memory.
+# If a list is passed as misindexedObjectOffsets, the Search API start offsets of objects
+# that couldn't be retrieved are added to it
+def get_object_rows_from_search_api(
+    url, params, objectType, apiKey=None, workerCount=None, misindexedObjectOffsets=None):
 
     installationUrl = get_installation_url(url)
+    client = get_installation_client(installationUrl, apiKey)
 
-    if apiKey:
-        header = {'X-Dataverse-key': apiKey}
-    else:
-        header = {}
+    # If no worker count is given, use the worker count set for the installation
+    if workerCount is None:
+        workerCount = get_search_api_worker_count(installationUrl)
+    workerCount = max(workerCount, 1)
+
+    if misindexedObjectOffsets is None:
+        misindexedObjectOffsets = []
 
     params['type'] = objectType
 
@@ -490,20 +1806,24 @@ def get_object_dataframe_from_search_api(
     # Get total count of objects
     params['per_page'] = 1
 
-    response = requests.get(
+    response = client.get(
         url,
-        params=params,
-        headers=header
+        params=params
     )
     data = response.json()
     total = data['data']['total_count']
 
-    misindexedObjectCount = 0
-    objectInfoDict = []
+    for item in get_search_api_items(
+        url, params, client, total, workerCount=workerCount, misindexedObjectOffsets=misindexedObjectOffsets):
+        yield dict(get_value_row_from_search_api_object(item, installationUrl))
 
-    # Initialization for paginating through results of Search API calls
-    condition = True
-    params['start'] = 0
+
+# Uses Search API to return dataframe containing info about datasets in a Dataverse installation
+# Write progress and results to the tkinter window. If a list is passed as misindexedObjectOffsets,
+# the Search API start offsets of objects that couldn't be retrieved are added to it
+def get_object_dataframe_from_search_api(
+    url, params, objectType, rootWindow=None, progressText=None, progressLabel=None, apiKey=None,
+    workerCount=None, misindexedObjectOffsets=None):
 
     if None not in [rootWindow, progressText, progressLabel]:
         text = 'Looking for datasets...'
@@ -511,106 +1831,488 @@ def get_object_dataframe_from_search_api(
         progressLabel.config(fg='green')
         progressLabel = progressLabel.grid(sticky='w', row=0)
         rootWindow.update_idletasks()
-    
-    while condition:
-        try:
-            params['per_page'] = 10
-            response = requests.get(
-                url,
-                params=params,
-                headers=header
-            )
-            data = response.json()
 
-            for item in data['data']['items']:
-                newRow = get_value_row_from_search_api_object(item, installationUrl)
-                objectInfoDict.append(dict(newRow))
-                datasetCount = len(objectInfoDict)
-                
-            # Update variables to paginate through the search results
-            params['start'] = params['start'] + params['per_page']
-
-        # If misindexed datasets break the Search API call where per_page=10,
-        # try calls where per_page=1 then per_page=10 again
-        # (See https://github.com/IQSS/dataverse/issues/4225)
-        except Exception:
-            try:
-                params['per_page'] = 1
-                response = requests.get(
-                    url,
-                    params=params,
-                    headers=header
-                )
-                data = response.json()
+    objectRows = get_object_rows_from_search_api(
+        url, params, objectType, apiKey=apiKey, workerCount=workerCount,
+        misindexedObjectOffsets=misindexedObjectOffsets)
 
-                for item in data['data']['items']:
-                    newRow = get_value_row_from_search_api_object(item, installationUrl)
-                    objectInfoDict.append(dict(newRow))
+    objectInfoDF = pd.DataFrame(list(objectRows))
 
-                # Update variables to paginate through the search results
-                params['start'] = params['start'] + params['per_page']
+    return objectInfoDF
 
-            # If page fails to load, count a misindexed object and continue to the next page
-            except Exception:
-                misindexedObjectCount += 1
-                params['start'] = params['start'] + params['per_page']
 
-        condition = params['start'] < total
+# Number of collections whose info and contents are requested at the same time when walking a tree of collections
+defaultCollectionTreeWorkerCount = 8
 
-    objectInfoDF = pd.DataFrame(objectInfoDict)
 
-    return objectInfoDF
+# Gets the info of a collection, given its alias or database ID, and the items in the collection, using the
+# "Get dataverse" and "Get contents" endpoints. If refresh is True, the info isn't taken from cached responses
+def get_collection_info_and_contents(installationUrl, collectionIdentifier, client, refresh=False):
+    dataverseInfoEndpoint = '%s/api/dataverses/%s' % (installationUrl, collectionIdentifier)
+    response = client.get(dataverseInfoEndpoint, refresh=refresh)
+    data = response.json()
+    collectionInfo = {
+        'id': data['data']['id'],
+        'alias': data['data']['alias'],
+        'name': data['data']['name'],
+        'parent_id': data['data'].get('ownerId')}
+
+    dataverseGetContentsEndpoint = '%s/api/dataverses/%s/contents' % (installationUrl, collectionIdentifier)
+    response = client.get(dataverseGetContentsEndpoint)
+    data = response.json()
 
+    return collectionInfo, data['data']
 
-# Uses "Get Contents" endpoint to return list of dataverse aliases of all subcollections in a given collection
-def get_all_subcollection_aliases(collectionUrl, apiKey=''):
+
+# Uses the "Get dataverse" and "Get contents" endpoints to return the tree of collections in a given collection,
+# including the given collection, as a list of dicts with each collection's id, alias, name, parent_id and depth,
+# in breadth-first order. Depths are counted from the given collection, whose parent_id is the ID of the collection
+# that owns it, or None if it's the root collection. Linked collections aren't included. The tree is walked one depth
+# at a time, and the info and contents of all collections at a depth are requested at the same time. If maxDepth is
+# given, collections deeper than maxDepth aren't included. If includeDatasets is True, each dict also has a list of the
+# items of the datasets in the collection, so that callers that need them don't have to get each collection's contents again.
+# If refresh is True, the installation is asked for the info of every collection instead of using cached responses
+def get_collection_tree(collectionUrl, apiKey='', workerCount=None, maxDepth=None, includeDatasets=False, refresh=False):
 
     parsed = urlparse(collectionUrl)
     installationUrl = parsed.scheme + '://' + parsed.netloc
     alias = parsed.path.split('/')[2]
 
-    if apiKey:
-        header = {'X-Dataverse-key': apiKey}
-    else:
-        header = {}
+    client = get_installation_client(installationUrl, apiKey)
+
+    if workerCount is None:
+        workerCount = defaultCollectionTreeWorkerCount
+
+    collectionTree = []
+
+    # Each collection at the current depth is given as its alias or ID
+    currentDepth = 0
+    collectionsAtDepth = [alias]
+
+    with ThreadPoolExecutor(max_workers=max(workerCount, 1)) as executor:
+        while collectionsAtDepth:
+            results = executor.map(
+                lambda collectionIdentifier: get_collection_info_and_contents(
+                    installationUrl, collectionIdentifier, client, refresh=refresh),
+                collectionsAtDepth)
+
+            collectionsAtNextDepth = []
+            for collectionInfo, contents in results:
+                collectionInfo['depth'] = currentDepth
+                if includeDatasets:
+                    collectionInfo['datasets'] = [item for item in contents if item['type'] == 'dataset']
+                collectionTree.append(collectionInfo)
+
+                for item in contents:
+                    if item['type'] == 'dataverse':
+                        collectionsAtNextDepth.append(item['id'])
+
+            currentDepth += 1
+            if maxDepth is not None and currentDepth > maxDepth:
+                break
+            collectionsAtDepth = collectionsAtNextDepth
+
+    return collectionTree
+
+
+# File that stores the collection trees of installations between sessions, and seconds that indexed collections
+# and walked subtrees stay fresh before they're requested again
+collectionTreeIndexFilePath = str(Path(Path.home(), '.dataverse_repository_curation_assistant', 'collection_tree_index.sqlite3'))
+collectionTreeIndexTtl = 24 * 60 * 60
+
+
+# Class for an index of the collection trees of installations, saved in an SQLite file, that maps each collection's
+# database ID to its alias, name, parent's ID and depth, so that collections and their ancestors and descendants can
+# be looked up without calling the installation's APIs. The index also saves when the subtree of each collection was
+# walked, so that only the subtrees that were walked more than ttl seconds ago have to be walked again. Each tree is
+# saved under a tree key from get_collection_tree_key, so that unpublished collections found with one API key aren't
+# returned to calls made without it
+class collectionTreeIndex(object):
+
+    def __init__(self, filePath=collectionTreeIndexFilePath, ttl=collectionTreeIndexTtl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        self.connection = sqlite3.connect(filePath, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+
+        # Rebuild indexes saved before collections were indexed separately for each API key
+        columns = [row['name'] for row in self.connection.execute('PRAGMA table_info(collections)').fetchall()]
+        if columns and 'tree_key' not in columns:
+            self.connection.execute('DROP TABLE collections')
+            self.connection.execute('DROP TABLE IF EXISTS walked_subtrees')
+
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS collections ('
+            'tree_key TEXT, id INTEGER, alias TEXT, name TEXT, parent_id INTEGER, depth INTEGER, '
+            'indexed_time REAL, PRIMARY KEY (tree_key, id))')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS collections_alias ON collections (tree_key, alias)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS collections_parent_id ON collections (tree_key, parent_id)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS walked_subtrees ('
+            'tree_key TEXT, id INTEGER, walked_time REAL, PRIMARY KEY (tree_key, id))')
+        self.connection.commit()
+
+    # Returns the SQL condition and value for finding a collection by its alias or database ID,
+    # which the Dataverse APIs also accept in place of each other
+    def get_identifier_condition(self, collectionIdentifier):
+        if str(collectionIdentifier).isdigit():
+            return 'id = ?', int(collectionIdentifier)
+        return 'alias = ?', collectionIdentifier
+
+    # Returns the depth of a child of the collection with the given ID, or None if that isn't known
+    # because the collection's ancestors aren't indexed
+    def get_child_depth(self, treeKey, parentId):
+        if parentId is None:
+            return 0
+        row = self.connection.execute(
+            'SELECT depth FROM collections WHERE tree_key = ? AND id = ?', (treeKey, parentId)).fetchone()
+        if row is None or row['depth'] is None:
+            return None
+        return row['depth'] + 1
+
+    # Returns a dict of a collection's id, alias, name, parent_id and depth, or None if it isn't indexed
+    # or was indexed more than ttl seconds ago
+    def get_collection(self, treeKey, collectionIdentifier):
+        condition, value = self.get_identifier_condition(collectionIdentifier)
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT id, alias, name, parent_id, depth FROM collections '
+                'WHERE tree_key = ? AND indexed_time > ? AND ' + condition,
+                (treeKey, time.time() - self.ttl, value)).fetchone()
+
+        return dict(row) if row is not None else None
+
+    # Returns the collections that own a given collection, starting with its parent and ending with
+    # the root collection or the highest ancestor that's indexed
+    def get_ancestors(self, treeKey, collectionIdentifier):
+        condition, value = self.get_identifier_condition(collectionIdentifier)
+        with self.lock:
+            rows = self.connection.execute(
+                'WITH RECURSIVE ancestors(id, distance) AS ('
+                'SELECT parent_id, 1 FROM collections WHERE tree_key = ? AND ' + condition + ' '
+                'UNION ALL SELECT collections.parent_id, ancestors.distance + 1 '
+                'FROM collections JOIN ancestors ON collections.id = ancestors.id '
+                'WHERE collections.tree_key = ? AND collections.parent_id IS NOT NULL) '
+                'SELECT collections.id, alias, name, parent_id, depth FROM ancestors '
+                'JOIN collections ON collections.id = ancestors.id AND collections.tree_key = ? '
+                'ORDER BY ancestors.distance',
+                (treeKey, value, treeKey, treeKey)).fetchall()
+
+        return [dict(row) for row in rows]
+
+    # Returns the collections in the subtree of a given collection, including the given collection,
+    # in breadth-first order
+    def get_descendants(self, treeKey, collectionIdentifier):
+        condition, value = self.get_identifier_condition(collectionIdentifier)
+        with self.lock:
+            rows = self.connection.execute(
+                'WITH RECURSIVE descendants(id, distance) AS ('
+                'SELECT id, 0 FROM collections WHERE tree_key = ? AND ' + condition + ' '
+                'UNION ALL SELECT collections.id, descendants.distance + 1 '
+                'FROM collections JOIN descendants ON collections.parent_id = descendants.id '
+                'WHERE collections.tree_key = ?) '
+                'SELECT collections.id, alias, name, parent_id, depth FROM descendants '
+                'JOIN collections ON collections.id = descendants.id AND collections.tree_key = ? '
+                'ORDER BY descendants.distance, collections.id',
+                (treeKey, value, treeKey, treeKey)).fetchall()
+
+        return [dict(row) for row in rows]
+
+    # Returns True if the subtree of a given collection, or of any of its ancestors, was walked within ttl seconds
+    def is_subtree_fresh(self, treeKey, collectionIdentifier):
+        collection = self.get_collection(treeKey, collectionIdentifier)
+        if collection is None:
+            return False
+
+        collectionIds = [collection['id']] + [
+            ancestor['id'] for ancestor in self.get_ancestors(treeKey, collection['id'])]
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT COUNT(*) FROM walked_subtrees WHERE tree_key = ? AND walked_time > ? '
+                'AND id IN (%s)' % (', '.join('?' * len(collectionIds))),
+                [treeKey, time.time() - self.ttl] + collectionIds).fetchone()
+
+        return row[0] > 0
+
+    # Adds or updates a collection, given as a dict with its id, alias, name and parent_id, and returns
+    # the collection with its depth
+    def save_collection(self, treeKey, collection):
+        with self.lock:
+            depth = self.get_child_depth(treeKey, collection['parent_id'])
+            self.connection.execute(
+                'INSERT OR REPLACE INTO collections VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (treeKey, collection['id'], collection['alias'], collection['name'],
+                    collection['parent_id'], depth, time.time()))
+            self.connection.commit()
+
+        return dict(collection, depth=depth)
+
+    # Replaces the indexed subtree of a collection with a tree returned by get_collection_tree, so that collections
+    # that were deleted or moved out of the subtree since it was last walked are removed
+    def save_subtree(self, treeKey, collectionTree):
+        rootCollection = collectionTree[0]
+        indexedTime = time.time()
+
+        with self.lock:
+            oldCollectionIds = [row['id'] for row in self.connection.execute(
+                'WITH RECURSIVE descendants(id) AS (SELECT ? UNION SELECT collections.id '
+                'FROM collections JOIN descendants ON collections.parent_id = descendants.id '
+                'WHERE collections.tree_key = ?) SELECT id FROM descendants',
+                (rootCollection['id'], treeKey)).fetchall()]
+            for oldCollectionId in oldCollectionIds:
+                self.connection.execute(
+                    'DELETE FROM collections WHERE tree_key = ? AND id = ?', (treeKey, oldCollectionId))
+                self.connection.execute(
+                    'DELETE FROM walked_subtrees WHERE tree_key = ? AND id = ?', (treeKey, oldCollectionId))
+
+            # Depths in the tree are counted from its root collection, so add the root collection's depth when it's known
+            rootDepth = self.get_child_depth(treeKey, rootCollection['parent_id'])
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO collections VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(treeKey, collection['id'], collection['alias'], collection['name'], collection['parent_id'],
+                    None if rootDepth is None else rootDepth + collection['depth'], indexedTime)
+                    for collection in collectionTree])
+            self.connection.execute(
+                'INSERT OR REPLACE INTO walked_subtrees VALUES (?, ?, ?)',
+                (treeKey, rootCollection['id'], indexedTime))
+            self.connection.commit()
+
+
+# Index shared by all functions, created the first time it's used. Set useCollectionTreeIndex
+# to False to always get collections from the installations
+useCollectionTreeIndex = True
+sharedCollectionTreeIndex = None
+sharedCollectionTreeIndexLock = threading.Lock()
+
+
+# Function for getting the shared collection tree index, or None if the index file can't be used
+def get_collection_tree_index():
+    global sharedCollectionTreeIndex
+    global useCollectionTreeIndex
+
+    with sharedCollectionTreeIndexLock:
+        if useCollectionTreeIndex and sharedCollectionTreeIndex is None:
+            try:
+                sharedCollectionTreeIndex = collectionTreeIndex()
+            except (OSError, sqlite3.Error):
+                useCollectionTreeIndex = False
+
+    return sharedCollectionTreeIndex
+
+
+# Function for getting the key that the collection tree of an installation, as seen with a given API key, is saved
+# under in the collection tree index. Like cached responses, trees are saved per API key, since the collections
+# that can be seen depend on the key's permissions, and only a hash of the API key is saved
+def get_collection_tree_key(installationUrl, apiKey=''):
+    return '%s %s' % (installationUrl, get_api_key_scope(apiKey))
 
-    # Get ID of given dataverse alias
-    dataverseInfoEndpoint = '%s/api/dataverses/%s' % (installationUrl, alias)
 
-    response = requests.get(
-        dataverseInfoEndpoint,
-        headers=header)
+# Function for getting a dict of a collection's id, alias, name, parent_id and depth from the collection tree index,
+# or from the installation's "Get dataverse" endpoint when the collection isn't indexed
+def get_indexed_collection(installationUrl, collectionIdentifier, apiKey=''):
+    treeKey = get_collection_tree_key(installationUrl, apiKey)
+    index = get_collection_tree_index()
+    if index is not None:
+        collection = index.get_collection(treeKey, collectionIdentifier)
+        if collection is not None:
+            return collection
+
+    url = '%s/api/dataverses/%s' % (installationUrl, collectionIdentifier)
+    response = get_installation_client(installationUrl, apiKey).get(url)
     data = response.json()
-    parentDataverseId = data['data']['id']
+    collection = {
+        'id': data['data']['id'],
+        'alias': data['data']['alias'],
+        'name': data['data']['name'],
+        'parent_id': data['data'].get('ownerId')}
 
-    # Create list and add ID of given dataverse
-    dataverseIds = [parentDataverseId]
+    if index is not None:
+        return index.save_collection(treeKey, collection)
+    return dict(collection, depth=0 if collection['parent_id'] is None else None)
 
-    # Get each subdataverse in the given dataverse
-    for dataverseId in dataverseIds:
-        dataverseGetContentsEndpoint = '%s/api/dataverses/%s/contents' % (installationUrl, dataverseId)
-        response = requests.get(
-            dataverseGetContentsEndpoint,
-            headers=header)
+
+# Returns the collections in the subtree of a given collection, including the given collection, as a list of dicts
+# with each collection's id, alias, name, parent_id and depth. The subtree comes from the collection tree index and is
+# only walked with get_collection_tree when it hasn't been walked recently or when refresh is True. The subtree is
+# always walked without using cached responses, so that the index isn't rebuilt with collection info and contents that
+# were cached before the index's last walk
+def get_collection_subtree(collectionUrl, apiKey='', refresh=False):
+    installationUrl = get_installation_url(collectionUrl)
+    alias = get_alias_from_collection_url(collectionUrl)
+
+    index = get_collection_tree_index()
+    if index is None:
+        return get_collection_tree(collectionUrl, apiKey=apiKey, refresh=refresh)
+
+    treeKey = get_collection_tree_key(installationUrl, apiKey)
+    if refresh or not index.is_subtree_fresh(treeKey, alias):
+        index.save_subtree(treeKey, get_collection_tree(collectionUrl, apiKey=apiKey, refresh=True))
+
+    return index.get_descendants(treeKey, alias)
+
+
+# Returns list of dataverse aliases of all subcollections in a given collection, including the given collection
+def get_all_subcollection_aliases(collectionUrl, apiKey=''):
+    return [collection['alias'] for collection in get_collection_subtree(collectionUrl, apiKey=apiKey)]
+
+
+# Collections whose subtrees have more datasets than this are listed with the "Get contents" endpoint when only the
+# datasets they own are wanted, since one call to that endpoint returns all of them while the Search API would page
+# through the whole subtree or page through the owned datasets 1000 at a time
+ownedDatasetsContentsMinSubtreeSize = searchApiMaxPerPage
+
+
+# Function for planning how to get only the datasets owned by a collection, given the Search API URL and params of the
+# collection's subtree. Returns a dict whose "source" is "contents" when the datasets should be listed with the
+# "Get contents" endpoint, or "search" when they should be listed with the Search API using the returned "params",
+# which filter out datasets owned by subcollections, and deaccessioned datasets if ignoreDeaccessionedDatasets is True.
+# When deaccessioned datasets are filtered out by the Search API, "deaccessionedDatasetCount" is how many there were
+def get_owned_datasets_query_plan(url, params, ownerAlias, ignoreDeaccessionedDatasets=False, apiKey=''):
+    client = get_installation_client(url, apiKey)
+    queryPlan = {'source': 'search', 'params': dict(params), 'deaccessionedDatasetCount': 0}
+
+    # Get how many datasets are in the collection's subtree
+    countParams = dict(params, type='dataset', per_page=1)
+    response = client.get(url, params=countParams)
+    subtreeDatasetCount = response.json()['data']['total_count']
+
+    # The "Get contents" endpoint doesn't say which datasets are deaccessioned, so it's only used
+    # when deaccessioned datasets don't have to be filtered out
+    if subtreeDatasetCount > ownedDatasetsContentsMinSubtreeSize and ignoreDeaccessionedDatasets == False:
+        queryPlan['source'] = 'contents'
+        return queryPlan
+
+    # Otherwise add fq params so that the Search API returns only the datasets the collection owns
+    fq = list(params.get('fq', [])) + ['identifierOfDataverse:"%s"' % (ownerAlias)]
+    queryPlan['params']['fq'] = fq
+    if ignoreDeaccessionedDatasets == True:
+        queryPlan['params']['fq'] = fq + ['-publicationStatus:"Deaccessioned"']
+
+        response = client.get(url, params=dict(countParams, fq=fq + ['publicationStatus:"Deaccessioned"']))
+        queryPlan['deaccessionedDatasetCount'] = response.json()['data']['total_count']
+
+    return queryPlan
+
+
+# Gets rows of the datasets owned by a collection from the "Get contents" endpoint, with the same keys as the
+# dataset rows from the Search API. The endpoint doesn't return version states, so datasets with a publication
+# date are given the RELEASED state and all others the DRAFT state
+def get_dataset_rows_from_collection_contents(installationUrl, collectionAlias, apiKey=''):
+    client = get_installation_client(installationUrl, apiKey)
+    url = '%s/api/dataverses/%s/contents' % (installationUrl, collectionAlias)
+    response = client.get(url)
+    data = response.json()
+
+    for item in data['data']:
+        if item['type'] == 'dataset':
+            yield {
+                'dataset_pid': '%s:%s/%s' % (item['protocol'], item['authority'], item['identifier']),
+                'version_state': 'RELEASED' if item.get('publicationDate') else 'DRAFT',
+                'dataverse_alias': collectionAlias
+            }
+
+
+# Most collection aliases put in one fq param when counting the datasets owned by a set of collections.
+# Larger sets are split into several queries whose counts are added up. The queries are requested at the same
+# time, up to searchApiCountWorkerCount at a time
+searchApiCountMaxOwnerAliases = 100
+searchApiCountWorkerCount = 8
+
+
+# Function for getting the total count of a Search API query and the counts of its facets without getting any of its
+# results. Facet counts are returned as a dict of dicts, e.g. {'publicationStatus': {'Published': 10, 'Draft': 2}}
+def get_search_api_total_count_and_facets(url, params, client):
+    params = dict(params, show_facets='true')
+    response = client.get(url, params=dict(params, per_page=0))
+    data = response.json()
+
+    # If the installation doesn't accept per_page=0, ask for one result instead
+    if data.get('status') != 'OK':
+        response = client.get(url, params=dict(params, per_page=1))
         data = response.json()
 
-        for item in data['data']:
-            if item['type'] == 'dataverse':
-                dataverseId = item['id']
-                dataverseIds.extend([dataverseId])
-
-    # Get the alias for each dataverse ID
-    dataverseAliases = []
-    for dataverseId in dataverseIds:
-        dataverseInfoEndpoint = '%s/api/dataverses/%s' % (installationUrl, dataverseId)
-        response = requests.get(
-            dataverseInfoEndpoint,
-            headers=header)
+    facetCounts = {}
+    for facetGroup in data['data'].get('facets', []):
+        for facetName, facet in facetGroup.items():
+            facetCounts[facetName] = {}
+            for labelCount in facet.get('labels', []):
+                facetCounts[facetName].update(labelCount)
+
+    return data['data']['total_count'], facetCounts
+
+
+# Function for getting the total count of a Search API query without getting any of its results
+def get_search_api_total_count(url, params, client):
+    response = client.get(url, params=dict(params, per_page=0))
+    data = response.json()
+
+    # If the installation doesn't accept per_page=0, ask for one result instead
+    if data.get('status') != 'OK':
+        response = client.get(url, params=dict(params, per_page=1))
         data = response.json()
-        alias = data['data']['alias']
-        dataverseAliases.append(alias)
 
-    return dataverseAliases
+    return data['data']['total_count']
+
+
+# Function for estimating how many datasets a collection or search URL matches from the total count and the
+# publicationStatus facet of one Search API query, without paging through the datasets. Collections with more than
+# searchApiCountMaxOwnerAliases subcollections are counted with one query for each set of that many collections.
+# Returns a dict with the number of dataset versions the Search API lists (datasetCount), how many are deaccessioned
+# (deaccessionedDatasetCount) and are drafts of published datasets (draftVersionCount), and the estimated number of
+# unique datasets (uniqueDatasetCount), which doesn't count drafts of published datasets, since they're listed along
+# with the published versions, or deaccessioned versions if ignoreDeaccessionedDatasets is True.
+# Drafts of published datasets are counted as the Draft versions minus the Unpublished ones, since the only version
+# of a dataset that's never been published is a draft. The Search API returns the publicationStatus facet only to
+# logged-in users, who are the only ones who can see drafts and deaccessioned versions, so without an API key
+# those counts are 0
+def get_dataset_count_estimates(url, apiKey='', ignoreDeaccessionedDatasets=False, subdataverses=False):
+    searchApiUrl = get_search_api_url(url)
+    requestsGetProperties = get_params(searchApiUrl)
+    baseUrl = requestsGetProperties['baseUrl']
+    params = dict(requestsGetProperties['params'], type='dataset')
+    client = get_installation_client(baseUrl, apiKey)
+
+    # Get the aliases of the collections whose datasets are counted, the same way that
+    # get_datasets_from_collection_or_search_url gets the aliases of the collections whose datasets are kept
+    ownerAliases = None
+    if 'q=' not in url:
+        if subdataverses == True and is_root_collection(url) == False:
+            ownerAliases = get_all_subcollection_aliases(url, apiKey=apiKey)
+        elif subdataverses == False:
+            ownerAliases = [get_alias_from_collection_url(url)]
+
+    ownerFilters = [None]
+    if ownerAliases is not None:
+        ownerFilters = [
+            'identifierOfDataverse:(%s)' % (' OR '.join(
+                '"%s"' % (alias) for alias in ownerAliases[i:i + searchApiCountMaxOwnerAliases]))
+            for i in range(0, len(ownerAliases), searchApiCountMaxOwnerAliases)]
+
+    def get_counts(ownerFilter):
+        fq = list(params.get('fq', []))
+        if ownerFilter is not None:
+            fq.append(ownerFilter)
+        return get_search_api_total_count_and_facets(baseUrl, dict(params, fq=fq), client)
+
+    datasetCounts = dict.fromkeys(['datasetCount', 'deaccessionedDatasetCount', 'draftVersionCount'], 0)
+    with ThreadPoolExecutor(max_workers=searchApiCountWorkerCount) as executor:
+        for totalCount, facetCounts in executor.map(get_counts, ownerFilters):
+            publicationStatusCounts = facetCounts.get('publicationStatus', {})
+            datasetCounts['datasetCount'] += totalCount
+            datasetCounts['deaccessionedDatasetCount'] += publicationStatusCounts.get('Deaccessioned', 0)
+            datasetCounts['draftVersionCount'] += max(
+                publicationStatusCounts.get('Draft', 0) - publicationStatusCounts.get('Unpublished', 0), 0)
+
+    uniqueDatasetCount = datasetCounts['datasetCount'] - datasetCounts['draftVersionCount']
+    if ignoreDeaccessionedDatasets == True:
+        uniqueDatasetCount -= datasetCounts['deaccessionedDatasetCount']
+    datasetCounts['uniqueDatasetCount'] = max(uniqueDatasetCount, 0)
+
+    return datasetCounts
 
 
 def get_canonical_pid(pidOrUrl):
@@ -638,87 +2340,105 @@ def get_canonical_pid(pidOrUrl):
     return canonicalPid
 
 
+# Lists the PIDs of the datasets in a collection or search URL and returns how many were found. If countOnly is True,
+# only the number of datasets is found, estimated from Search API counts unless exactCount is True
 def get_datasets_from_collection_or_search_url(
     url, rootWindow=None, progressLabel=None, progressText=None, textBoxCollectionDatasetPIDs=None, 
-    apiKey='', ignoreDeaccessionedDatasets=False, subdataverses=False):
+    apiKey='', ignoreDeaccessionedDatasets=False, subdataverses=False, countOnly=False, exactCount=False):
 
 
     if textBoxCollectionDatasetPIDs is not None:
     # if None not in [rootWindow, progressLabel, progressText, textBoxCollectionDatasetPIDs]:
     # Hide the textBoxCollectionDatasetPIDs scrollbox if it exists
         forget_widget(textBoxCollectionDatasetPIDs)
-    
+
+    # If only the number of datasets is wanted, don't list the dataset PIDs
+    if countOnly == True:
+        textBoxCollectionDatasetPIDs = None
+
+    if None not in [rootWindow, progressText, progressLabel]:
+        text = 'Looking for datasets...'
+        progressText.set(text)
+        progressLabel.config(fg='green')
+        progressLabel.grid(sticky='w', row=0)
+        rootWindow.update_idletasks()
+
+    # If only the number of datasets is wanted and it doesn't have to be exact, estimate it from Search API counts
+    # instead of paging through every dataset
+    if countOnly == True and exactCount == False:
+        datasetCounts = get_dataset_count_estimates(
+            url, apiKey=apiKey, ignoreDeaccessionedDatasets=ignoreDeaccessionedDatasets, subdataverses=subdataverses)
+
+        text = 'Datasets found: about %s' % (datasetCounts['uniqueDatasetCount'])
+        if ignoreDeaccessionedDatasets == True and datasetCounts['deaccessionedDatasetCount'] > 0:
+            text = text + '\rDeaccessioned datasets ignored: about %s' % (datasetCounts['deaccessionedDatasetCount'])
+
+        if progressText is not None:
+            progressText.set(text)
+        else:
+            print(text)
+
+        return datasetCounts['uniqueDatasetCount']
+
+    # Check if url is collection url. If so, get the aliases of the collections whose datasets should be kept
+    ownerAliases = None
+    if 'q=' not in url:
+        # If the user wants datasets in all subdataverses and the url
+        # is the root collection, don't filter the datasets
+        if subdataverses == True and is_root_collection(url) == True:
+            ownerAliases = None
+
+        # If the user wants datasets in all subdataverses and the url
+        # is not the root collection, get the aliases of all subdataverses.
+        # Datasets that aren't owned by any of the subdataverses will be removed.
+        # This will exclude linked datasets
+        elif subdataverses == True and is_root_collection(url) == False:
+            ownerAliases = set(get_all_subcollection_aliases(url, apiKey=apiKey))
+
+        # If the user wants only datasets in the collection, and not in collections within the collection,
+        # get the alias of the collection (including the alias of the root collection)
+        # to retain only datasets owned by that collection
+        elif subdataverses == False:
+            ownerAlias = get_alias_from_collection_url(url)
+            ownerAliases = {ownerAlias}
+
     # Use the Search API to get dataset info from the given search url or Dataverse collection URL
     searchApiUrl = get_search_api_url(url)
     requestsGetProperties = get_params(searchApiUrl)
     baseUrl = requestsGetProperties['baseUrl']
     params = requestsGetProperties['params']
-    datasetInfoDF = get_object_dataframe_from_search_api(
-        url=baseUrl, rootWindow=rootWindow, progressLabel=progressLabel, progressText=progressText,
-        params=params, objectType='dataset', apiKey=apiKey)
-    datasetCount = len(datasetInfoDF.index)
+    misindexedDatasetOffsets = []
+    deaccessionedDatasetCount = 0
+
+    # If only the datasets owned by the collection are wanted, filter them on the installation's side instead of
+    # getting every dataset in the collection's subtree
+    queryPlan = {'source': 'search', 'params': params}
+    if 'q=' not in url and subdataverses == False:
+        queryPlan = get_owned_datasets_query_plan(
+            baseUrl, params, ownerAlias, ignoreDeaccessionedDatasets=ignoreDeaccessionedDatasets, apiKey=apiKey)
+        deaccessionedDatasetCount = queryPlan['deaccessionedDatasetCount']
+
+    if queryPlan['source'] == 'contents':
+        datasetRows = get_dataset_rows_from_collection_contents(
+            get_installation_url(url), ownerAlias, apiKey=apiKey)
+    else:
+        datasetRows = get_object_rows_from_search_api(
+            url=baseUrl, params=queryPlan['params'], objectType='dataset', apiKey=apiKey,
+            misindexedObjectOffsets=misindexedDatasetOffsets)
 
-    if datasetCount == 0:
-        text = 'Datasets found: 0'
+    datasetCount = 0
+    uniqueDatasetCount = 0
 
-        if progressText is not None:
-            progressText.set(text)
-        else:
-            print(text)
-    
-    elif datasetCount > 0:
+    # Save the PID and owning collection alias of each dataset that's been kept, since Search API results list
+    # a dataset's published and draft versions
+    keptDatasets = set()
 
-        deaccessionedDatasetCount = 0
-        
-        # To ignore deaccessioned datasets, remove from the dataframe all datasets where version_state is DEACCESSIONED 
-        if ignoreDeaccessionedDatasets == True:
-            datasetInfoDF = datasetInfoDF[datasetInfoDF['version_state'].str.contains('DEACCESSIONED') == False]
-            deaccessionedDatasetCount = datasetCount - len(datasetInfoDF.index)
-
-        # Remove version_state column so that I can remove the dataframe's duplicate rows and there's only one row per dataset
-        datasetInfoDF = datasetInfoDF.drop('version_state', axis=1)
-
-        # Drop duplicate rows, which happens when Search API results lists a dataset's published and draft versions
-        datasetInfoDF = datasetInfoDF.drop_duplicates()
-
-        # Recount datasets
-        uniqueDatasetCount = len(datasetInfoDF.index)
-
-        # Check if url is collection url. If so:
-        if 'q=' not in url:
-            # If the user wants datasets in all subdataverses and the url
-            # is the root collection, don't filter the dataframe
-            if subdataverses == True and is_root_collection(url) == True:
-                uniqueDatasetCount = len(datasetInfoDF)
-
-            # If the user wants datasets in all subdataverses and the url
-            # is not the root collection...
-            elif subdataverses == True and is_root_collection(url) == False:
-                # Get the aliases of all subdataverses...
-                dataverseAliases = get_all_subcollection_aliases(url, apiKey=apiKey)
-
-                # Remove any datasets that aren't owned by any of the 
-                # subdataverses. This will exclude linked datasets
-                datasetInfoDF = datasetInfoDF[
-                    datasetInfoDF['dataverse_alias'].isin(dataverseAliases)]
-
-                uniqueDatasetCount = len(datasetInfoDF)
-
-            # If the user wants only datasets in the collection,
-            # and not in collections within the collection...
-            elif subdataverses == False:
-                # Get the alias of the collection (including the alias of the root collection)
-                alias = get_alias_from_collection_url(url)
-                # Retain only datasets owned by that collection
-                datasetInfoDF = datasetInfoDF[datasetInfoDF['dataverse_alias'].isin([alias])]
-
-                uniqueDatasetCount = len(datasetInfoDF)
-
-        # If the url is a search URL, get all datasetPids from datasetInfoDF 
-        elif 'q=' in url:
-            uniqueDatasetCount = len(datasetInfoDF)
+    # Filter and de-duplicate each dataset row as it arrives from the Search API
+    # and insert the dataset PIDs into the textBoxCollectionDatasetPIDs scrollbox
+    for datasetRow in datasetRows:
+        datasetCount += 1
 
-        if textBoxCollectionDatasetPIDs is not None:
+        if datasetCount == 1 and textBoxCollectionDatasetPIDs is not None:
             # Place textbox with list of dataset PIDs and set state to read/write (normal) 
             textBoxCollectionDatasetPIDs.grid(sticky='w', row=2, pady=5)
             textBoxCollectionDatasetPIDs.configure(state ='normal')
@@ -726,21 +2446,51 @@ def get_datasets_from_collection_or_search_url(
             # Clear whatever's in the textBoxCollectionDatasetPIDs textbox
             textBoxCollectionDatasetPIDs.delete('1.0', END)
 
-            # Insert the dataset PIDs into the textBoxCollectionDatasetPIDs scrollbox
-            for dfIndex, dfRow in datasetInfoDF.iterrows():
-                datasetPid = dfRow['dataset_pid'] + '\n'
-                textBoxCollectionDatasetPIDs.insert('end', datasetPid)
+        # To ignore deaccessioned datasets, skip all datasets where version_state is DEACCESSIONED 
+        if ignoreDeaccessionedDatasets == True and 'DEACCESSIONED' in datasetRow['version_state']:
+            deaccessionedDatasetCount += 1
+            continue
 
-        # Create and place result text with uniqueDatasetCount
-        if deaccessionedDatasetCount == 0:
-            text = 'Datasets found: %s' % (str(uniqueDatasetCount))
-        if deaccessionedDatasetCount > 0:
-            text = 'Datasets found: %s\rDeaccessioned datasets ignored: %s' % (str(uniqueDatasetCount), str(deaccessionedDatasetCount))
+        # Skip duplicate rows and datasets not owned by the collections the user wants
+        datasetKey = (datasetRow['dataset_pid'], datasetRow['dataverse_alias'])
+        if datasetKey in keptDatasets:
+            continue
+        if ownerAliases is not None and datasetRow['dataverse_alias'] not in ownerAliases:
+            continue
+        keptDatasets.add(datasetKey)
+        uniqueDatasetCount += 1
 
-        if progressText is not None:
-            progressText.set(text)
-        else:
-            print(text)
+        if textBoxCollectionDatasetPIDs is not None:
+            datasetPid = datasetRow['dataset_pid'] + '\n'
+            textBoxCollectionDatasetPIDs.insert('end', datasetPid)
+
+        # Show progress every 1000 datasets
+        if uniqueDatasetCount % 1000 == 0 and None not in [rootWindow, progressText]:
+            progressText.set('Looking for datasets... %s found so far' % (uniqueDatasetCount))
+            rootWindow.update_idletasks()
+
+    # Create text about any datasets that the Search API couldn't return because they're misindexed
+    if misindexedDatasetOffsets:
+        misindexedDatasetsText = '\rDatasets not retrieved due to misindexing: %s (Search API start offsets: %s)' % (
+            len(misindexedDatasetOffsets), ', '.join(str(offset) for offset in misindexedDatasetOffsets))
+    else:
+        misindexedDatasetsText = ''
+
+    # Create and place result text with uniqueDatasetCount
+    if datasetCount == 0:
+        text = 'Datasets found: 0'
+    elif deaccessionedDatasetCount == 0:
+        text = 'Datasets found: %s' % (str(uniqueDatasetCount))
+    elif deaccessionedDatasetCount > 0:
+        text = 'Datasets found: %s\rDeaccessioned datasets ignored: %s' % (str(uniqueDatasetCount), str(deaccessionedDatasetCount))
+    text = text + misindexedDatasetsText
+
+    if progressText is not None:
+        progressText.set(text)
+    else:
+        print(text)
+
+    return uniqueDatasetCount
 
 
 def get_directory_path():
@@ -749,13 +2499,12 @@ def get_directory_path():
 
 
 def get_dataset_metadata_export(installationUrl, datasetPid, exportFormat, header={}, apiKey=''):
-    if apiKey:
-        header['X-Dataverse-key'] = apiKey
+    client = get_installation_client(installationUrl, apiKey)
 
     if exportFormat == 'dataverse_json':
         getJsonRepresentationOfADatasetEndpoint = '%s/api/datasets/:persistentId/?persistentId=%s' % (installationUrl, datasetPid)
         getJsonRepresentationOfADatasetEndpoint = getJsonRepresentationOfADatasetEndpoint.replace('//api', '/api')
-        response = requests.get(
+        response = client.get(
             getJsonRepresentationOfADatasetEndpoint,
             headers=header)
         if response.status_code in (200, 401): # 401 is the unauthorized code. Valid API key is needed
@@ -771,7 +2520,7 @@ def get_dataset_metadata_export(installationUrl, datasetPid, exportFormat, heade
         datasetMetadataExportEndpoint = '%s/api/datasets/export?exporter=%s&persistentId=%s' % (installationUrl, exportFormat, datasetPid)
         datasetMetadataExportEndpoint = datasetMetadataExportEndpoint.replace('//api', '/api')
        
-        response = requests.get(
+        response = client.get(
             datasetMetadataExportEndpoint,
             headers=header)
 
@@ -789,15 +2538,200 @@ def get_dataset_metadata_export(installationUrl, datasetPid, exportFormat, heade
         return data
 
 
+# Most API calls kept in flight at the same time to one installation when downloading metadata of many datasets
+defaultMetadataRequestConcurrency = 100
+
+
+# Coroutine that makes the API calls in requestList using aiohttp, keeping up to maxConcurrency calls in flight,
+# and passes each (key, data) to putResult as its response arrives. data is the response's JSON, or 'ERROR' if the
+# call failed or its response status isn't 200. putResult returns False when no more results are wanted, and once
+# stopEvent is set no more calls are made and the calls in flight are cancelled
+async def download_json_responses(requestList, headers, maxConcurrency, putResult, stopEvent, verify=True):
+    loop = asyncio.get_running_loop()
+    connector = aiohttp.TCPConnector(limit_per_host=maxConcurrency, ssl=None if verify else False)
+    timeout = aiohttp.ClientTimeout(sock_connect=defaultTimeout[0], sock_read=defaultTimeout[1])
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+        requestIterator = iter(requestList)
+
+        # Each worker takes the next API call from requestIterator until there are none left,
+        # makes the call when the host's rate governor allows it, and retries the call like installationClient does
+        async def worker():
+            for key, url, params in requestIterator:
+                if stopEvent.is_set():
+                    return
+                governor = get_host_rate_governor(url)
+                circuitBreaker = get_host_circuit_breaker(url)
+
+                for attempt in range(retryMaxAttempts):
+                    try:
+                        circuitBreaker.check()
+                    except circuitOpenError:
+                        data = 'ERROR'
+                        break
+                    while not governor.try_acquire():
+                        await asyncio.sleep(governor.get_wait_time())
+
+                    startTime = time.time()
+                    statusCode = None
+                    retryAfter = None
+                    try:
+                        async with session.get(url, params=params) as response:
+                            statusCode = response.status
+                            retryAfter = response.headers.get('Retry-After')
+                            if statusCode == 200:
+                                data = await response.json(content_type=None)
+                            else:
+                                data = 'ERROR'
+                    except Exception:
+                        data = 'ERROR'
+                    governor.release(time.time() - startTime, statusCode=statusCode, retryAfter=retryAfter)
+                    circuitBreaker.record(statusCode)
+
+                    isRetryable = statusCode is None or is_retryable('GET', statusCode=statusCode)
+                    if attempt + 1 >= retryMaxAttempts or not isRetryable:
+                        break
+                    data = 'ERROR'
+                    await asyncio.sleep(get_retry_wait_time(attempt, retryAfter))
+
+                # Pass the result to putResult in another thread, so that the event loop keeps running
+                # while putResult waits for the results before it to be used
+                if not await loop.run_in_executor(None, putResult, (key, data)):
+                    return
+
+        workers = [asyncio.ensure_future(worker()) for i in range(maxConcurrency)]
+
+        # Cancel the workers, and the calls they have in flight, as soon as no more results are wanted
+        async def cancel_workers_when_stopped():
+            while not stopEvent.is_set():
+                await asyncio.sleep(0.1)
+            for workerTask in workers:
+                workerTask.cancel()
+
+        stopWatcher = asyncio.ensure_future(cancel_workers_when_stopped())
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            if not stopEvent.is_set():
+                raise
+        finally:
+            stopWatcher.cancel()
+
+            # If a worker failed, e.g. because requestList raised an exception, stop the other workers too
+            for workerTask in workers:
+                workerTask.cancel()
+            await asyncio.gather(*workers, stopWatcher, return_exceptions=True)
+
+
+# Function that makes the API calls in requestList, an iterable of (key, url, params), to an installation and yields
+# each (key, data) as its response arrives, where data is the response's JSON, or 'ERROR' if the call failed or its
+# response status isn't 200. Up to maxConcurrency calls are kept in flight, using aiohttp in an event loop in another
+# thread, or if aiohttp isn't installed, using a pool of threads that share the installation's client. Errors that
+# stop all calls, like an exception raised by requestList, are raised here. If the results stop being used,
+# e.g. because the generator is closed, no more calls are made
+def get_json_responses(installationUrl, requestList, apiKey='', maxConcurrency=defaultMetadataRequestConcurrency):
+    client = get_installation_client(installationUrl, apiKey)
+
+    if aiohttp is None:
+        def get_json_response(request):
+            key, url, params = request
+            try:
+                response = client.get(url, params=params)
+                if response.status_code == 200:
+                    data = response.json()
+                else:
+                    data = 'ERROR'
+            except Exception:
+                data = 'ERROR'
+            return key, data
+
+        workerCount = min(maxConcurrency, 20)
+        with ThreadPoolExecutor(max_workers=workerCount) as executor:
+            pendingRequests = set()
+            for request in requestList:
+                pendingRequests.add(executor.submit(get_json_response, request))
+                if len(pendingRequests) >= workerCount * 2:
+                    doneRequests, pendingRequests = wait(pendingRequests, return_when=FIRST_COMPLETED)
+                    for doneRequest in doneRequests:
+                        yield doneRequest.result()
+            for doneRequest in as_completed(pendingRequests):
+                yield doneRequest.result()
+        return
+
+    # Results are handed from the event loop's thread to this generator through a queue. The queue is
+    # bounded so that downloaded metadata doesn't pile up in memory when results are used slower than they arrive
+    resultQueue = queue.Queue(maxsize=maxConcurrency * 2)
+    stopEvent = threading.Event()
+    endOfResults = object()
+
+    # Returns True if the result was put in the queue, or False if no more results are wanted
+    def put_result(result):
+        while not stopEvent.is_set():
+            try:
+                resultQueue.put(result, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # Any exception that stops the event loop is put in the queue, so that it's raised in this generator
+    def run_event_loop():
+        try:
+            asyncio.run(download_json_responses(
+                requestList, dict(client.session.headers), maxConcurrency, put_result, stopEvent,
+                verify=client.session.verify))
+        except Exception as e:
+            put_result(e)
+        finally:
+            put_result(endOfResults)
+
+    eventLoopThread = threading.Thread(target=run_event_loop, daemon=True)
+    eventLoopThread.start()
+
+    try:
+        while True:
+            result = resultQueue.get()
+            if result is endOfResults:
+                break
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        stopEvent.set()
+
+
+# Function that yields (datasetPid, datasetMetadata) for each dataset in datasetPidList as the Dataverse JSON
+# metadata of the dataset's latest version arrives. datasetMetadata is 'ERROR' if the metadata couldn't be downloaded
+def get_dataset_metadata_exports(installationUrl, datasetPidList, apiKey='', maxConcurrency=defaultMetadataRequestConcurrency):
+    getJsonRepresentationOfADatasetEndpoint = '%s/api/datasets/:persistentId/' % (installationUrl)
+    getJsonRepresentationOfADatasetEndpoint = getJsonRepresentationOfADatasetEndpoint.replace('//api', '/api')
+
+    requestList = (
+        (datasetPid, getJsonRepresentationOfADatasetEndpoint, {'persistentId': datasetPid})
+        for datasetPid in datasetPidList)
+
+    return get_json_responses(installationUrl, requestList, apiKey=apiKey, maxConcurrency=maxConcurrency)
+
+
 def get_metadatablock_data(installationUrl, metadatablockName):
     metadatablocksApiEndpoint = '%s/api/v1/metadatablocks/%s' % (installationUrl, metadatablockName)
 
-    response = requests.get(metadatablocksApiEndpoint)
+    response = get_installation_client(installationUrl).get(metadatablocksApiEndpoint)
     if response.status_code == 200:
         data = response.json()
         return data
 
 
+# Get the names of all metadatablocks enabled in an installation
+def get_metadatablock_names(installationUrl):
+    metadatablocksApiEndpoint = '%s/api/v1/metadatablocks' % (installationUrl)
+
+    response = get_installation_client(installationUrl).get(metadatablocksApiEndpoint)
+    data = response.json()
+
+    return [metadatablock['name'] for metadatablock in data['data']]
+
+
 def get_metadatablock_db_field_name_and_title(metadatablockData):
     # Get the database names of all fields
     allFieldsDBNamesList = []
@@ -905,13 +2839,37 @@ def get_column_names(
         return columns
 
 
-def get_metadata_values_lists(
-    installationUrl, datasetMetadata, metadatablockName,
-    chosenTitleDBName, chosenFields=None, versions='latestVersion'):
+# Function for compiling a plan for getting the values of chosen parent fields from the metadata of datasets, so that
+# the metadatablock's fields are looked through once instead of for each dataset. Returns a dict whose keys are the
+# database names (typeNames) of the chosen fields, in the order they were chosen, and whose values are dicts of
+# each field's title and the names of the columns its values are put in, in order: its child fields if it's a
+# compound field or its own database name if it isn't
+def get_field_extraction_plan(metadatablockData, parentFieldTitleList, parentFieldDBNameAndTitleDict):
+    metadatablockFields = metadatablockData['data']['fields']
+    extractionPlan = {}
+
+    for parentFieldTitle in parentFieldTitleList:
+        if parentFieldTitle in parentFieldDBNameAndTitleDict:
+            dbName = parentFieldDBNameAndTitleDict[parentFieldTitle]
+            properties = metadatablockFields[dbName]
+            if 'childFields' in properties:
+                columns = list(properties['childFields'])
+            else:
+                columns = [dbName]
+            extractionPlan[dbName] = {'title': parentFieldTitle, 'columns': columns}
+
+    return extractionPlan
+
+
+# Function for getting the rows of values of every field in an extraction plan from a dataset's metadata, in one pass
+# through the dataset's fields. Returns a dict of each field's typeName and its list of rows, which is empty if the
+# dataset has no values for the field
+def get_metadata_values_lists_from_plan(
+    installationUrl, datasetMetadata, metadatablockName, extractionPlan, versions='latestVersion'):
 
     if versions == 'allVersions':
         versions = 'datasetVersion'
-    rowVariablesList = []
+    rowVariablesListsByField = {typeName: [] for typeName in extractionPlan}
 
     if (datasetMetadata['status'] == 'OK') and\
         (metadatablockName in datasetMetadata['data'][versions]['metadataBlocks']):
@@ -927,75 +2885,128 @@ def get_metadata_values_lists(
         else:
             datasetVersionNumber = 'DRAFT'
 
+        datasetVariables = [datasetPid, datasetPersistentUrl, datasetUrl, datasetVersionNumber]
+
         for fields in datasetMetadata['data'][versions]['metadataBlocks'][metadatablockName]['fields']:
-            if fields['typeName'] == chosenTitleDBName:
+            fieldPlan = extractionPlan.get(fields['typeName'])
+            if fieldPlan is None:
+                continue
+
+            rowVariablesList = rowVariablesListsByField[fields['typeName']]
+            chosenFields = fieldPlan['columns']
+
+            # Save the field's typeClass and if it allows multiple values 
+            typeClass = fields['typeClass']
+            allowsMultiple = fields['multiple']
+
+            if typeClass in ('primitive', 'controlledVocabulary') and allowsMultiple is True:
+                for value in fields['value']:
+                    rowVariablesList.append(datasetVariables + [value[:10000].replace('\r', ' - ')])
+
+            elif typeClass in ('primitive', 'controlledVocabulary') and allowsMultiple is False:
+                value = fields['value'][:10000].replace('\r', ' - ')
+                rowVariablesList.append(datasetVariables + [value])
+
+            # For compound fields, add the value of each child field, or an empty string if the child field has no value
+            elif typeClass == 'compound':
+                if allowsMultiple is True:
+                    compoundValues = fields['value']
+                else:
+                    compoundValues = [fields['value']]
+
+                for compoundValue in compoundValues:
+                    rowVariables = list(datasetVariables)
+                    for chosenField in chosenFields:
+                        try:
+                            value = compoundValue[chosenField]['value'][:10000].replace('\r', ' - ')
+                        except KeyError:
+                            value = ''
+                        rowVariables.append(value)
+                    rowVariablesList.append(rowVariables)
 
-                # Save the field's typeClass and if it allows multiple values 
-                typeClass = fields['typeClass']
-                allowsMultiple = fields['multiple']
+    return rowVariablesListsByField
 
-                if typeClass in ('primitive', 'controlledVocabulary') and allowsMultiple is True:
-                    for value in fields['value']:
-                        rowVariables = [
-                            datasetPid, datasetPersistentUrl, datasetUrl,
-                            datasetVersionNumber, value[:10000].replace('\r', ' - ')]
-                        rowVariablesList.append(rowVariables)
 
-                elif typeClass in ('primitive', 'controlledVocabulary') and allowsMultiple is False:
-                    value = fields['value'][:10000].replace('\r', ' - ')
-                    rowVariables = [
-                        datasetPid, datasetPersistentUrl, datasetUrl, 
-                        datasetVersionNumber, value]
+# Function for getting the rows of values of one field from a dataset's metadata
+def get_metadata_values_lists(
+    installationUrl, datasetMetadata, metadatablockName,
+    chosenTitleDBName, chosenFields=None, versions='latestVersion'):
 
-                    rowVariablesList.append(rowVariables)
+    extractionPlan = {chosenTitleDBName: {'title': chosenTitleDBName, 'columns': chosenFields or [chosenTitleDBName]}}
+    rowVariablesListsByField = get_metadata_values_lists_from_plan(
+        installationUrl, datasetMetadata, metadatablockName, extractionPlan, versions=versions)
 
-                elif typeClass == 'compound' and allowsMultiple is True:          
-                    
-                    index = 0
-                    condition = True
+    return rowVariablesListsByField[chosenTitleDBName]
 
-                    while condition:
-                        rowVariables = [
-                            datasetPid, datasetPersistentUrl, datasetUrl, 
-                            datasetVersionNumber]
 
-                        # Get number of multiples
-                        total = len(fields['value'])
+# Class for writing rows to many CSV files at once, e.g. one for each metadata field, that keeps each file open until
+# the sink is closed instead of opening the file for every row. Rows are flushed to the files after flushRowCount rows
+# or flushInterval seconds, whichever comes first, and the number of rows written to each file, not counting its
+# header row, is kept in rowCounts
+class csvFileSink(object):
 
-                        # For each child field...
-                        for chosenField in chosenFields:
-                            # Try getting the value of that child field
-                            try:
-                                value = fields['value'][index][chosenField]['value'][:10000].replace('\r', ' - ')
-                            # Otherwise, save an empty string as the value
-                            except KeyError:
-                                value = ''
-                            # Append value to the rowVariables list to add to the CSV file
-                            rowVariables.append(value)
+    def __init__(self, flushRowCount=10000, flushInterval=5):
+        self.flushRowCount = flushRowCount
+        self.flushInterval = flushInterval
+        self.files = {}
+        self.writers = {}
+        self.rowCounts = {}
+        self.unflushedRowCount = 0
+        self.lastFlushTime = time.time()
 
-                        rowVariablesList.append(rowVariables)
+    def __enter__(self):
+        return self
 
-                        index += 1
-                        condition = index < total
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        self.close()
 
-                elif typeClass == 'compound' and allowsMultiple is False:
-                    rowVariables = [datasetPid, datasetPersistentUrl, datasetUrl, datasetVersionNumber]
+    # Creates a CSV file, or replaces an existing one, and writes its header row
+    def open_file(self, filePath, headerRow):
+        self.files[filePath] = open(filePath, mode='w', newline='', encoding='utf-8')
+        self.writers[filePath] = csv.writer(
+            self.files[filePath], delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        self.writers[filePath].writerow(headerRow)
+        self.rowCounts[filePath] = 0
 
-                    for chosenField in chosenFields:
-                        try:
-                            # Get value from compound field
-                            value = fields['value'][chosenField]['value'][:10000].replace('\r', ' - ')
-                        except KeyError:
-                            value = ''
-                        rowVariables.append(value)
-                    rowVariablesList.append(rowVariables)
+    def writerows(self, filePath, rows):
+        rowCount = len(rows)
+        self.writers[filePath].writerows(rows)
+        self.rowCounts[filePath] += rowCount
+
+        self.unflushedRowCount += rowCount
+        if self.unflushedRowCount >= self.flushRowCount or time.time() - self.lastFlushTime >= self.flushInterval:
+            self.flush()
+
+    def writerow(self, filePath, row):
+        self.writerows(filePath, [row])
 
-    return rowVariablesList
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+        self.unflushedRowCount = 0
+        self.lastFlushTime = time.time()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.writers = {}
 
 
 # Delete empty CSV files in a given directory. If file has fewer than 2 rows, delete it.
-def delete_empty_csv_files(csvDirectory):
+# If a dict of the number of rows written to each file (not counting header rows) is given,
+# such as the rowCounts of a csvFileSink, the files aren't read to count their rows
+def delete_empty_csv_files(csvDirectory, rowCounts=None):
     fieldsWithNoMetadata = []
+
+    if rowCounts is not None:
+        for file, rowCount in rowCounts.items():
+            if rowCount == 0:
+                fieldName = Path(file).name.replace('.csv', '')
+                fieldsWithNoMetadata.append(fieldName)
+                os.remove(file)
+        return fieldsWithNoMetadata
+
     for file in glob.glob(str(Path(csvDirectory)) + '/' + '*.csv'):
         with open(file, mode='r', encoding='utf-8') as f:
             reader = csv.reader(f, delimiter=',')
@@ -1009,8 +3020,269 @@ def delete_empty_csv_files(csvDirectory):
     return fieldsWithNoMetadata
 
 
+# CSV files that add up to more than inMemoryJoinMaxFileSize bytes are joined out of core: each file is sorted by
+# the key columns in chunks of externalSortChunkRowCount rows that are written to temporary files, the chunks are
+# merged at most externalSortMaxMergeFileCount at a time, and the sorted files are merge joined row by row
+inMemoryJoinMaxFileSize = 1024 ** 3
+externalSortChunkRowCount = 200000
+externalSortMaxMergeFileCount = 64
+
+# Metadata values like long descriptions can be bigger than the csv module's default field size limit
+csv.field_size_limit(2 ** 31 - 1)
+
+
+# Full outer join CSV files on the given key columns and write the joined rows to joinedFilePath, in memory or, if
+# outOfCore is True or the files are bigger than inMemoryJoinMaxFileSize, out of core. Both ways write the same
+# rows in the same order. If maxRows is given, only the first maxRows joined rows are written
+def join_csv_files_on_key(csvFilePaths, keyColumns, joinedFilePath, maxRows=None, outOfCore=None):
+    if outOfCore is None:
+        fileSize = sum(os.path.getsize(csvFilePath) for csvFilePath in csvFilePaths)
+        outOfCore = fileSize > inMemoryJoinMaxFileSize
+
+    if outOfCore:
+        return join_csv_files_out_of_core(csvFilePaths, keyColumns, joinedFilePath, maxRows=maxRows)
+    return join_csv_files_in_memory(csvFilePaths, keyColumns, joinedFilePath, maxRows=maxRows)
+
+
+# Full outer join CSV files on the given key columns in one multi-way join and write the joined rows to joinedFilePath.
+# Rows are matched like pandas' outer join: rows with the same key in different files are combined in every
+# possible pairing, and files without a row for a key get empty cells. Instead of joining the files pairwise,
+# every distinct key gets one integer code, the files' rows are sorted by that code, and the rows of the joined
+# file are picked from each file by position, so memory grows with the size of the files and the joined file
+# but not with the number of files. If maxRows is given, only the first maxRows joined rows are written
+def join_csv_files_in_memory(csvFilePaths, keyColumns, joinedFilePath, maxRows=None):
+
+    # Read every cell as text so that values like version numbers are written as they were read
+    dataframes = [pd.read_csv(csvFilePath, sep=',', dtype=str, na_filter=False) for csvFilePath in csvFilePaths]
+
+    valueColumns = []
+    for dataframe in dataframes:
+        for column in dataframe.columns:
+            if column not in keyColumns:
+                if column in valueColumns:
+                    raise ValueError('columns overlap: %s' % (column))
+                valueColumns.append(column)
+
+    # Give each distinct key one code, numbered in the sort order of the keys
+    keys = pd.concat([dataframe[keyColumns] for dataframe in dataframes], ignore_index=True)
+    keyGroups = keys.groupby(keyColumns, sort=True)
+    keyCodes = keyGroups.ngroup().to_numpy()
+    uniqueKeys = keyGroups.size().reset_index()[keyColumns]
+    keyCount = len(uniqueKeys)
+
+    # For each file, get the positions of its rows sorted by key code, and where each key's rows start and how
+    # many there are
+    fileRowOrders = []
+    fileKeyStarts = []
+    fileKeyRowCounts = []
+    offset = 0
+    for dataframe in dataframes:
+        codes = keyCodes[offset:offset + len(dataframe)]
+        offset += len(dataframe)
+        rowCounts = np.bincount(codes, minlength=keyCount)
+        fileRowOrders.append(np.argsort(codes, kind='stable'))
+        fileKeyStarts.append(np.cumsum(rowCounts) - rowCounts)
+        fileKeyRowCounts.append(rowCounts)
+
+    # Each key has as many joined rows as the product of its row counts in the files, counting a file without
+    # the key as one empty row
+    pairingCounts = [np.maximum(rowCounts, 1) for rowCounts in fileKeyRowCounts]
+    joinedRowCounts = np.ones(keyCount, dtype=np.int64)
+    for counts in pairingCounts:
+        joinedRowCounts *= counts
+
+    if maxRows is not None:
+        cumulativeRowCounts = np.cumsum(joinedRowCounts)
+        keyCount = int(np.searchsorted(cumulativeRowCounts, maxRows)) + 1
+        keyCount = min(keyCount, len(joinedRowCounts))
+        joinedRowCounts = joinedRowCounts[:keyCount]
+
+    joinedKeyCodes = np.repeat(np.arange(keyCount), joinedRowCounts)
+    positionsInKey = np.arange(len(joinedKeyCodes)) - np.repeat(np.cumsum(joinedRowCounts) - joinedRowCounts, joinedRowCounts)
+    if maxRows is not None:
+        joinedKeyCodes = joinedKeyCodes[:maxRows]
+        positionsInKey = positionsInKey[:maxRows]
+
+    joinedColumns = {}
+    for keyColumn in keyColumns:
+        joinedColumns[keyColumn] = uniqueKeys[keyColumn].to_numpy(dtype=object)[joinedKeyCodes]
+
+    # The first file's rows change slowest within a key, like in a chain of pairwise joins. A file's row for each
+    # joined row is found from the joined row's position within its key, written in mixed radix with one digit per file
+    stride = np.ones(len(joinedKeyCodes), dtype=np.int64)
+    fileRowPositions = [None] * len(dataframes)
+    for fileIndex in reversed(range(len(dataframes))):
+        counts = pairingCounts[fileIndex][joinedKeyCodes]
+        rowInKey = (positionsInKey // stride) % counts
+        stride *= counts
+
+        rowCounts = fileKeyRowCounts[fileIndex][joinedKeyCodes]
+        sortedPositions = np.minimum(fileKeyStarts[fileIndex][joinedKeyCodes] + rowInKey, max(len(dataframes[fileIndex]) - 1, 0))
+        rowPositions = fileRowOrders[fileIndex][sortedPositions] if len(dataframes[fileIndex]) else sortedPositions
+        fileRowPositions[fileIndex] = np.where(rowCounts > 0, rowPositions, -1)
+
+    for dataframe, rowPositions in zip(dataframes, fileRowPositions):
+        for column in dataframe.columns:
+            if column not in keyColumns:
+
+                # Add an empty value at the end of the column for joined rows that have no row in this file
+                values = np.append(dataframe[column].to_numpy(dtype=object), '')
+                joinedColumns[column] = values[rowPositions]
+
+    joined = pd.DataFrame(joinedColumns, columns=list(keyColumns) + valueColumns)
+    joined.to_csv(joinedFilePath, index=False)
+
+    return len(joined)
+
+
+# Function for getting the sort key of a CSV file's rows from the positions of the key columns in its header row
+def get_csv_row_key(headerRow, keyColumns, csvFilePath):
+    missingColumns = [keyColumn for keyColumn in keyColumns if keyColumn not in headerRow]
+    if missingColumns:
+        raise ValueError('%s are not in the columns of %s' % (missingColumns, csvFilePath))
+
+    keyGetter = itemgetter(*[headerRow.index(keyColumn) for keyColumn in keyColumns])
+    if len(keyColumns) == 1:
+        return lambda row: (keyGetter(row),)
+    return keyGetter
+
+
+# Function for reading the rows of an open CSV file, skipping blank lines like pandas does
+def read_csv_rows(csvFile):
+    return (row for row in csv.reader(csvFile) if row)
+
+
+# Function for merging CSV files whose rows are sorted by rowKey into one sorted file. Rows with the same key stay in
+# the order of the files they came from
+def merge_sorted_csv_files(sortedFilePaths, rowKey, mergedFilePath, headerRow=None):
+    sortedFiles = [open(sortedFilePath, mode='r', newline='', encoding='utf-8') for sortedFilePath in sortedFilePaths]
+    try:
+        with open(mergedFilePath, mode='w', newline='', encoding='utf-8') as mergedFile:
+            writer = csv.writer(mergedFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            if headerRow is not None:
+                writer.writerow(headerRow)
+            writer.writerows(heapq.merge(*[read_csv_rows(sortedFile) for sortedFile in sortedFiles], key=rowKey))
+    finally:
+        for sortedFile in sortedFiles:
+            sortedFile.close()
+
+
+# Function for sorting a CSV file by the given key columns without reading the whole file into memory. Chunks of
+# chunkRowCount rows are sorted and written to files in tempDirectory, which are then merged into sortedFilePath.
+# Rows with the same key stay in the order they're in in the file. Returns the file's header row
+def sort_csv_file_by_key(csvFilePath, keyColumns, sortedFilePath, tempDirectory, chunkRowCount=None):
+    if chunkRowCount is None:
+        chunkRowCount = externalSortChunkRowCount
+
+    chunkFileNumbers = counter()
+    chunkFilePaths = []
+    with open(csvFilePath, mode='r', newline='', encoding='utf-8') as csvFile:
+        reader = read_csv_rows(csvFile)
+        headerRow = next(reader, [])
+        rowKey = get_csv_row_key(headerRow, keyColumns, csvFilePath)
+
+        while True:
+            rows = list(islice(reader, chunkRowCount))
+            if not rows:
+                break
+            rows.sort(key=rowKey)
+
+            chunkFilePath = os.path.join(tempDirectory, '%s.csv' % (next(chunkFileNumbers)))
+            with open(chunkFilePath, mode='w', newline='', encoding='utf-8') as chunkFile:
+                csv.writer(chunkFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL).writerows(rows)
+            chunkFilePaths.append(chunkFilePath)
+            del rows
+
+    # Merge the chunks, in more than one round if there are too many to keep open at once
+    while len(chunkFilePaths) > externalSortMaxMergeFileCount:
+        mergedFilePaths = []
+        for start in range(0, len(chunkFilePaths), externalSortMaxMergeFileCount):
+            mergedFilePath = os.path.join(tempDirectory, '%s.csv' % (next(chunkFileNumbers)))
+            merge_sorted_csv_files(chunkFilePaths[start:start + externalSortMaxMergeFileCount], rowKey, mergedFilePath)
+            mergedFilePaths.append(mergedFilePath)
+        for chunkFilePath in chunkFilePaths:
+            os.remove(chunkFilePath)
+        chunkFilePaths = mergedFilePaths
+
+    merge_sorted_csv_files(chunkFilePaths, rowKey, sortedFilePath, headerRow=headerRow)
+    for chunkFilePath in chunkFilePaths:
+        os.remove(chunkFilePath)
+
+    return headerRow
+
+
+# Function for full outer joining CSV files that are sorted by the given key columns. The files are read at the same
+# time, one key at a time, and the joined rows of each key are written before the next key is read, so only the rows
+# of one key are kept in memory. Rows are matched and ordered like in join_csv_files_in_memory
+def merge_join_sorted_csv_files(sortedFilePaths, keyColumns, joinedFilePath, maxRows=None):
+    sortedFiles = [open(sortedFilePath, mode='r', newline='', encoding='utf-8') for sortedFilePath in sortedFilePaths]
+    try:
+        keyGroupIterators = []
+        valueColumnIndexes = []
+        valueColumns = []
+        for sortedFilePath, sortedFile in zip(sortedFilePaths, sortedFiles):
+            reader = read_csv_rows(sortedFile)
+            headerRow = next(reader, [])
+            keyGroupIterators.append(groupby(reader, key=get_csv_row_key(headerRow, keyColumns, sortedFilePath)))
+
+            columnIndexes = [index for index, column in enumerate(headerRow) if column not in keyColumns]
+            for index in columnIndexes:
+                if headerRow[index] in valueColumns:
+                    raise ValueError('columns overlap: %s' % (headerRow[index]))
+                valueColumns.append(headerRow[index])
+            valueColumnIndexes.append(columnIndexes)
+
+        emptyRows = [[[''] * len(columnIndexes)] for columnIndexes in valueColumnIndexes]
+        currentGroups = [next(keyGroupIterator, None) for keyGroupIterator in keyGroupIterators]
+
+        joinedRowCount = 0
+        with open(joinedFilePath, mode='w', newline='', encoding='utf-8') as joinedFile:
+            writer = csv.writer(joinedFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(list(keyColumns) + valueColumns)
+
+            while any(currentGroup is not None for currentGroup in currentGroups):
+                key = min(currentGroup[0] for currentGroup in currentGroups if currentGroup is not None)
+
+                # Get the rows of each file that have the key, or one empty row if a file has none
+                rowLists = []
+                for fileIndex, currentGroup in enumerate(currentGroups):
+                    if currentGroup is not None and currentGroup[0] == key:
+                        columnIndexes = valueColumnIndexes[fileIndex]
+                        rowLists.append([[row[index] for index in columnIndexes] for row in currentGroup[1]])
+                        currentGroups[fileIndex] = next(keyGroupIterators[fileIndex], None)
+                    else:
+                        rowLists.append(emptyRows[fileIndex])
+
+                for rows in product(*rowLists):
+                    if maxRows is not None and joinedRowCount >= maxRows:
+                        return joinedRowCount
+                    writer.writerow(list(key) + list(chain.from_iterable(rows)))
+                    joinedRowCount += 1
+
+        return joinedRowCount
+    finally:
+        for sortedFile in sortedFiles:
+            sortedFile.close()
+
+
+# Full outer join CSV files on the given key columns without reading them into memory, for files too big to join with
+# join_csv_files_in_memory. Each file is sorted by the key columns into a temporary directory next to joinedFilePath
+# and the sorted files are merge joined. If maxRows is given, only the first maxRows joined rows are written
+def join_csv_files_out_of_core(csvFilePaths, keyColumns, joinedFilePath, maxRows=None, chunkRowCount=None):
+    joinedFileDirectory = os.path.dirname(os.path.abspath(joinedFilePath))
+    with tempfile.TemporaryDirectory(dir=joinedFileDirectory) as tempDirectory:
+        sortedFilePaths = []
+        for fileIndex, csvFilePath in enumerate(csvFilePaths):
+            chunkDirectory = tempfile.mkdtemp(dir=tempDirectory)
+            sortedFilePath = os.path.join(tempDirectory, 'sorted_%s.csv' % (fileIndex))
+            sort_csv_file_by_key(csvFilePath, keyColumns, sortedFilePath, chunkDirectory, chunkRowCount=chunkRowCount)
+            sortedFilePaths.append(sortedFilePath)
+
+        return merge_join_sorted_csv_files(sortedFilePaths, keyColumns, joinedFilePath, maxRows=maxRows)
+
+
 # Full outer join of CSV files in a given directory
-def join_metadata_csv_files(csvDirectory):
+def join_metadata_csv_files(csvDirectory, maxRows=None, outOfCore=None):
 
     # Create CSV file in the directory that the user selected
     allMetadataFileName = os.path.join(csvDirectory, 'all_fields.csv')
@@ -1026,31 +3298,44 @@ def join_metadata_csv_files(csvDirectory):
             fileDirectoryPath = os.path.join(csvDirectory, file)
             filesDirectoryPathsList.append(fileDirectoryPath)
 
-        # Create a dataframe of each CSV file in the 'filesList' list
-        dataframes = [pd.read_csv(table, sep=',', na_filter = False) for table in filesDirectoryPathsList]
-
-        # For each dataframe, set the indexes (or the common columns across the dataframes to join on)
-        for dataframe in dataframes:
-            dataframe.set_index(indexList, inplace=True)
+        # Full outer join all CSV files on the common columns and export the joined rows to a CSV file
+        join_csv_files_on_key(
+            filesDirectoryPathsList, indexList, allMetadataFileName, maxRows=maxRows, outOfCore=outOfCore)
 
-        # Full outer join all dataframes and save to the 'joined' variable
-        joined = reduce(lambda left, right: left.join(right, how='outer'), dataframes)
 
-        # Export joined dataframe to a CSV file
-        joined.to_csv(allMetadataFileName)
-
-
-# Get the metadata of datasets. Function passed to tkinter button
+# Get the metadata of datasets. Function passed to tkinter button.
+# The chosen fields are looked for in each of the metadatablocks in metadatablockNames, which is the citation block
+# if no names are given, or every metadatablock in the installation if it's 'all'. If parentFieldTitleList is None,
+# every field of those metadatablocks is used. Each dataset's metadata is downloaded once and the fields of all
+# metadatablocks are taken from it
 def get_dataset_metadata(
     rootWindow, progressLabel, progressText, noMetadataText, noMetadataLabel,
     installationUrl='', datasetPidString='', 
-    parentFieldTitleList='', directoryPath='', apiKey=''):
+    parentFieldTitleList='', directoryPath='', apiKey='', metadatablockNames=None):
+
+    if metadatablockNames is None:
+        metadatablockNames = ['citation']
+    elif metadatablockNames == 'all':
+        metadatablockNames = get_metadatablock_names(installationUrl)
 
-    # Use metadatablock API endpoint to get metadatablock data
-    metadatablockData = get_metadatablock_data(installationUrl, 'citation')
+    # Compile the plan for getting the values of the chosen fields of each metadatablock from each dataset's metadata
+    extractionPlans = {}
+    for metadatablockName in metadatablockNames:
 
-    # From metadatablockData, get the database and display names of each parent field
-    allFieldsDBNamesDict = get_metadatablock_db_field_name_and_title(metadatablockData)
+        # Use metadatablock API endpoint to get metadatablock data
+        metadatablockData = get_metadatablock_data(installationUrl, metadatablockName)
+
+        # From metadatablockData, get the database and display names of each parent field
+        allFieldsDBNamesDict = get_metadatablock_db_field_name_and_title(metadatablockData)
+
+        if parentFieldTitleList is None:
+            metadatablockFieldTitles = list(allFieldsDBNamesDict)
+        else:
+            metadatablockFieldTitles = parentFieldTitleList
+
+        extractionPlan = get_field_extraction_plan(metadatablockData, metadatablockFieldTitles, allFieldsDBNamesDict)
+        if extractionPlan:
+            extractionPlans[metadatablockName] = extractionPlan
 
     # Create directory in the directory that the user chose
     currentTime = time.strftime('%Y.%m.%d_%H.%M.%S')
@@ -1061,29 +3346,31 @@ def get_dataset_metadata(
     mainDirectoryPath = str(Path(directoryPath + '/' + mainDirectoryName))
     os.mkdir(mainDirectoryPath)
 
-    # For each field the user chose:
-    for parentFieldTitle in parentFieldTitleList:
+    # Create a sink that keeps the CSV file of every field open until all metadata is written
+    csvSink = csvFileSink()
+    csvFilePaths = {}
+
+    # For each field the user chose in each metadatablock:
+    for metadatablockName, extractionPlan in extractionPlans.items():
+        for dbName, fieldPlan in extractionPlan.items():
 
-        # Create CSV file
+            # Create CSV file
 
-        # Create file name and path
-        csvFileName =  parentFieldTitle.lower().strip().replace(' ', '_')
-        csvFileName = csvFileName + '(citation)'
-        mainDirectoryPath = str(Path(directoryPath + '/' + mainDirectoryName))
-        csvFilePath = str(Path(mainDirectoryPath, csvFileName)) + '.csv'
-          
-        # Create header row for the CSV file
-        headerRow = ['dataset_pid', 'dataset_pid_url', 'dataset_url', 'dataset_version_number']
+            # Create file name and path
+            csvFileName =  fieldPlan['title'].lower().strip().replace(' ', '_')
+            csvFileName = csvFileName + '(%s)' % (metadatablockName)
+            mainDirectoryPath = str(Path(directoryPath + '/' + mainDirectoryName))
+            csvFilePath = str(Path(mainDirectoryPath, csvFileName)) + '.csv'
+            csvFilePaths[(metadatablockName, dbName)] = csvFilePath
+              
+            # Create header row for the CSV file
+            headerRow = ['dataset_pid', 'dataset_pid_url', 'dataset_url', 'dataset_version_number']
 
-        childFieldsList = get_column_names(
-            metadatablockData, parentFieldTitle, allFieldsDBNamesDict)
-        # Add childFields list to header row
-        headerRow = headerRow + childFieldsList
+            # Add childFields list to header row
+            headerRow = headerRow + fieldPlan['columns']
 
-        # Create CSV file and add headerrow
-        with open(csvFilePath, mode='w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(headerRow)        
+            # Create CSV file and add headerrow
+            csvSink.open_file(csvFilePath, headerRow)
 
     # Change passed datasetPidString to a list. Make sure the last newline doesn't mess up the list
     datasetPidList = [x.strip() for x in datasetPidString.splitlines()][:-1]
@@ -1100,46 +3387,30 @@ def get_dataset_metadata(
     progressLabel.grid(sticky='w', row=1, columnspan=2)
     rootWindow.update_idletasks()
 
-    for datasetPid in datasetPidList:
+    # Get the JSON metadata export of the latest version of each dataset, with many downloads in flight at the
+    # same time, and write the metadata to the CSV files as each dataset's metadata arrives
+    with csvSink:
+        for datasetPid, datasetMetadata in get_dataset_metadata_exports(installationUrl, datasetPidList, apiKey=apiKey):
 
-        # Get the JSON metadata export of the latest version of the dataset
-        datasetMetadata = get_dataset_metadata_export(
-            installationUrl=installationUrl,
-            datasetPid=datasetPid, 
-            exportFormat='dataverse_json',
-            apiKey=apiKey)
-
-        if datasetMetadata['status'] == 'OK':
-
-            for parentFieldTitle in parentFieldTitleList:
-                # Get database name of parentFieldTitle
-                dbName = allFieldsDBNamesDict[parentFieldTitle]
-
-                valueLists = get_metadata_values_lists(
-                    installationUrl=installationUrl,
-                    datasetMetadata=datasetMetadata,
-                    metadatablockName='citation',
-                    chosenTitleDBName=dbName, 
-                    chosenFields=get_column_names(
-                        metadatablockData, parentFieldTitle, allFieldsDBNamesDict))                
-                csvFileName =  parentFieldTitle.lower().strip().replace(' ', '_')
-                csvFileName = csvFileName + '(citation)'
-                csvFilePath = str(Path(mainDirectoryPath, csvFileName)) + '.csv'
-
-                for valueList in valueLists:
-
-                    with open(csvFilePath, mode='a', newline='', encoding='utf-8') as f:
-                        writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                        writer.writerow(valueList) 
-
-        count += 1
-        text = 'Dataset metadata retrieved: %s of %s' % (count, datasetTotalCount)
-        progressText.set(text)
-        rootWindow.update_idletasks()
+            if datasetMetadata != 'ERROR' and datasetMetadata.get('status') == 'OK':
 
-        
+                # Get the values of all chosen fields of each metadatablock in one pass through the block's fields
+                for metadatablockName, extractionPlan in extractionPlans.items():
+                    valueListsByField = get_metadata_values_lists_from_plan(
+                        installationUrl=installationUrl,
+                        datasetMetadata=datasetMetadata,
+                        metadatablockName=metadatablockName,
+                        extractionPlan=extractionPlan)
+
+                    for dbName, valueLists in valueListsByField.items():
+                        csvSink.writerows(csvFilePaths[(metadatablockName, dbName)], valueLists)
+
+            count += 1
+            text = 'Dataset metadata retrieved: %s of %s' % (count, datasetTotalCount)
+            progressText.set(text)
+            rootWindow.update_idletasks()
 
-    fieldsWithNoMetadata = delete_empty_csv_files(mainDirectoryPath)
+    fieldsWithNoMetadata = delete_empty_csv_files(mainDirectoryPath, rowCounts=csvSink.rowCounts)
 
     if count > 0 and len(fieldsWithNoMetadata) > 0:
 
@@ -1157,9 +3428,7 @@ def get_dataset_metadata(
 
 def delete_published_dataset(installationUrl, datasetPid, apiKey):
     destroyDatasetApiEndpointUrl = '%s/api/datasets/:persistentId/destroy/?persistentId=%s' % (installationUrl, datasetPid)
-    req = requests.delete(
-        destroyDatasetApiEndpointUrl,
-        headers={'X-Dataverse-key': apiKey})
+    req = get_installation_client(installationUrl, apiKey).delete(destroyDatasetApiEndpointUrl)
     data = req.json()
 
     status = data.get('status')
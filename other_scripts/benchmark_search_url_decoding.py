@@ -0,0 +1,91 @@
+# Compares how the curation assistant decodes the q and fq values of search URLs: the chained replace calls of
+# convert_utf8bytes_to_characters and convert_common_html_encoding that get_params used to use, and the
+# single-pass decode_percent_encoding function that get_params uses now.
+# To use your own search URLs, pass the path of a text file with one search URL per line, e.g.
+# python benchmark_search_url_decoding.py saved_searches.txt
+
+import re
+import sys
+import timeit
+from pathlib import Path
+from urllib.parse import quote_plus
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import convert_common_html_encoding
+from dataverse_repository_curation_assistant_functions import convert_utf8bytes_to_characters
+from dataverse_repository_curation_assistant_functions import decode_percent_encoding
+
+# Number of times every q and fq value is decoded in each timing run, and number of timing runs
+repetitions = 20
+timing_runs = 5
+
+# Search URLs like the ones copied from the browser's address bar after searching in Dataverse installations,
+# used when no file of search URLs is given
+sample_searches = [
+    ('https://dataverse.harvard.edu/dataverse/harvard', '"climate change"', ['subject_ss:"Earth and Environmental Sciences"']),
+    ('https://dataverse.harvard.edu/dataverse/harvard', 'title:(survey OR census) AND NOT pilot', ['dvObjectType:(datasets)', 'publicationDate:"2019"']),
+    ('https://borealisdata.ca/dataverse/root', 'éducation données sociales', ['authorAffiliation_ss:"Université de Montréal"']),
+    ('https://data.scielo.org/dataverse/scielo', 'saúde pública São Paulo', ['keywordValue_ss:"Política de Saúde"']),
+    ('https://dataverse.no/dataverse/root', 'Ørsted værdata Tromsø', ['authorName_ss:"Åsmund Ødegård"']),
+    ('https://dataverse.harvard.edu/dataverse/harvard', '北京 空气质量', ['subject_ss:"Medicine, Health and Life Sciences"']),
+    ('https://data.inrae.fr/dataverse/root', 'Ελλάδα ελαιόλαδο', ['dateOfDeposit_s:"2021-03-04"']),
+    ('https://demo.dataverse.org/dataverse/demo', 'C++ & R code 100% reproducible', ['fileTypeGroupFacet:"Code"']),
+    ('https://demo.dataverse.org/dataverse/demo', '“smart quotes” — em dash • bullet ™', []),
+    ('https://demo.dataverse.org/dataverse/demo', 'emoji 🌍🔬 datasets', ['license:"CC0 1.0"']),
+]
+sample_search_urls = [
+    '%s?q=%s%s&types=datasets&sort=score&order=desc&page=1' % (
+        collection_url, quote_plus(q), ''.join('&fq%s=%s' % (i, quote_plus(fq)) for i, fq in enumerate(fqs)))
+    for collection_url, q, fqs in sample_searches]
+
+# Search URLs that the replace tables decode incorrectly: a value with an encoded percent sign, which they decode
+# twice, and a value with a code that isn't in the tables
+sample_search_urls.extend([
+    'https://demo.dataverse.org/dataverse/demo?q=%2541+is+not+A&types=datasets',
+    'https://demo.dataverse.org/dataverse/demo?q=tab%09separated&types=datasets',
+])
+
+if len(sys.argv) > 1:
+    with open(sys.argv[1], mode='r', encoding='utf-8') as f:
+        search_urls = [line.strip() for line in f if line.strip()]
+else:
+    search_urls = sample_search_urls
+
+# Get the q and fq values of each search URL
+values = []
+for search_url in search_urls:
+    for param_value in re.split(r'\?|&', search_url)[1:]:
+        if param_value.startswith('q=') or param_value.startswith('fq'):
+            values.append(param_value.split('=', 1)[1])
+
+
+def decode_with_replace_tables(value):
+    value = convert_utf8bytes_to_characters(value)
+    value = convert_common_html_encoding(value)
+    return value.replace('+', ' ')
+
+
+def decode_all_values(decoder):
+    for i in range(repetitions):
+        for value in values:
+            decoder(value)
+
+
+print('Decoding %s q and fq values from %s search URLs, %s times per run' % (len(values), len(search_urls), repetitions))
+
+decoded_value_count = len(values) * repetitions
+times = {}
+for decoder in (decode_with_replace_tables, decode_percent_encoding):
+    seconds = min(timeit.repeat(lambda: decode_all_values(decoder), number=1, repeat=timing_runs))
+    times[decoder.__name__] = seconds
+    print('%s: %.2f microseconds per value' % (decoder.__name__, seconds / decoded_value_count * 1000000))
+
+print('decode_percent_encoding is %.1f times as fast' % (times['decode_with_replace_tables'] / times['decode_percent_encoding']))
+
+# Show the values that are decoded differently
+different_values = [
+    (value, decode_with_replace_tables(value), decode_percent_encoding(value))
+    for value in values if decode_with_replace_tables(value) != decode_percent_encoding(value)]
+print('\nValues decoded differently: %s' % (len(different_values)))
+for value, replace_tables_result, single_pass_result in different_values[:20]:
+    print('\n%s\n  replace tables: %r\n  single pass:    %r' % (value, replace_tables_result, single_pass_result))
@@ -5,7 +5,12 @@ metadata field, e.g. distributionDate
 '''
 
 from csv import DictReader
-import requests
+from pathlib import Path
+import sys
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
 
 server = ''  # Dataverse repository URL, e.g. https://demo.dataverse.org
 apikey = ''  # API key of super user account
@@ -28,6 +33,8 @@ elif '.txt' in file:
 citation_dates_changed = []
 citation_dates_not_changed = []
 
+client = get_installation_client(server, apikey)
+
 print('Trying to change citation dates...')
 
 for datasetPID in datasetPIDs:
@@ -35,18 +42,17 @@ for datasetPID in datasetPIDs:
     url = '%s/api/datasets/:persistentId/citationdate?persistentId=%s' % (server, datasetPID)
 
     try:
-        req = requests.put(
-            url,
-            data=data,
-            headers={
-                'X-Dataverse-key': apikey
-            })
-
-        print('%s: citation date changed' % (datasetPID))
-        citation_dates_changed.append(datasetPID)
-
-    except Exception:
-        print('%s: Could not change citation date' % (datasetPID))
+        req = client.put(url, data=data)
+
+        if req.status_code == 200:
+            print('%s: citation date changed' % (datasetPID))
+            citation_dates_changed.append(datasetPID)
+        else:
+            print('%s: Could not change citation date: %s' % (datasetPID, req.status_code))
+            citation_dates_not_changed.append(datasetPID)
+
+    except Exception as e:
+        print('%s: Could not change citation date: %s' % (datasetPID, e))
         citation_dates_not_changed.append(datasetPID)
 
 print('\nDataset citation dates changed: %s' % (len(citation_dates_changed)))
@@ -1,7 +1,12 @@
 # Remove dataset locks
 
 from csv import DictReader
-import requests
+from pathlib import Path
+import sys
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
 
 repositoryURL = ''
 apikey = ''  # API key of superuser account
@@ -25,13 +30,11 @@ elif '.txt' in file:
 total = len(datasetPIDs)
 count = 0
 
+client = get_installation_client(repositoryURL, apikey)
+
 for datasetPID in datasetPIDs:
     url = '%s/api/datasets/:persistentId/locks?persistentId=%s' % (repositoryURL, datasetPID)
-    req = requests.delete(
-        url,
-        headers={
-            'X-Dataverse-key': apikey
-        })
+    req = client.delete(url)
 
     count += 1
 
@@ -4,7 +4,12 @@ a list or column (named "id") of dataverse database IDs
 '''
 
 from csv import DictReader
-import requests
+from pathlib import Path
+import sys
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
 
 server = ''  # Base URL of repository hosting the dataverses to be deleted
 apikey = ''  # Superuser API key
@@ -44,6 +49,8 @@ deletedDataverses = []
 notDeletedDataverses = []
 count = 0
 
+client = get_installation_client(server, apikey)
+
 # For each dataverseId in dataverseIds list...
 for dataverseId in dataverseIds:
     count += 1
@@ -51,18 +58,20 @@ for dataverseId in dataverseIds:
     # Try to delete the dataverse and report
     url = '%s/api/dataverses/%s' % (server, dataverseId)
     try:
-        req = requests.delete(
-            url,
-            headers={
-                'X-Dataverse-key': apikey
-            })
+        req = client.delete(url)
 
-        print('%s of %s: Deleted - %s' % (count, total, dataverseId))
-        deletedDataverses.append(dataverseId)
+        # The client retries calls that time out, so if the dataverse isn't found when the call is retried after an
+        # attempt that timed out or lost its connection, that attempt deleted it
+        if req.status_code == 200 or (req.status_code == 404 and req.earlierAttemptMayHaveSucceeded):
+            print('%s of %s: Deleted - %s' % (count, total, dataverseId))
+            deletedDataverses.append(dataverseId)
+        else:
+            print('%s of %s: Could not be deleted (%s) - %s' % (count, total, req.status_code, dataverseId))
+            notDeletedDataverses.append(dataverseId)
 
     # If that fails, save ID to notDeletedDataverses list and report
-    except Exception:
-        print('%s of %s: Could not be deleted - %s' % (count, total, dataverseId))
+    except Exception as e:
+        print('%s of %s: Could not be deleted (%s) - %s' % (count, total, e, dataverseId))
         notDeletedDataverses.append(dataverseId)
 
 # Print results
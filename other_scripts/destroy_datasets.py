@@ -1,7 +1,12 @@
 # Destroys a given list of datasets
 
 from csv import DictReader
-import requests
+from pathlib import Path
+import sys
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
 
 server = ''  # Dataverse repository URL, e.g. https://demo.dataverse.org
 apikey = ''  # API key of superuser account
@@ -23,6 +28,8 @@ elif '.txt' in file:
 
 total = len(datasetPIDs)
 
+client = get_installation_client(server, apikey)
+
 destroyed_datasets = []
 not_destroyed_datasets = []
 
@@ -32,17 +39,19 @@ for datasetPID in datasetPIDs:
     try:
         url = '%s/api/datasets/:persistentId/destroy/?persistentId=%s' % (server, datasetPID)
 
-        req = requests.delete(
-            url,
-            headers={
-                'X-Dataverse-key': apikey
-            })
+        req = client.delete(url)
 
-        print('%s destroyed' % (datasetPID))
-        destroyed_datasets.append(datasetPID)
+        # The client retries calls that time out, so if the dataset isn't found when the call is retried after an
+        # attempt that timed out or lost its connection, that attempt destroyed it
+        if req.status_code == 200 or (req.status_code == 404 and req.earlierAttemptMayHaveSucceeded):
+            print('%s destroyed' % (datasetPID))
+            destroyed_datasets.append(datasetPID)
+        else:
+            print('Could not destroy %s: %s' % (datasetPID, req.status_code))
+            not_destroyed_datasets.append(datasetPID)
 
-    except Exception:
-        print('Could not destroy %s' % (datasetPID))
+    except Exception as e:
+        print('Could not destroy %s: %s' % (datasetPID, e))
         not_destroyed_datasets.append(datasetPID)
 
 print('\nDatasets destroyed: %s' % (len(destroyed_datasets)))
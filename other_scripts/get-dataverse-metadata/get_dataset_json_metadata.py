@@ -6,13 +6,17 @@ from csv import DictReader
 import json
 import os
 from pathlib import Path
-import requests
 import time
 from tkinter import *
 from tkinter import filedialog
 from tkinter import ttk
 import sys
 
+# Use the curation assistant's client and download engine for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
+from dataverse_repository_curation_assistant_functions import get_dataset_metadata_exports, get_json_responses
+
 # Create GUI for getting user input
 window = Tk()
 window.title('Get dataset metadata')
@@ -147,9 +151,12 @@ def improved_get(_dict, path, default=None):
 # Save current time to append it to main folder name
 currentTime = time.strftime('%Y.%m.%d_%H.%M.%S')
 
+# Create client that sends the API key, if one was entered, with each API call
+client = get_installation_client(repositoryURL, apikey)
+
 # Use the "Get Version" endpoint to get repository's Dataverse version (or set version as 'NA')
 getInstallationVersionApiUrl = '%s/api/v1/info/version' % (repositoryURL)
-response = requests.get(getInstallationVersionApiUrl)
+response = client.get(getInstallationVersionApiUrl)
 getInstallationVersionApiData = response.json()
 dataverseVersion = getInstallationVersionApiData['data']['version']
 dataverseVersion = str(dataverseVersion.lstrip('v'))
@@ -170,7 +177,7 @@ os.mkdir(metadatablockFileDirectoryPath)
 metadatablocksApi = '%s/api/v1/metadatablocks' % (repositoryURL)
 metadatablocksApi = metadatablocksApi.replace('//api', '/api')
 
-response = requests.get(metadatablocksApi)
+response = client.get(metadatablocksApi)
 data = response.json()
 
 metadatablockNames = []
@@ -182,7 +189,7 @@ print('Downloading %s metadatablock JSON file(s) into metadatablocks folder:' %
 
 for metadatablockName in metadatablockNames:
     metadatablockApi = '%s/%s' % (metadatablocksApi, metadatablockName)
-    response = requests.get(metadatablockApi)
+    response = client.get(metadatablockApi)
 
     metadatablockFile = str(Path(metadatablockFileDirectoryPath)) + '/' '%s_v%s.json' % (metadatablockName, dataverseVersion)
 
@@ -218,66 +225,31 @@ elif '.txt' in datasetPIDFile:
 
 total = len(datasetPIDs)
 
-for datasetPID in datasetPIDs:
-    try:
-        latestVersionUrl = '%s/api/datasets/:persistentId' % (repositoryURL)
-        params = {'persistentId': datasetPID}
-        if apikey:
-            params['key'] = apikey
-        response = requests.get(
-            latestVersionUrl,
-            params=params)
-        latestVersionMetadata = response.json()
+# Download the metadata of the latest version of each dataset, keeping many downloads in flight at the same time,
+# and handle each dataset's metadata as it arrives. If the metadata of all versions is needed, save the basic info
+# of each dataset to use after the metadata of each dataset's versions is downloaded
+datasetInfoDict = {}
 
+for datasetPID, latestVersionMetadata in get_dataset_metadata_exports(repositoryURL, datasetPIDs, apiKey=apikey):
+    try:
         # If the dataset has a database ID
         if 'id' in latestVersionMetadata['data']:
             persistentUrl = latestVersionMetadata['data']['persistentUrl']
             publisher = latestVersionMetadata['data']['publisher']
             publicationDate = improved_get(latestVersionMetadata, 'data.publicationDate')
 
-            if 'id' in latestVersionMetadata['data']:
-                if getAllVersionMetadata != 1:
-                    datasetVersion = {
-                        'status': latestVersionMetadata['status'],
-                        'data': {
-                            'persistentUrl': persistentUrl,
-                            'publisher': publisher,
-                            'publicationDate': publicationDate,
-                            'datasetVersion': latestVersionMetadata['data']['latestVersion']}}
-
-                    metadataFile = '%s.json' % (datasetPID.replace(':', '_').replace('/', '_'))
-                    with open(os.path.join(metadataFileDirectoryPath, metadataFile), mode='w') as f:
-                        f.write(json.dumps(datasetVersion, indent=4))
-                else:
-                    allVersionUrl = '%s/api/datasets/:persistentId/versions' % (repositoryURL)
-                    params = {'persistentId': datasetPID}
-                    if apikey:
-                        params['key'] = apikey
-                    response = requests.get(
-                        allVersionUrl,
-                        params=params)
-                    allVersionsMetadata = response.json()
-
-                    for datasetVersion in allVersionsMetadata['data']:
-                        datasetVersion = {
-                            'status': latestVersionMetadata['status'],
-                            'data': {
-                                'persistentUrl': persistentUrl,
-                                'publisher': publisher,
-                                'publicationDate': publicationDate,
-                                'datasetVersion': datasetVersion}}
-
-                        majorVersion = improved_get(datasetVersion, 'data.datasetVersion.versionNumber')
-                        minorVersion = improved_get(datasetVersion, 'data.datasetVersion.versionMinorNumber')
-
-                        if (majorVersion is not None) and (minorVersion is not None):
-                            versionNumber = majorVersion + '.' + minorVersion
-                            metadataFile = '%s_v%s.json' % (datasetPID.replace(':', '_').replace('/', '_'), versionNumber)
-                        else:
-                            metadataFile = '%s_vDRAFT.json' % (datasetPID.replace(':', '_').replace('/', '_'))
-
-                        with open(os.path.join(metadataFileDirectoryPath, metadataFile), mode='w') as f:
-                            f.write(json.dumps(datasetVersion, indent=4))
+            if getAllVersionMetadata != 1:
+                datasetVersion = {
+                    'status': latestVersionMetadata['status'],
+                    'data': {
+                        'persistentUrl': persistentUrl,
+                        'publisher': publisher,
+                        'publicationDate': publicationDate,
+                        'datasetVersion': latestVersionMetadata['data']['latestVersion']}}
+
+                metadataFile = '%s.json' % (datasetPID.replace(':', '_').replace('/', '_'))
+                with open(os.path.join(metadataFileDirectoryPath, metadataFile), mode='w') as f:
+                    f.write(json.dumps(datasetVersion, indent=4))
 
                 # Increase count variable to track progress
                 count += 1
@@ -285,5 +257,52 @@ for datasetPID in datasetPIDs:
                 # Print progress
                 print('%s of %s datasets' % (count, total), end='\r', flush=True)
 
+            else:
+                datasetInfoDict[datasetPID] = {
+                    'status': latestVersionMetadata['status'],
+                    'persistentUrl': persistentUrl,
+                    'publisher': publisher,
+                    'publicationDate': publicationDate}
+
     except Exception:
         print('Could not download JSON metadata of %s' % (datasetPID))
+
+if getAllVersionMetadata == 1:
+
+    # Download the metadata of all versions of each dataset, keeping many downloads in flight at the same time
+    allVersionUrl = '%s/api/datasets/:persistentId/versions' % (repositoryURL)
+    requestList = (
+        (datasetPID, allVersionUrl, {'persistentId': datasetPID}) for datasetPID in datasetInfoDict)
+
+    for datasetPID, allVersionsMetadata in get_json_responses(repositoryURL, requestList, apiKey=apikey):
+        datasetInfo = datasetInfoDict[datasetPID]
+        try:
+            for datasetVersion in allVersionsMetadata['data']:
+                datasetVersion = {
+                    'status': datasetInfo['status'],
+                    'data': {
+                        'persistentUrl': datasetInfo['persistentUrl'],
+                        'publisher': datasetInfo['publisher'],
+                        'publicationDate': datasetInfo['publicationDate'],
+                        'datasetVersion': datasetVersion}}
+
+                majorVersion = improved_get(datasetVersion, 'data.datasetVersion.versionNumber')
+                minorVersion = improved_get(datasetVersion, 'data.datasetVersion.versionMinorNumber')
+
+                if (majorVersion is not None) and (minorVersion is not None):
+                    versionNumber = majorVersion + '.' + minorVersion
+                    metadataFile = '%s_v%s.json' % (datasetPID.replace(':', '_').replace('/', '_'), versionNumber)
+                else:
+                    metadataFile = '%s_vDRAFT.json' % (datasetPID.replace(':', '_').replace('/', '_'))
+
+                with open(os.path.join(metadataFileDirectoryPath, metadataFile), mode='w') as f:
+                    f.write(json.dumps(datasetVersion, indent=4))
+
+            # Increase count variable to track progress
+            count += 1
+
+            # Print progress
+            print('%s of %s datasets' % (count, total), end='\r', flush=True)
+
+        except Exception:
+            print('Could not download JSON metadata of %s' % (datasetPID))
@@ -3,11 +3,16 @@
 import csv
 from csv import DictReader
 import os
-import requests
+from pathlib import Path
+import sys
 from tkinter import *
 from tkinter import filedialog
 from tkinter import ttk
 
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
+
 # Create GUI for getting user input
 window = Tk()
 window.title('Get Dataverse collection names')
@@ -131,15 +136,14 @@ with open(filename, mode='w') as opencsvfile:
     # Create header row
     opencsvfile.writerow(['persistentUrl', 'dataverseAlias', 'dataverseName'])
 
+client = get_installation_client(repositoryURL, apikey)
+
 datasetPIDErrors = []
 count = 0
 for datasetPID in datasetPIDs:
     try:
-        if apikey:
-            url = '%s/api/search?q="%s"&type=dataset&show_entity_ids=true&key=%s' % (repositoryURL, datasetPID, apikey)
-        else:
-            url = '%s/api/search?q="%s"&type=dataset&show_entity_ids=true' % (repositoryURL, datasetPID)
-        response = requests.get(url)
+        url = '%s/api/search?q="%s"&type=dataset&show_entity_ids=true' % (repositoryURL, datasetPID)
+        response = client.get(url)
         data = response.json()
 
         # Save dataset PID, Dataverse name and Dataverse alias
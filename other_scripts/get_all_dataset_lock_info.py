@@ -3,8 +3,14 @@ from dateutil import tz
 from dateutil.parser import parse
 import json
 import os
-import requests
+from pathlib import Path
+import sys
 import time
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
+
 # Import RT python module to get info from emails
 
 
@@ -32,15 +38,15 @@ def convert_to_local_tz(timestamp, shortDate=False):
 
 currentTime = time.strftime('%Y.%m.%d_%H.%M.%S')
 
+client = get_installation_client(installationUrl, apiToken)
+
 datasetPids = []
 
 # Get dataset PIDs of datasets that have any of the lock types in lockTypesList
 for lockType in lockTypesList:
 
     datasetLocksApiEndpoint = f'{installationUrl}/api/datasets/locks?type={lockType}'
-    response = requests.get(
-        datasetLocksApiEndpoint,
-        headers={'X-Dataverse-key': apiToken})
+    response = client.get(datasetLocksApiEndpoint)
     data = response.json()
 
     if data['status'] == 'OK':
@@ -71,7 +77,7 @@ elif total > 0:
         # For each dataset, write to the CSV file info about each lock the dataset has
         for datasetPid in datasetPids:
             url = f'{installationUrl}/api/datasets/:persistentId/locks?persistentId={datasetPid}'
-            data = requests.get(url).json()
+            data = client.get(url).json()
 
             count += 1
 
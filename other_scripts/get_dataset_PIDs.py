@@ -2,10 +2,11 @@
 # Includes deaccessioned datasets. Excludes harvested and linked datasets.
 
 import csv
+from dateutil.parser import parse
 import glob
 import json
 import os
-import requests
+from pathlib import Path
 import sys
 import time
 from tkinter import filedialog
@@ -13,13 +14,22 @@ from tkinter import ttk
 from tkinter import *
 from urllib.parse import urlparse
 
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client, get_collection_tree
+from dataverse_repository_curation_assistant_functions import get_search_api_items, get_search_api_items_newer_than
+from dataverse_repository_curation_assistant_functions import get_search_api_worker_count
+from dataverse_repository_curation_assistant_functions import get_search_api_item_date, searchApiWatermarksFileName
+from dataverse_repository_curation_assistant_functions import get_search_api_watermark, save_search_api_watermark
+from dataverse_repository_curation_assistant_functions import merge_rows_into_csv_file
+
 ####################################################################################
 
 # Create GUI for getting user input
 
 window = Tk()
 window.title('Get dataset PIDs')
-window.geometry('625x450')  # width x height
+window.geometry('625x500')  # width x height
 
 
 # Function called when Browse button is pressed
@@ -39,10 +49,14 @@ def retrieve_input():
     global dataverseUrl
     global apikey
     global get_subdataverses
+    global incremental_harvest
 
     # Record if user wants to search in subdataverses
     get_subdataverses = get_subdataverses.get()
 
+    # Record if user wants only the datasets published or updated since the last run
+    incremental_harvest = incremental_harvest.get()
+
     # Store what entered in the api key text box as a global variable
     apikey = entry_apikey.get().rstrip()
 
@@ -120,9 +134,20 @@ label_browseDirectory.grid(sticky='w', column=0, row=12, pady=2)
 button_browseDirectory = ttk.Button(window, text='Browse', command=lambda: retrieve_directory())
 button_browseDirectory.grid(sticky='w', column=0, row=13)
 
+# Create "Only new or updated datasets" checkbox
+incremental_harvest = IntVar()
+c = Checkbutton(window, text="Only add datasets published or updated since the last run", variable=incremental_harvest).grid(sticky='w', column=0, row=14, pady=(25, 0))
+
+# Create help text for "Only new or updated datasets" checkbox
+label_incrementalHelpText = Label(
+    window,
+    text='Adds them to the CSV file saved in the chosen folder by the last run. Works only when getting the PIDs of all datasets in the repository',
+    foreground='grey', anchor='w', wraplength=500, justify='left')
+label_incrementalHelpText.grid(sticky='w', column=0, row=15)
+
 # Create start button
 button_Submit = ttk.Button(window, text='Start', command=lambda: retrieve_input())
-button_Submit.grid(sticky='w', column=0, row=15, pady=40)
+button_Submit.grid(sticky='w', column=0, row=16, pady=40)
 
 # Keep window open until it's closed
 mainloop()
@@ -140,9 +165,12 @@ try:
 except IndexError:
     alias = ''
 
+# Create client that sends the API key, if one was entered, with each API call
+client = get_installation_client(server, apikey)
+
 # Get alias of the root dataverse (assumming the root dataverse's ID is 1, which isn't the case with UVA Dataverse)
 url = '%s/api/dataverses/1' % (server)
-response = requests.get(url)
+response = client.get(url)
 dataverse_data = response.json()
 root_alias = dataverse_data['data']['alias']
 installation_name = dataverse_data['data']['name']
@@ -157,106 +185,100 @@ if not alias or alias == root_alias:
     # Create CSV file
     csv_file = 'dataset_pids_%s_%s.csv' % (installation_name.replace(' ', '_'), current_time)
     csv_file_path = os.path.join(directory, csv_file)
+    csv_columns = ['persistent_id', 'persistentUrl', 'dataverse_name', 'dataverse_alias', 'publication_date']
+
+    search_api_url = '%s/api/v1/search' % (server)
+    search_api_params = {'q': '*', 'fq': '-metadataSource:"Harvested"', 'type': 'dataset', 'sort': 'date', 'order': 'desc'}
+
+    # Function for getting the row of the CSV file for a dataset in the Search API results
+    def get_dataset_row(i):
+        return {
+            'persistent_id': i['global_id'],
+            'persistentUrl': i['url'],
+            'dataverse_name': i['name_of_dataverse'],
+            'dataverse_alias': i['identifier_of_dataverse'],
+            'publication_date': i.get('published_at', 'unpublished')}
+
+    # Get the watermark of the last time dataset PIDs of this repository were saved in the chosen folder:
+    # the date of the newest dataset found and the CSV file the PIDs were saved in
+    watermarks_file_path = os.path.join(directory, searchApiWatermarksFileName)
+    last_harvest = get_search_api_watermark(watermarks_file_path, server)
+
+    if incremental_harvest == 1 and (
+            last_harvest is None or last_harvest['watermark'] is None
+            or not os.path.isfile(last_harvest['inventory_file'])):
+        print('\nNo earlier CSV file of dataset PIDs from this repository was found in the chosen folder. Saving all dataset PIDs')
+        incremental_harvest = 0
+
+    # Create list for storing the Search API start offsets of misindexed datasets
+    misindexed_dataset_offsets = []
+
+    # If only datasets published or updated since the last run are wanted, get those datasets and merge them into
+    # the earlier run's CSV file to create the new CSV file
+    if incremental_harvest == 1:
+        newest_item_date = parse(last_harvest['watermark'])
+        print('\nSaving PIDs of datasets published or updated since %s:' % (last_harvest['watermark']))
+
+        new_rows = []
+        for i in get_search_api_items_newer_than(
+                search_api_url, search_api_params, newest_item_date, client, misindexed_dataset_offsets):
+            new_rows.append(get_dataset_row(i))
+            item_date = get_search_api_item_date(i)
+            if item_date is not None and item_date > newest_item_date:
+                newest_item_date = item_date
+            print('%s new or updated' % (len(new_rows)), end='\r', flush=True)
+
+        count = merge_rows_into_csv_file(
+            last_harvest['inventory_file'], new_rows, 'persistent_id', csv_file_path, fieldnames=csv_columns)
+
+        print('\nNew or updated datasets found: %s' % (len(new_rows)))
+        print('Dataset PIDs written to the CSV file: %s' % (count))
 
-    with open(csv_file_path, mode='w', newline='') as f:
-        f = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        f.writerow(['persistent_id', 'persistentUrl', 'dataverse_name', 'dataverse_alias', 'publication_date'])
-
-    # Report count of datasets
-    if apikey:
-        url = '%s/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=1&start=0&sort=date&order=desc&key=%s' % (server, apikey)
-        response = requests.get(url)
-        data = response.json()
-        total = data['data']['total_count']
-        print('\nSaving %s dataset PIDs\n(Search API returns the draft and published version of a dataset. List will be de-duplicated at the end):' % (total))
     else:
-        url = '%s/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=1&start=0&sort=date&order=desc' % (server)
-        response = requests.get(url)
+        # Report count of datasets
+        response = client.get(search_api_url, params=dict(search_api_params, per_page=1, start=0))
         data = response.json()
         total = data['data']['total_count']
-        print('\nSaving %s dataset PIDs:' % (total))
-
-    # Initialization for paginating through Search API results and showing progress
-    start = 0
-    condition = True
-    count = 0
-
-    # Create variable for storing count of misindexed datasets
-    misindexed_datasets_count = 0
-
-    while condition:
-        try:
-            per_page = 10
-            if apikey:
-                url = '%s/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=%s&start=%s&sort=date&order=desc&key=%s' % (server, per_page, start, apikey)
-            else:
-                url = '%s/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=%s&start=%s&sort=date&order=desc' % (server, per_page, start)
-
-            response = requests.get(url)
-            data = response.json()
-
-            # For each item object...
-            for i in data['data']['items']:
-                persistent_id = i['global_id']
-                persistent_url = i['url']
-                dataverse_name = i['name_of_dataverse']
-                dataverse_alias = i['identifier_of_dataverse']
-                publicationDate = i.get('published_at', 'unpublished')
-
-                with open(csv_file_path, mode='a', encoding='utf-8', newline='') as open_csv_file:
-                    open_csv_file = csv.writer(open_csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-                    # Create new row with dataset and file info
-                    open_csv_file.writerow([persistent_id, persistent_url, dataverse_name, dataverse_alias, publicationDate])
+        if apikey:
+            print('\nSaving %s dataset PIDs\n(Search API returns the draft and published version of a dataset. List will be de-duplicated at the end):' % (total))
+        else:
+            print('\nSaving %s dataset PIDs:' % (total))
 
-                    count += 1
-                    print('%s of %s' % (count, total), end='\r', flush=True)
+        # Initialization for showing progress
+        count = 0
+        newest_item_date = None
 
-            # Update variables to paginate through the search results
-            start = start + per_page
+        with open(csv_file_path, mode='w', encoding='utf-8', newline='') as open_csv_file:
+            open_csv_file = csv.DictWriter(open_csv_file, fieldnames=csv_columns, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            open_csv_file.writeheader()
 
-        # Print error message if misindexed datasets break the Search API call, and try the next page. (See https://github.com/IQSS/dataverse/issues/4225)
-        except urllib.error.URLError:
-            try:
-                per_page = 1
-                if apikey:
-                    url = '%s/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=%s&start=%s&sort=date&order=desc&key=%s' % (server, per_page, start, apikey)
-                else:
-                    url = '%s/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=%s&start=%s&sort=date&order=desc' % (server, per_page, start)
+            # Get every dataset in the search results. Large installations are split into partitions by date so
+            # that pages deep in the search results don't slow down, and pages are requested at the same time.
+            # If misindexed datasets break a Search API call, the page is split until the misindexed datasets are
+            # found (See https://github.com/IQSS/dataverse/issues/4225)
+            for i in get_search_api_items(
+                    search_api_url, search_api_params, client, total,
+                    workerCount=get_search_api_worker_count(server), misindexedObjectOffsets=misindexed_dataset_offsets):
 
-                response = requests.get(url)
-                data = response.json()
+                # Create new row with dataset and file info
+                open_csv_file.writerow(get_dataset_row(i))
 
-                # For each item object...
-                for i in data['data']['items']:
-                    persistent_id = i['global_id']
-                    persistent_url = i['url']
-                    dataverse_name = i['name_of_dataverse']
-                    dataverse_alias = i['identifier_of_dataverse']
-                    publicationDate = i.get('published_at', 'unpublished')
+                # Keep track of the newest dataset, whose date is saved as the watermark for the next run
+                item_date = get_search_api_item_date(i)
+                if item_date is not None and (newest_item_date is None or item_date > newest_item_date):
+                    newest_item_date = item_date
 
-                    with open(csv_file_path, mode='a', encoding='utf-8', newline='') as open_csv_file:
-                        open_csv_file = csv.writer(open_csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                count += 1
+                print('%s of %s' % (count, total), end='\r', flush=True)
 
-                        # Create new row with dataset and file info
-                        open_csv_file.writerow([persistent_id, persistent_url, dataverse_name, dataverse_alias, publicationDate])
+        print('\nDataset PIDs written to the CSV file: %s' % (count))
 
-                        print('%s of %s' % (count, total), end='\r', flush=True)
+    # Save the watermark so that the next run can get only datasets published or updated since this run
+    save_search_api_watermark(watermarks_file_path, server, newest_item_date, csv_file_path)
 
-                    # Update variables to paginate through the search results
-                    start = start + per_page
-
-            except urllib.error.URLError:
-                misindexed_datasets_count += 1
-                start = start + per_page
-
-        # Stop paginating when there are no more results
-        condition = start < total
-
-    print('\nDataset PIDs written to the CSV file: %s' % (count))
-
-    if misindexed_datasets_count:
-        print('\n\nUnretrievable dataset PIDs due to misindexing: %s\n' % (misindexed_datasets_count))
+    if misindexed_dataset_offsets:
+        print('\n\nUnretrievable dataset PIDs due to misindexing: %s' % (len(misindexed_dataset_offsets)))
+        print('Search API start offsets of misindexed datasets: %s\n' % (', '.join(str(offset) for offset in misindexed_dataset_offsets)))
 
 ####################################################################################
 
@@ -270,46 +292,17 @@ else:
         f = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
         f.writerow(['persistent_id', 'persistentUrl', 'dataverse_name', 'dataverse_alias', 'publication_date'])
 
-    # Get ID of given dataverse alias
-    if apikey:
-        url = '%s/api/dataverses/%s?key=%s' % (server, alias, apikey)
-    else:
-        url = '%s/api/dataverses/%s' % (server, alias)
-
-    response = requests.get(url)
-    data = response.json()
-    parent_dataverse_id = data['data']['id']
-
-    # Create list and add ID of given dataverse
-    dataverse_ids = [parent_dataverse_id]
-
-    # If user wants datasets in subdataverses, search for and include IDs of subdataverses (excludes linked dataverses)
-
-    # Get each subdataverse in the given dataverse
+    # Get the tree of the given dataverse and, if the user wants datasets in subdataverses, of all of its subdataverses
+    # (excludes linked dataverses), including the datasets in each dataverse. The dataverses at each level of the tree
+    # are requested at the same time
     if get_subdataverses == 1:
-        print('\nGetting dataverse IDs in %s:' % (alias))
-
-        for dataverse_id in dataverse_ids:
-
-            sys.stdout.write('.')
-            sys.stdout.flush()
-
-            if apikey:
-                url = '%s/api/dataverses/%s/contents?key=%s' % (server, dataverse_id, apikey)
-            else:
-                url = '%s/api/dataverses/%s/contents' % (server, dataverse_id)
-
-            response = requests.get(url)
-            data = response.json()
-
-            for i in data['data']:
-                if i['type'] == 'dataverse':
-                    dataverse_id = i['id']
-                    dataverse_ids.extend([dataverse_id])
-
-        print('\n\nFound 1 dataverse and %s subdataverses' % (len(dataverse_ids) - 1))
+        print('\nGetting dataverses in %s...' % (alias))
+        collection_tree = get_collection_tree('%s/dataverse/%s' % (server, alias), apikey, includeDatasets=True)
+        print('\nFound 1 dataverse and %s subdataverses' % (len(collection_tree) - 1))
+    else:
+        collection_tree = get_collection_tree('%s/dataverse/%s' % (server, alias), apikey, maxDepth=0, includeDatasets=True)
 
-    # For each dataverse in the list, add the PIDs of all datasets to a CSV file - excludes linked and harvested datasets
+    # For each dataverse in the tree, add the PIDs of all datasets to a CSV file - excludes linked and harvested datasets
 
     print('\nWriting dataset IDs to %s:' % (csv_file_path))
 
@@ -318,43 +311,25 @@ else:
     with open(csv_file_path, mode='a', encoding='utf-8', newline='') as open_csv_file:
         open_csv_file = csv.writer(open_csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
 
-        for dataverse_id in dataverse_ids:
-
-            # Get name of dataverse
-            if apikey:
-                url = '%s/api/dataverses/%s?key=%s' % (server, dataverse_id, apikey)
-            else:
-                url = '%s/api/dataverses/%s' % (server, dataverse_id)
-            response = requests.get(url, timeout=10)
-            data = response.json()
-            dataverse_name = data['data']['name']
-            dataverse_alias = data['data']['alias']
-
-            # Get content of dataverse
-            if apikey:
-                url = '%s/api/dataverses/%s/contents?key=%s' % (server, dataverse_id, apikey)
-            else:
-                url = '%s/api/dataverses/%s/contents' % (server, dataverse_id)
-
-            response = requests.get(url)
-            data = response.json()
-
-            for i in data['data']:
-                if i['type'] == 'dataset':
-                    protocol = i['protocol']
-                    authority = i['authority']
-                    identifier = i['identifier']
-                    persistent_id = '%s:%s/%s' % (protocol, authority, identifier)
-                    persistent_url = i['persistentUrl']
-                    publicationDate = i.get('publicationDate', 'unpublished')
-
-                    count += 1
-
-                    # Create new line with dataset PID
-                    open_csv_file.writerow([persistent_id, persistent_url, dataverse_name, dataverse_alias, publicationDate])
-
-                    # As a progress indicator, print a dot each time a row is written
-                    sys.stdout.write('.')
-                    sys.stdout.flush()
+        for collection in collection_tree:
+            dataverse_name = collection['name']
+            dataverse_alias = collection['alias']
+
+            for i in collection['datasets']:
+                protocol = i['protocol']
+                authority = i['authority']
+                identifier = i['identifier']
+                persistent_id = '%s:%s/%s' % (protocol, authority, identifier)
+                persistent_url = i['persistentUrl']
+                publicationDate = i.get('publicationDate', 'unpublished')
+
+                count += 1
+
+                # Create new line with dataset PID
+                open_csv_file.writerow([persistent_id, persistent_url, dataverse_name, dataverse_alias, publicationDate])
+
+                # As a progress indicator, print a dot each time a row is written
+                sys.stdout.write('.')
+                sys.stdout.flush()
 
     print('\n\nDataset PIDs written to the CSV file: %s' % (count))
@@ -1,15 +1,26 @@
 # Download dataset metadata of as many known Dataverse installations as possible
 
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 import csv
 from csv import DictReader
+from dateutil.parser import parse
 import json
 import os
 from pathlib import Path
 import pandas as pd
 import requests
+import sys
 import time
 from urllib.parse import urlparse
 
+# Use the curation assistant's client for calling the installations' APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import installationClient
+from dataverse_repository_curation_assistant_functions import get_search_api_page_items, get_search_api_items_newer_than
+from dataverse_repository_curation_assistant_functions import get_search_api_item_date, searchApiWatermarksFileName
+from dataverse_repository_curation_assistant_functions import get_search_api_watermark, save_search_api_watermark
+from dataverse_repository_curation_assistant_functions import merge_rows_into_csv_file, crawlJournal, hostWorkScheduler
+
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 # The requests module isn't able to verify the SSL cert of some installations,
 # so all requests calls in this script are set to not verify certs (verify=False)
@@ -17,12 +28,18 @@ from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 
-def check_api_endpoint(url, headers, verify=True, json_response=True):
+# Calls an API endpoint and returns its status and, if the endpoint returned JSON, the JSON
+def get_api_endpoint_status_and_data(client, url, json_response=True, timeout=60, maxAttempts=None):
+    data = None
     try:
-        response = requests.get(url, headers=headers, timeout=60, verify=verify)
+        if maxAttempts is None:
+            response = client.get(url, timeout=timeout)
+        else:
+            response = client.get(url, timeout=timeout, maxAttempts=maxAttempts)
         if response.status_code == 200 and json_response is True:
             try:
-                status = response.json()['status']
+                data = response.json()
+                status = data['status']
             except Exception as e:
                 status = e
         elif response.status_code == 200 and json_response is False:
@@ -32,6 +49,11 @@ def check_api_endpoint(url, headers, verify=True, json_response=True):
     except Exception as e:
         status = e
 
+    return status, data
+
+
+def check_api_endpoint(client, url, json_response=True):
+    status, data = get_api_endpoint_status_and_data(client, url, json_response=json_response)
     return status
 
 
@@ -101,6 +123,51 @@ def list_to_string(lst):
     return string
 
 
+# Downloads the Dataverse JSON metadata of each version of a dataset into dataverseJsonMetadataDirectory.
+# Returns True if the metadata was saved and False if the installation didn't return it
+def save_dataverse_json_metadata(client, installationUrl, datasetPid, dataverseJsonMetadataDirectory):
+    latestVersionEndpointUrl = f'{installationUrl}/api/datasets/:persistentId?persistentId={datasetPid}'
+    response = client.get(latestVersionEndpointUrl)
+    latestVersionMetadata = response.json()
+    if latestVersionMetadata['status'] != 'OK':
+        return False
+
+    persistentUrl = latestVersionMetadata['data']['persistentUrl']
+    publisher = latestVersionMetadata['data']['publisher']
+    publicationDate = latestVersionMetadata['data']['publicationDate']
+    metadataLanguage = improved_get(latestVersionMetadata, 'data.metadataLanguage')
+
+    allVersionUrl = f'{installationUrl}/api/datasets/:persistentId/versions?persistentId={datasetPid}'
+    response = client.get(allVersionUrl)
+    allVersionsMetadata = response.json()
+
+    for datasetVersion in allVersionsMetadata['data']:
+        datasetVersion = {
+            'status': latestVersionMetadata['status'],
+            'data': {
+                'persistentUrl': persistentUrl,
+                'publisher': publisher,
+                'publicationDate': publicationDate,
+                'datasetVersion': datasetVersion}}
+
+        # If there's a metadatalanguage, add it to the datasetVersion['data'] dict
+        if metadataLanguage is not None:
+            datasetVersion['data']['metadataLanguage'] = metadataLanguage
+
+        majorversion = str(datasetVersion['data']['datasetVersion']['versionNumber'])
+        minorversion = str(datasetVersion['data']['datasetVersion']['versionMinorNumber'])
+        versionNumber = majorversion + '.' + minorversion
+
+        datasetPidForFile = datasetPid.replace(':', '_').replace('/', '_')
+        metadataFile = dataverseJsonMetadataDirectory + '/' + f'{datasetPidForFile}_v{versionNumber}.json'
+
+        # Write the JSON to the new file
+        with open(metadataFile, mode='w') as f3:
+            f3.write(json.dumps(datasetVersion, indent=4))
+
+    return True
+
+
 # Get directory that this Python script is in
 currrentWorkingDirectory = os.getcwd()
 
@@ -112,16 +179,46 @@ emailAddress = 'juliangautier@g.harvard.edu'
 # Enter name of CSV file containing list of API keys for installations that require one to use certain API endpoints
 apiKeysFilePath = str(Path(currrentWorkingDirectory + '/' + 'dvinstallations_extra_info.csv'))
 
+# Set to True to get only the datasets published or updated since each installation's last harvest and merge them
+# into that harvest's CSV file of dataset PIDs. Watermarks of the last harvests are saved in the directory of this script
+incrementalHarvest = False
+searchApiWatermarksFilePath = str(Path(currrentWorkingDirectory + '/' + searchApiWatermarksFileName))
+
+# Number of installations checked at the same time by the probe stage, and the connect and read timeouts of each
+# check. Set probeOnly to True to only check the installations and save their status table
+probeWorkerCount = 64
+probeTimeout = (10, 30)
+probeOnly = False
+
+# Number of installations crawled at the same time, and number of threads that download the dataset metadata of all
+# installations being crawled, with at most hostDownloadConcurrency downloads at the same time from each installation.
+# Each installation keeps at most maxPendingDownloadsPerInstallation downloads waiting for a thread
+installationWorkerCount = 16
+downloadWorkerCount = 64
+hostDownloadConcurrency = 8
+maxPendingDownloadsPerInstallation = 500
+
 headers = {
     'User-Agent': userAgent,
     'From': emailAddress}
 
-# Save current time for folder and file timestamps
-currentTime = time.strftime('%Y.%m.%d_%H.%M.%S')
+# Open the journal that records the crawl's progress. If the last crawl stopped before it finished, e.g. because
+# the script crashed or lost its network connection, this crawl picks up where the last one stopped
+crawlJournalFilePath = str(Path(currrentWorkingDirectory + '/' + 'all_installation_metadata_crawl_journal.jsonl'))
+journal = crawlJournal(crawlJournalFilePath)
 
-# Create the main directory that will store a directory for each installation
-allInstallationsMetadataDirectory = str(Path(currrentWorkingDirectory + '/' + f'all_installation_metadata_{currentTime}'))
-os.mkdir(allInstallationsMetadataDirectory)
+if journal.runDirectory is not None and os.path.isdir(journal.runDirectory):
+    allInstallationsMetadataDirectory = journal.runDirectory
+    print(f'Resuming the crawl saved in {allInstallationsMetadataDirectory}')
+
+else:
+    # Save current time for folder and file timestamps
+    currentTime = time.strftime('%Y.%m.%d_%H.%M.%S')
+
+    # Create the main directory that will store a directory for each installation
+    allInstallationsMetadataDirectory = str(Path(currrentWorkingDirectory + '/' + f'all_installation_metadata_{currentTime}'))
+    os.mkdir(allInstallationsMetadataDirectory)
+    journal.start_run(allInstallationsMetadataDirectory)
 
 # Read CSV file containing apikeys into a dataframe and convert to list to compare each installation name
 apiKeysDF = pd.read_csv(apiKeysFilePath).set_index('hostname')
@@ -140,131 +237,191 @@ with open(mapdataFilePath, 'r') as f1:
 
 countOfInstallations = len(mapdata['installations'])
 
-installationProgressCount = 1
 
-for installation in mapdata['installations']:
-    installationName = installation['name']
+# Function for getting the API key of an installation, if it's in the dataframe of API keys, to use the
+# installation's endpoints that require an API key
+def get_installation_api_key(hostname):
+    if hostname in installationsRequiringApiKeyList:
+        apiKeyDF = apiKeysDF[apiKeysDF.index == hostname]
+        return apiKeyDF.iloc[0]['apikey']
+    return ''
+
+
+# Columns of the status table written by the probe stage
+installationStatusColumns = [
+    'installation_name', 'hostname', 'installation_url', 'reachable', 'installation_status', 'latency_ms',
+    'version_api_status', 'dataverse_version', 'search_api_status', 'dataset_count', 'test_dataset_pid',
+    'get_dataset_json_api_status', 'metadatablocks_api_status', 'probed_at']
+
+
+# Function for checking if an installation can be reached and if the APIs that the crawl uses work, returning the
+# installation's row of the status table. Each call is tried once with probeTimeout, so that an installation
+# that's down costs only one timeout
+def probe_installation(installation):
     hostname = installation['hostname']
-    
-    print(f'\nChecking {installationProgressCount} of {countOfInstallations} installations: {installationName}')
+    status = dict.fromkeys(installationStatusColumns, 'NA')
+    status['installation_name'] = installation['name']
+    status['hostname'] = hostname
+    status['reachable'] = False
+    status['probed_at'] = time.strftime('%Y.%m.%d_%H.%M.%S')
+
+    client = installationClient(
+        f'https://{hostname}', apiKey=get_installation_api_key(hostname), headers=headers, poolSize=2, verify=False)
 
     try:
-        installationUrl = f'https://{hostname}'
-        response = requests.get(installationUrl, headers=headers, timeout=60, verify=False)
-        installationStatus = response.status_code
-        # If there's one or more redirects, get the url of the final redirect
-        if response.history:
-            installationUrl = response.url
-    
-    except Exception as e:
-        installationStatus = e
+        # Try https and then http
+        for installationUrl in (f'https://{hostname}', f'http://{hostname}'):
+            startTime = time.time()
+            try:
+                response = client.get(installationUrl, timeout=probeTimeout, maxAttempts=1)
+                installationStatus = response.status_code
+                # If there's one or more redirects, get the url of the final redirect
+                if response.history:
+                    installationUrl = response.url
+            except Exception as e:
+                installationStatus = e
+            status['latency_ms'] = round((time.time() - startTime) * 1000)
+
+            if installationStatus == 200:
+                break
+
+        status['installation_url'] = installationUrl
+        status['installation_status'] = installationStatus
+        if installationStatus != 200:
+            return status
+        status['reachable'] = True
+
+        # Use the "Get Version" endpoint to get installation's Dataverse version
+        getInstallationVersionApiUrl = f'{installationUrl}/api/v1/info/version'.replace('//api', '/api')
+        status['version_api_status'], getInstallationVersionApiData = get_api_endpoint_status_and_data(
+            client, getInstallationVersionApiUrl, timeout=probeTimeout, maxAttempts=1)
+        if status['version_api_status'] == 'OK':
+            status['dataverse_version'] = str(getInstallationVersionApiData['data']['version'].lstrip('v'))
+
+        # Check if Search API works, and get the count of local (non-harvested) datasets and the PID of one of them
+        searchApiUrl = f'{installationUrl}/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=1&sort=date&order=desc'
+        searchApiUrl = searchApiUrl.replace('//api', '/api')
+        status['search_api_status'], searchApiData = get_api_endpoint_status_and_data(
+            client, searchApiUrl, timeout=probeTimeout, maxAttempts=1)
+        if status['search_api_status'] == 'OK':
+            status['dataset_count'] = searchApiData['data']['total_count']
+            if searchApiData['data']['items']:
+                status['test_dataset_pid'] = searchApiData['data']['items'][0]['global_id']
+
+        # If a local dataset PID can be retrieved, check if "Get dataset JSON" metadata export endpoints works
+        if status['test_dataset_pid'] != 'NA':
+            getJsonApiUrl = f'{installationUrl}/api/v1/datasets/:persistentId/?persistentId={status["test_dataset_pid"]}'
+            getJsonApiUrl = getJsonApiUrl.replace('//api', '/api')
+            status['get_dataset_json_api_status'], getJsonApiData = get_api_endpoint_status_and_data(
+                client, getJsonApiUrl, timeout=probeTimeout, maxAttempts=1)
 
-    if installationStatus != 200:
+        # Check API endpoint for getting metadatablock data
+        metadatablocksApiEndpointUrl = f'{installationUrl}/api/v1/metadatablocks'.replace('//api', '/api')
+        status['metadatablocks_api_status'], metadatablockData = get_api_endpoint_status_and_data(
+            client, metadatablocksApiEndpointUrl, timeout=probeTimeout, maxAttempts=1)
 
-        try:
-            installationUrl = f'http://{hostname}'
-            response = requests.get(installationUrl, headers=headers, timeout=60, verify=False)
-            installationStatus = response.status_code
-            # If there's one or more redirects, get the url of the final redirect
-            if response.history:
-                installationUrl = response.url
+    finally:
+        client.close()
 
-        except Exception as e:
-            installationStatus = e
+    return status
 
-    print(f'\tInstallation status for {installationUrl}: ' + str(installationStatus))
 
-    # If there's a good response from the installation, check if Search API works by searching for installation's non-harvested datasets
-    if installationStatus == 200:
+# Function for reading the status table written by the probe stage into a dict of each installation's row, keyed
+# by hostname, with the reachable and dataset_count columns converted back from text
+def read_installation_status_table(installationStatusFilePath):
+    installationStatuses = {}
+    with open(installationStatusFilePath, mode='r', encoding='utf-8', newline='') as f:
+        for status in DictReader(f):
+            status['reachable'] = status['reachable'] == 'True'
+            if status['dataset_count'].isdigit():
+                status['dataset_count'] = int(status['dataset_count'])
+            installationStatuses[status['hostname']] = status
+    return installationStatuses
 
-        # If the installation is in the dataframe of API keys, add API key to header dictionary
-        # to use installation's endpoints that require an API key
-        if hostname in installationsRequiringApiKeyList:
-            apiKeyDF = apiKeysDF[apiKeysDF.index == hostname]
-            apiKey = apiKeyDF.iloc[0]['apikey']
-            headers['X-Dataverse-key'] = apiKey
 
-        # Otherwise remove any API key from the header dictionary
-        else:
-            headers.pop('X-Dataverse-key', None)
-
-        # Use the "Get Version" endpoint to get installation's Dataverse version (or set version as 'NA')
-        getInstallationVersionApiUrl = f'{installationUrl}/api/v1/info/version'
-        getInstallationVersionApiUrl = getInstallationVersionApiUrl.replace('//api', '/api')
-        getInstallationVersionApiStatus = check_api_endpoint(getInstallationVersionApiUrl, headers, verify=False, json_response=True)
-
-        if getInstallationVersionApiStatus == 'OK':
-            response = requests.get(getInstallationVersionApiUrl, headers=headers, timeout=20, verify=False)
-            getInstallationVersionApiData = response.json()
-            dataverseVersion = getInstallationVersionApiData['data']['version']
-            dataverseVersion = str(dataverseVersion.lstrip('v'))
-        else:
-            dataverseVersion = 'NA'
+# Function for crawling one installation: checking its APIs and downloading its metadatablocks, dataset PIDs and
+# dataset metadata, using the installation's row of the status table written by the probe stage. Dataset metadata
+# is downloaded by downloadScheduler, together with the downloads of the other installations being crawled
+def crawl_installation(installation, status):
+    installationName = installation['name']
+    hostname = installation['hostname']
 
-        print(f'\tDataverse version: {dataverseVersion}')
+    # Function for printing a message about the installation. Messages start with the installation's name, since
+    # they're printed in between the messages about the other installations being crawled
+    def log(message):
+        sys.stdout.write(f'{installationName}: {message}\n')
+        sys.stdout.flush()
 
-        # Check if Search API works for the installation
-        searchApiUrl = f'{installationUrl}/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page=1&sort=date&order=desc'
-        searchApiUrl = searchApiUrl.replace('//api', '/api')
-        searchApiStatus = check_api_endpoint(searchApiUrl, headers, verify=False, json_response=True)
+    log('Crawling installation')
 
-        # If Search API works, from Search API query results, get count of local (non-harvested) datasets
-        if searchApiStatus == 'OK':
-            response = requests.get(searchApiUrl, headers=headers, timeout=20, verify=False)
-            searchApiData = response.json()
-            datasetCount = searchApiData['data']['total_count']
-        else:
-            datasetCount = 'NA'
-        print(f'\n\tSearch API status: {searchApiStatus}')
+    # Get the installation's API key, if it has one, to use endpoints that require an API key
+    apiKey = get_installation_api_key(hostname)
 
-        # Report if the installation has no published, non-harvested datasets
-        if datasetCount == 0:
-            print('\nInstallation has 0 published, non-harvested datasets')
+    # Create a client that keeps its connections to the installation open for all of the installation's API calls.
+    # The client retries calls that fail for reasons that might not last, like 502 and 503 responses, so that a few
+    # of those don't mark the installation as broken
+    client = installationClient(
+        f'https://{hostname}', apiKey=apiKey, headers=headers, poolSize=hostDownloadConcurrency + 2, verify=False)
 
-        # If there are local published datasets, get the PID of a local dataset (used later to check endpoints for getting dataset metadata)
-        if datasetCount != 'NA' and datasetCount > 0:
-            testDatasetPid = searchApiData['data']['items'][0]['global_id']
-        else:
-            testDatasetPid = 'NA'
+    # Use what the probe stage found out about the installation
+    installationUrl = status['installation_url']
+    log(f'Installation status for {installationUrl}: ' + str(status['installation_status']))
 
-        # If a local dataset PID can be retreived, check if "Get dataset JSON" metadata export endpoints works
-        if testDatasetPid != 'NA':
-            getJsonApiUrl = f'{installationUrl}/api/v1/datasets/:persistentId/?persistentId={testDatasetPid}'
-            getJsonApiUrl = getJsonApiUrl.replace('//api', '/api')
-            getDataverseJsonApiStatus = check_api_endpoint(getJsonApiUrl, headers, verify=False, json_response=True)
+    # If there's a good response from the installation, download what the installation's working APIs allow
+    if status['reachable'] is True:
+        dataverseVersion = status['dataverse_version']
+        datasetCount = status['dataset_count']
+        getDataverseJsonApiStatus = status['get_dataset_json_api_status']
 
-        else:
-            getDataverseJsonApiStatus = 'NA'
-        print(f'\t"Get dataset JSON" API status: {getDataverseJsonApiStatus}')
+        log(f'Dataverse version: {dataverseVersion}')
+        log(f'Search API status: {status["search_api_status"]}')
+
+        # Report if the installation has no published, non-harvested datasets
+        if datasetCount == 0:
+            log('Installation has 0 published, non-harvested datasets')
+
+        log(f'"Get dataset JSON" API status: {getDataverseJsonApiStatus}')
 
         # If the "Get dataset JSON" endpoint works, download the installation's metadatablock JSON files, dataset PIDs, and dataset metadata
 
         if getDataverseJsonApiStatus == 'OK':
 
-            # Save time and date when script started downloading from the installation to append it to the installation's directory and files
-            currentTime = time.strftime('%Y.%m.%d_%H.%M.%S')
+            # If the installation was started before the crawl was restarted, keep using its directory and files
+            installationFiles = journal.get_installation_files(hostname)
+
+            if installationFiles is None:
+                # Save time and date when script started downloading from the installation to append it to the installation's directory and files
+                currentTime = time.strftime('%Y.%m.%d_%H.%M.%S')
+
+                # Create directory for the installation
+                installationDirectory = allInstallationsMetadataDirectory + '/' + installationName.replace(' ', '_') + f'_{currentTime}'
+                os.mkdir(installationDirectory)
+
+                installationFiles = {
+                    'installationDirectory': installationDirectory,
+                    'datasetPidsFile': installationDirectory + '/' + f'dataset_pids_{installationName}_{currentTime}.csv',
+                    'dataverseJsonMetadataDirectory': installationDirectory + '/' + 'Dataverse_JSON_metadata' + f'_{currentTime}'}
+                journal.start_installation(hostname, installationFiles)
 
-            # Create directory for the installation
-            installationDirectory = allInstallationsMetadataDirectory + '/' + installationName.replace(' ', '_') + f'_{currentTime}'
-            os.mkdir(installationDirectory)
+            installationDirectory = installationFiles['installationDirectory']
 
             # Check if endpoint for getting installation's metadatablock files works and if so save metadatablock files
             # in a directory
 
-            # Check API endpoint for getting metadatablock data
+            # Get the status of the API endpoint for getting metadatablock data
             metadatablocksApiEndpointUrl = f'{installationUrl}/api/v1/metadatablocks'
             metadatablocksApiEndpointUrl = metadatablocksApiEndpointUrl.replace('//api', '/api')
-            getMetadatablocksApiStatus = check_api_endpoint(metadatablocksApiEndpointUrl, headers, verify=False, json_response=True)
+            getMetadatablocksApiStatus = status['metadatablocks_api_status']
 
             # If API endpoing for getting metadatablock files works...
             if getMetadatablocksApiStatus == 'OK':        
 
                 # Create a directory for the installation's metadatablock files
                 metadatablockFileDirectoryPath = installationDirectory + '/' + f'metadatablocks_v{dataverseVersion}'
-                os.mkdir(metadatablockFileDirectoryPath)
+                os.makedirs(metadatablockFileDirectoryPath, exist_ok=True)
 
                 # Download metadatablock JSON files
-                response = requests.get(metadatablocksApiEndpointUrl, headers=headers, timeout=20, verify=False)
+                response = client.get(metadatablocksApiEndpointUrl, timeout=20)
                 metadatablockData = response.json()
 
                 # Get list of the installation's metadatablock names
@@ -273,11 +430,11 @@ for installation in mapdata['installations']:
                     metadatablockName = i['name']
                     metadatablockNames.append(metadatablockName)
 
-                print('\n\tDownloading metadatablock JSON files into metadatablocks folder')
+                log('Downloading metadatablock JSON files into metadatablocks folder')
 
                 for metadatablockName in metadatablockNames:
                     metadatablockApiEndpointUrl = f'{metadatablocksApiEndpointUrl}/{metadatablockName}'
-                    response = requests.get(metadatablockApiEndpointUrl, headers=headers, timeout=20, verify=False)
+                    response = client.get(metadatablockApiEndpointUrl, timeout=20)
                     metadata = response.json()
 
                     # If the metadatablock has fields, download the metadatablock data into a JSON file
@@ -293,178 +450,230 @@ for installation in mapdata['installations']:
             # endpoint to get those datasets' metadata
 
             # Create CSV file
-            datasetPidsFile = installationDirectory + '/' + f'dataset_pids_{installationName}_{currentTime}.csv'
-
-            with open(datasetPidsFile, mode='w', newline='') as f1:
-                f1 = csv.writer(f1, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                f1.writerow(['persistent_id', 'persistent_url', 'dataverse_name', 'dataverse_alias'])
-
-            # Create dataframe to record if Dataverse JSON metadata for each dataset was retrieved or not
-            columnNames = ['persistent_id', 'dataverse_json_export_saved']
-            dataverseJsonExportSavedDF = pd.DataFrame(columns=columnNames)
-
-            # Use Search API to get installation's dataset info and write it to a CSV file
-            print(f'\n\tSaving info of {datasetCount} dataset(s) to CSV file:')
-
-            # Initialization for paginating through Search API results and showing progress
-            start = 0
-            condition = True
-            datasetPidCount = 0
-
-            # Create variable for storing count of misindexed datasets
-            misindexedDatasetsCount = 0
-
-            with open(datasetPidsFile, mode='a', encoding='utf-8', newline='') as f1:
-                f1 = csv.writer(f1, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-                while (condition):
-                    try:
-                        perPage = 10
-                        url = f'{installationUrl}/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page={perPage}&start={start}&sort=date&order=desc'
-                        response = requests.get(url, headers=headers, verify=False)
-                        data = response.json()
+            datasetPidsFile = installationFiles['datasetPidsFile']
+            datasetPidsFileColumns = ['persistent_id', 'persistent_url', 'dataverse_name', 'dataverse_alias']
+
+            searchApiUrl = f'{installationUrl}/api/v1/search'.replace('//api', '/api')
+            searchApiParams = {
+                'q': '*', 'fq': '-metadataSource:"Harvested"', 'type': 'dataset', 'sort': 'date', 'order': 'desc'}
+
+            # Function for getting the row of the CSV file for a dataset in the Search API results
+            def get_dataset_row(i):
+                return {
+                    'persistent_id': i['global_id'],
+                    'persistent_url': i['url'],
+                    'dataverse_name': i.get('name_of_dataverse', 'NA'),
+                    'dataverse_alias': i.get('identifier_of_dataverse', 'NA')}
+
+            # Get the watermark of the installation's last harvest, if there is one and incremental harvests are on
+            lastHarvest = None
+            if incrementalHarvest is True:
+                lastHarvest = get_search_api_watermark(searchApiWatermarksFilePath, hostname)
+                if lastHarvest is not None and (
+                        lastHarvest['watermark'] is None or not os.path.isfile(lastHarvest['inventory_file'])):
+                    lastHarvest = None
+
+            # Create list for storing the Search API start offsets of misindexed datasets
+            misindexedDatasetOffsets = []
+
+            # PIDs of the datasets whose Dataverse JSON metadata should be downloaded. None means all datasets
+            datasetPidsToDownload = None
+
+            # Get how far the crawl got through the installation's Search API results before it was restarted
+            searchApiProgress = journal.get_search_api_progress(hostname) or {}
+            if searchApiProgress.get('newestItemDate'):
+                newestItemDate = parse(searchApiProgress['newestItemDate'])
+            else:
+                newestItemDate = None
+            misindexedDatasetOffsets.extend(searchApiProgress.get('misindexedDatasetOffsets', []))
+
+            # If the dataset info was saved before the crawl was restarted, use the saved CSV file
+            if journal.is_search_api_finished(hostname):
+                if searchApiProgress.get('datasetPidsToDownload') is not None:
+                    datasetPidsToDownload = set(searchApiProgress['datasetPidsToDownload'])
+                log('Info of datasets was saved to CSV file before the crawl was restarted')
+
+            # If the installation was harvested before, get only the datasets published or updated since then
+            # and merge them into the last harvest's CSV file
+            elif lastHarvest is not None:
+                newestItemDate = parse(lastHarvest['watermark'])
+                log(f'Saving info of datasets published or updated since {lastHarvest["watermark"]} to CSV file:')
+
+                newRows = []
+                for i in get_search_api_items_newer_than(
+                        searchApiUrl, searchApiParams, newestItemDate, client, misindexedDatasetOffsets):
+                    newRows.append(get_dataset_row(i))
+                    itemDate = get_search_api_item_date(i)
+                    if itemDate is not None and itemDate > newestItemDate:
+                        newestItemDate = itemDate
+
+                datasetPidCount = merge_rows_into_csv_file(
+                    lastHarvest['inventory_file'], newRows, 'persistent_id', datasetPidsFile)
+                datasetPidsToDownload = set(row['persistent_id'] for row in newRows)
+
+                log(f'Info of {len(newRows)} new or updated dataset(s) merged into the info of {datasetPidCount} dataset(s) in CSV file')
+
+                journal.record_search_api_progress(hostname, {
+                    'newestItemDate': newestItemDate.isoformat(),
+                    'datasetPidsToDownload': sorted(datasetPidsToDownload),
+                    'misindexedDatasetOffsets': misindexedDatasetOffsets})
+                journal.finish_search_api(hostname)
+
+            # Otherwise use Search API to get all of the installation's dataset info and write it to a CSV file
+            else:
+                log(f'Saving info of {datasetCount} dataset(s) to CSV file:')
+
+                # Initialization for paginating through Search API results and showing progress.
+                # Start with the most results the Search API returns per call, at the page the crawl got to before it
+                # was restarted, if any
+                start = searchApiProgress.get('start', 0)
+                perPage = 1000
+                datasetPidCount = searchApiProgress.get('datasetPidCount', 0)
+
+                # If the crawl was restarted, cut off any rows written after the last recorded page and add to the CSV file
+                if start > 0:
+                    os.truncate(datasetPidsFile, searchApiProgress['fileSize'])
+                    log(f'Resuming at dataset {start}')
+
+                with open(datasetPidsFile, mode='a' if start > 0 else 'w', encoding='utf-8', newline='') as datasetPidsCsvFile:
+                    f1 = csv.DictWriter(datasetPidsCsvFile, fieldnames=datasetPidsFileColumns, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                    if start == 0:
+                        f1.writeheader()
+
+                    while start < datasetCount:
+                        # Get the page's datasets. If misindexed datasets break the Search API call, the page is split
+                        # until the misindexed datasets are found (See https://github.com/IQSS/dataverse/issues/4225)
+                        items, pageMisindexedOffsets = get_search_api_page_items(
+                            searchApiUrl, searchApiParams, start, perPage, client)
+                        misindexedDatasetOffsets.extend(pageMisindexedOffsets)
 
                         # For each dataset, write the dataset info to the CSV file
-                        for i in data['data']['items']:
-                            persistentId = i['global_id']
-                            persistentUrl = i['url']
-                            dataverseName = i.get('name_of_dataverse', 'NA')
-                            dataverseAlias = i.get('identifier_of_dataverse', 'NA')
+                        for i in items:
+                            f1.writerow(get_dataset_row(i))
 
-                            # Create new row with dataset and file info
-                            f1.writerow([persistentId, persistentUrl, dataverseName, dataverseAlias])
+                            # Keep track of the newest dataset, whose date is saved as the installation's watermark
+                            itemDate = get_search_api_item_date(i)
+                            if itemDate is not None and (newestItemDate is None or itemDate > newestItemDate):
+                                newestItemDate = itemDate
 
                             datasetPidCount += 1
-                            print(f'\t\t{datasetPidCount} of {datasetCount}', end='\r', flush=True)
 
                         # Update variables to paginate through the search results
                         start = start + perPage
 
-                    # Print error message if misindexed datasets break the Search API call, and try the next page.
-                    # See https://github.com/IQSS/dataverse/issues/4225
-                    except Exception:
-                        print('\t\tper_page=10 url broken. Checking per_page=1')
-                        try:
-                            perPage = 1
-                            url = f'{installationUrl}/api/v1/search?q=*&fq=-metadataSource:"Harvested"&type=dataset&per_page={perPage}&start={start}&sort=date&order=desc'
-                            response = requests.get(url, headers=headers, timeout=20, verify=False)
-                            data = response.json()
-
-                            # For each dataset, write the dataset info to the CSV file
-                            for i in data['data']['items']:
-                                persistentId = i['global_id']
-                                persistentUrl = i['url']
-                                dataverseName = i.get('name_of_dataverse', 'NA')
-                                dataverseAlias = i.get('identifier_of_dataverse', 'NA')
+                        # Record the page the crawl got to and the size of the CSV file in bytes after the page's rows.
+                        # The rows are synced to disk first, so that the journal never points past what the file has
+                        datasetPidsCsvFile.flush()
+                        os.fsync(datasetPidsCsvFile.fileno())
+                        journal.record_search_api_progress(hostname, {
+                            'start': start,
+                            'fileSize': os.fstat(datasetPidsCsvFile.fileno()).st_size,
+                            'datasetPidCount': datasetPidCount,
+                            'newestItemDate': newestItemDate.isoformat() if newestItemDate is not None else None,
+                            'misindexedDatasetOffsets': misindexedDatasetOffsets})
 
-                                # Create new row with dataset and file info
-                                f1.writerow([persistentId, persistentUrl, dataverseName, dataverseAlias])
+                    log(f'Info of {datasetPidCount} dataset(s) written to CSV file')
 
-                                datasetPidCount += 1
-                                print(f'\t\t{datasetPidCount} of {datasetCount}', end='\r', flush=True)
+                journal.finish_search_api(hostname)
 
-                                # Update variables to paginate through the search results
-                                start = start + perPage
-
-                        except Exception:
-                            misindexedDatasetsCount += 1
-                            start = start + perPage
-
-                    # Stop paginating when there are no more results
-                    condition = start < datasetCount
-
-                print(f'\n\tInfo of {datasetCount} dataset(s) written to CSV file')
-
-            if misindexedDatasetsCount:
-
-                # Create txt file and list 
-                print(f'\n\n\tUnretrievable dataset PIDs due to misindexing: {misindexedDatasetsCount}\n')
+            if misindexedDatasetOffsets:
+                log(f'Unretrievable dataset PIDs due to misindexing: {len(misindexedDatasetOffsets)}')
 
             # Create directory for dataset JSON metadata
-            dataverseJsonMetadataDirectory = installationDirectory + '/' + 'Dataverse_JSON_metadata' + f'_{currentTime}'
-            os.mkdir(dataverseJsonMetadataDirectory)
+            dataverseJsonMetadataDirectory = installationFiles['dataverseJsonMetadataDirectory']
+            os.makedirs(dataverseJsonMetadataDirectory, exist_ok=True)
+
+            # Get the PIDs of datasets whose metadata was saved before the crawl was restarted
+            savedDatasetPids = journal.get_saved_pids(hostname)
 
             # For each dataset PID in CSV file, download dataset's Dataverse JSON metadata
-            print('\n\tDownloading Dataverse JSON metadata to Dataverse_JSON_metadata folder:')
+            log('Downloading Dataverse JSON metadata to Dataverse_JSON_metadata folder')
 
             # Initiate counts for progress indicator
             dataverseJsonmMetadataDownloadedCount = 0
             dataverseJsonMetadataNotDownloaded = []
-
-            # For each dataset persistent identifier in the CSV file, download the dataset's Dataverse JSON file into the metadata folder
+            dataverseJsonExportSavedLists = []
+
+            # PIDs of saved metadata that haven't been recorded in the journal yet. They're recorded in batches of
+            # savedPidsBatchSize instead of one at a time
+            unrecordedSavedPids = []
+            savedPidsBatchSize = 1000
+
+            # Function for recording the result of a download
+            def record_download(datasetPid, download):
+                nonlocal dataverseJsonmMetadataDownloadedCount
+                try:
+                    dataverseJsonExportSaved = download.result()
+                except Exception:
+                    dataverseJsonExportSaved = False
+
+                if dataverseJsonExportSaved is True:
+                    dataverseJsonmMetadataDownloadedCount += 1
+                    unrecordedSavedPids.append(datasetPid)
+                    if len(unrecordedSavedPids) >= savedPidsBatchSize:
+                        journal.record_saved_pids(hostname, unrecordedSavedPids)
+                        unrecordedSavedPids.clear()
+                else:
+                    dataverseJsonMetadataNotDownloaded.append(datasetPid)
+                dataverseJsonExportSavedLists.append([datasetPid, dataverseJsonExportSaved])
+
+            # For each dataset persistent identifier in the CSV file, have the scheduler download the dataset's
+            # Dataverse JSON file into the metadata folder. Only a limited number of downloads are kept waiting,
+            # so that the downloads of big installations don't pile up in memory
+            pendingDownloads = {}
             with open(datasetPidsFile, mode='r', encoding='utf-8') as f2:
                 csvDictReader = DictReader(f2, delimiter=',')
 
-                dataverseJsonExportSavedLists = []
-
                 for row in csvDictReader:
                     datasetPid = row['persistent_id'].rstrip()
 
-                    # Get the Dataverse JSON metadata of each version of the dataset
-                    try:
-                        latestVersionEndpointUrl = f'{installationUrl}/api/datasets/:persistentId?persistentId={datasetPid}'
-                        response = requests.get(latestVersionEndpointUrl, headers=headers, verify=False)
-                        latestVersionMetadata = response.json()
-                        if latestVersionMetadata['status'] == 'OK':
-                            persistentUrl = latestVersionMetadata['data']['persistentUrl']
-                            publisher = latestVersionMetadata['data']['publisher']
-                            publicationDate = latestVersionMetadata['data']['publicationDate']
-                            metadataLanguage = improved_get(latestVersionMetadata, 'data.metadataLanguage')
-
-                            allVersionUrl = f'{installationUrl}/api/datasets/:persistentId/versions?persistentId={datasetPid}'
-                            response = requests.get(allVersionUrl, headers=headers, verify=False)
-                            allVersionsMetadata = response.json()
-
-                            for datasetVersion in allVersionsMetadata['data']:
-                                datasetVersion = {
-                                    'status': latestVersionMetadata['status'],
-                                    'data': {
-                                        'persistentUrl': persistentUrl,
-                                        'publisher': publisher,
-                                        'publicationDate': publicationDate,
-                                        'datasetVersion': datasetVersion}}
-
-                                # If there's a metadatalanguage, add it to the datasetVersion['data'] dict
-                                if metadataLanguage is not None:
-                                    datasetVersion['data']['metadataLanguage'] = metadataLanguage
-
-                                majorversion = str(datasetVersion['data']['datasetVersion']['versionNumber'])
-                                minorversion = str(datasetVersion['data']['datasetVersion']['versionMinorNumber'])
-                                versionNumber = majorversion + '.' + minorversion
-
-                                datasetPidForFile = datasetPid.replace(':', '_').replace('/', '_')
-                                metadataFile = dataverseJsonMetadataDirectory + '/' + f'{datasetPidForFile}_v{versionNumber}.json'
-
-                                # Write the JSON to the new file
-                                with open(metadataFile, mode='w') as f3:
-                                    f3.write(json.dumps(datasetVersion, indent=4))
-
-                            # Increase count variable to track progress
-                            dataverseJsonmMetadataDownloadedCount += 1
-                            dataverseJsonExportSaved = True
-
-                        # Print progress
-                        print(f'\t\tDownloaded Dataverse JSON metadata of {dataverseJsonmMetadataDownloadedCount} of {datasetCount} datasets', end='\r', flush=True)
-
-                    except Exception:
-                        dataverseJsonMetadataNotDownloaded.append(datasetPid)
-                        dataverseJsonExportSaved = False
-
-                    dataverseJsonExportSavedDF.loc[len(dataverseJsonExportSavedDF.index)] = [datasetPid, dataverseJsonExportSaved]
-
-                print(f'\t\tDownloaded Dataverse JSON metadata of {dataverseJsonmMetadataDownloadedCount} of {datasetCount} datasets')
-
-                if dataverseJsonMetadataNotDownloaded:
-                    print(f'\t\tThe Dataverse JSON metadata of the following {len(dataverseJsonMetadataNotDownloaded)} dataset(s) could not be downloaded:')
-                    dataverseJsonMetadataNotDownloadedString = list_to_string(dataverseJsonMetadataNotDownloaded)
-                    print(f'\t\t{dataverseJsonMetadataNotDownloadedString}')
+                    # In incremental harvests, download only the metadata of new or updated datasets
+                    if datasetPidsToDownload is not None and datasetPid not in datasetPidsToDownload:
+                        continue
+
+                    # Skip datasets whose metadata was saved before the crawl was restarted
+                    if datasetPid in savedDatasetPids:
+                        dataverseJsonmMetadataDownloadedCount += 1
+                        dataverseJsonExportSavedLists.append([datasetPid, True])
+                        continue
+
+                    download = downloadScheduler.submit(
+                        hostname, save_dataverse_json_metadata,
+                        client, installationUrl, datasetPid, dataverseJsonMetadataDirectory)
+                    pendingDownloads[download] = datasetPid
 
+                    if len(pendingDownloads) >= maxPendingDownloadsPerInstallation:
+                        doneDownloads, notDoneDownloads = wait(pendingDownloads, return_when=FIRST_COMPLETED)
+                        for download in doneDownloads:
+                            record_download(pendingDownloads.pop(download), download)
+
+            for download in as_completed(list(pendingDownloads)):
+                record_download(pendingDownloads.pop(download), download)
+            journal.record_saved_pids(hostname, unrecordedSavedPids)
+            unrecordedSavedPids.clear()
+
+            log(f'Downloaded Dataverse JSON metadata of {dataverseJsonmMetadataDownloadedCount} of {datasetCount} datasets')
+
+            if dataverseJsonMetadataNotDownloaded:
+                log(f'The Dataverse JSON metadata of the following {len(dataverseJsonMetadataNotDownloaded)} dataset(s) could not be downloaded:')
+                dataverseJsonMetadataNotDownloadedString = list_to_string(dataverseJsonMetadataNotDownloaded)
+                log(dataverseJsonMetadataNotDownloadedString)
+
+            # Create dataframe to record if Dataverse JSON metadata for each dataset was retrieved or not
+            columnNames = ['persistent_id', 'dataverse_json_export_saved']
+            dataverseJsonExportSavedDF = pd.DataFrame(dataverseJsonExportSavedLists, columns=columnNames)
             dataverseJsonExportSavedDF = dataverseJsonExportSavedDF.set_index('persistent_id')
 
             # Turn datasetPidsFile into a dataframe to join with dataverseJsonExportSavedDF
             datasetPidsFileDF = pd.read_csv(datasetPidsFile).set_index('persistent_id')
 
-            mergedFileDF = pd.merge(dataverseJsonExportSavedDF, datasetPidsFileDF, left_index=True, right_index=True).reset_index()
+            # In incremental harvests, keep what earlier harvests recorded for datasets that weren't downloaded again
+            if 'dataverse_json_export_saved' in datasetPidsFileDF.columns:
+                datasetPidsFileDF['dataverse_json_export_saved'].update(
+                    dataverseJsonExportSavedDF['dataverse_json_export_saved'])
+                mergedFileDF = datasetPidsFileDF.reset_index()
+            else:
+                mergedFileDF = pd.merge(dataverseJsonExportSavedDF, datasetPidsFileDF, left_index=True, right_index=True).reset_index()
 
             mergedFile = installationDirectory + '/' + f'dataset_pids_{installationName}_merged_file.csv'
             columnOrderList = [
@@ -473,7 +682,86 @@ for installation in mapdata['installations']:
             mergedFileDF = mergedFileDF[columnOrderList]
             mergedFileDF.to_csv(datasetPidsFile, index=False)
 
-    installationProgressCount += 1
+            # Save the installation's watermark so that the next incremental harvest gets only datasets
+            # published or updated since this one
+            if newestItemDate is not None:
+                save_search_api_watermark(searchApiWatermarksFilePath, hostname, newestItemDate, datasetPidsFile)
+
+    # Report how fast the installation's rate governor ended up letting the script call the installation's APIs
+    governorStatus = client.governor.get_status()
+    log(
+        f'API calls made at the same time: {governorStatus["concurrency"]}, '
+        f'calls per second: {governorStatus["requestsPerSecond"]}, '
+        f'error rate: {governorStatus["errorRate"]}')
+
+    journal.finish_installation(hostname)
+
+    client.close()
+
+
+# Probe stage: check every installation at the same time and save the results in a status table that the harvest
+# stage reads. If the crawl was restarted, use the status table saved before it was restarted
+installationStatusFilePath = allInstallationsMetadataDirectory + '/' + 'installation_status.csv'
+
+if os.path.isfile(installationStatusFilePath):
+    print('Using the installation status table saved before the crawl was restarted')
+else:
+    print(f'Checking {countOfInstallations} installations...')
+    with ThreadPoolExecutor(max_workers=probeWorkerCount) as executor:
+        installationStatusRows = list(executor.map(probe_installation, mapdata['installations']))
+
+    with open(installationStatusFilePath + '.tmp', mode='w', encoding='utf-8', newline='') as f:
+        installationStatusWriter = csv.DictWriter(f, fieldnames=installationStatusColumns)
+        installationStatusWriter.writeheader()
+        installationStatusWriter.writerows(installationStatusRows)
+    os.replace(installationStatusFilePath + '.tmp', installationStatusFilePath)
+
+installationStatuses = read_installation_status_table(installationStatusFilePath)
+reachableCount = sum(1 for status in installationStatuses.values() if status['reachable'] is True)
+print(f'{reachableCount} of {countOfInstallations} installations can be reached. Status table saved in {installationStatusFilePath}')
+
+# If only the probe stage should run, stop here. The next run uses the status table and starts the harvest stage
+if probeOnly is True:
+    sys.exit()
+
+# Harvest stage: skip installations that were finished before the crawl was restarted
+installationsToCrawl = [
+    installation for installation in mapdata['installations']
+    if not journal.is_installation_finished(installation['hostname'])]
+finishedInstallationCount = countOfInstallations - len(installationsToCrawl)
+if finishedInstallationCount:
+    print(f'{finishedInstallationCount} of {countOfInstallations} installations were checked before the crawl was restarted')
+
+# Start the biggest installations first, since they take the longest to crawl
+installationDatasetCounts = {}
+for installation in installationsToCrawl:
+    datasetCount = installationStatuses[installation['hostname']]['dataset_count']
+    installationDatasetCounts[installation['hostname']] = datasetCount if isinstance(datasetCount, int) else 0
+installationsToCrawl.sort(key=lambda installation: installationDatasetCounts[installation['hostname']], reverse=True)
+
+# Create the scheduler that downloads the dataset metadata of all installations being crawled. Each installation
+# gets its own budget of downloads at the same time, and a free download thread works on whichever installation
+# has the most datasets and is under its budget
+downloadScheduler = hostWorkScheduler(workerCount=downloadWorkerCount, hostConcurrency=hostDownloadConcurrency)
+for installation in installationsToCrawl:
+    downloadScheduler.set_host_priority(installation['hostname'], installationDatasetCounts[installation['hostname']])
+
+# Crawl installationWorkerCount installations at the same time, biggest first
+with ThreadPoolExecutor(max_workers=installationWorkerCount) as executor:
+    crawls = {
+        executor.submit(crawl_installation, installation, installationStatuses[installation['hostname']]): installation
+        for installation in installationsToCrawl}
+
+    for crawl in as_completed(crawls):
+        installationName = crawls[crawl]['name']
+        try:
+            crawl.result()
+        except Exception as e:
+            print(f'{installationName}: Crawl stopped by an error and will be retried when the script is restarted: {e}')
+        finishedInstallationCount += 1
+        print(f'Finished {finishedInstallationCount} of {countOfInstallations} installations', flush=True)
+
+downloadScheduler.shutdown()
 
     #         # Unfinished code for getting metadata from other metadata exports
 
@@ -547,3 +835,7 @@ for installation in mapdata['installations']:
     #         #         metadataFilePath = '/Users/juliangautier/Desktop/' + f'{datasetPidForFile}.xml'
     #         #         with open(metadataFilePath, mode='w') as f:
     #         #             f.write(data)
+
+# If every installation was crawled, record that the crawl finished, so that the next crawl starts from the beginning
+if all(journal.is_installation_finished(installation['hostname']) for installation in mapdata['installations']):
+    journal.finish_run()
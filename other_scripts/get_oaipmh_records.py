@@ -1,12 +1,17 @@
 import csv
 import os
+from pathlib import Path
+import sys
 import time
-import requests
 from tkinter import filedialog
 from tkinter import ttk
 from tkinter import *
 import xmltodict
 
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
+
 ####################################################################################
 
 # Create GUI for getting user input
@@ -119,7 +124,8 @@ csvFilePath = os.path.join(directory, csvFile)
 
 print('Counting current and deleted records:')
 
-response = requests.get(oaiUrl)
+client = get_installation_client(baseUrl)
+response = client.get(oaiUrl)
 dictData = xmltodict.parse(response.content)
 
 recordCount = 0
@@ -168,7 +174,7 @@ with open(csvFilePath, mode='w', encoding='utf-8', newline='') as f:
             print('Counting records in page %s' % (pageCount), end='\r', flush=True)
 
             oaiUrlResume = '%s?verb=ListIdentifiers&resumptionToken=%s' % (baseUrl, resumptionToken)
-            response = requests.get(oaiUrlResume)
+            response = client.get(oaiUrlResume)
             dictData = xmltodict.parse(response.content)
 
             for record in dictData['OAI-PMH']['ListIdentifiers']['header']:
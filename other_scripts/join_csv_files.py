@@ -1,13 +1,18 @@
 # Join (full outer join) CSV files in a given directory
 
-from functools import reduce
 import glob
 import os
 import pandas as pd
+from pathlib import Path
+import sys
 from tkinter import filedialog, Label, Tk, PanedWindow, Entry, mainloop, Listbox
 from tkinter import MULTIPLE, StringVar, Scrollbar, N, S, E, W
 from tkmacosx import Button
 
+# Use the curation assistant's joins
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import join_csv_files_on_key
+
 
 # Function called when button is pressed for browsing for CSV files
 def retrieve_csv_files():
@@ -24,12 +29,12 @@ def retrieve_csv_files():
         foreground='green', wraplength=500, justify='left')
     label_showFileCount.grid(sticky='w', row=2)
 
-    # Get names of columns that exist in all chosen CSV files
-    dataframes = [pd.read_csv(table, sep=',') for table in filesList]
+    # Get names of columns that exist in all chosen CSV files, reading only the header row of each file
+    dataframes = [pd.read_csv(table, sep=',', nrows=0) for table in filesList]
     columnLists = []
     for dataframe in dataframes:
         columnLists.append(dataframe.columns)
-    commonColumns = list(reduce(set.intersection, map(set, columnLists)))
+    commonColumns = list(set.intersection(*map(set, columnLists)))
 
     # Add names of common columns to list box
     values.set(commonColumns)
@@ -49,33 +54,23 @@ def retrieve_joinedfiledirectory():
     label_showChosenDirectory.grid(sticky='w', row=2)
 
 
-# Function for joining the given CSV files
-def join_csv_files(filesList, indexList, joinedFileDirectory):
+# Function for joining the given CSV files. If maxRows is given, only the first maxRows joined rows are exported,
+# e.g. to check the joined columns before joining very large files. Files that are too big to join in memory are
+# sorted and merge joined on disk, or set outOfCore to True or False to choose how the files are joined
+def join_csv_files(filesList, indexList, joinedFileDirectory, maxRows=None, outOfCore=None):
 
     # Create CSV file in the directory that the user selected
     filename = os.path.join(joinedFileDirectory, 'joined.csv')
 
-    print('Creating a dataframe for each CSV file...')
-
-    # Create a dataframe of each CSV file in the 'filesList' list
-    dataframes = [pd.read_csv(table, sep=',', na_filter = False) for table in filesList]
-
-    # For each dataframe, set the indexes (or the common columns across the dataframes to join on)
-    for dataframe in dataframes:
-        dataframe.set_index(indexList, inplace=True)
-        # dataframe.set_index(indexList, inplace=True)
-
-    print('Joining dataframes into one dataframe...')
-
-    # Full outer join all dataframes and save to the 'joined' variable
-    joined = reduce(lambda left, right: left.join(right, how='outer'), dataframes)
+    if len(filesList) == 0:
+        raise ValueError('No CSV files were chosen')
 
-    print('Exporting joined dataframe to a CSV file...')
+    print('Joining CSV files and exporting the joined rows to a CSV file...')
 
-    # Export joined dataframe to a CSV file
-    joined.to_csv(filename)
+    # Full outer join all CSV files in one multi-way join
+    joinedRowCount = join_csv_files_on_key(filesList, indexList, filename, maxRows=maxRows, outOfCore=outOfCore)
 
-    print('Joined dataframe exported to %s' % (filename))
+    print('%s joined rows exported to %s' % (joinedRowCount, filename))
 
 
 # Function called when button is pressed to join given CSV files
@@ -95,7 +90,7 @@ def join():
         if e == 'name \'filesList\' is not defined' or\
             e == 'are in the columns' in e or\
             e == 'name \'joinedFileDirectory\' is not defined' or\
-            e == 'reduce() of empty sequence with no initial value':
+            e == 'No CSV files were chosen':
 
             error = 'Check your entries and try again.'
         else:
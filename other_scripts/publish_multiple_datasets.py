@@ -1,7 +1,12 @@
 # Publish a given list of draft datasets
 
 from csv import DictReader
-import requests
+from pathlib import Path
+import sys
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
 
 repositoryURL = ''  # Base URL of the Dataverse repository, e.g. https://demo.dataverse.org
 apikey = ''
@@ -27,17 +32,21 @@ elif '.txt' in datasetPIDFile:
 total = len(datasetPIDs)
 count = 0
 
+client = get_installation_client(repositoryURL, apikey)
+
 for datasetPID in datasetPIDs:
     url = '%s/api/datasets/:persistentId/actions/:publish' % (repositoryURL)
     params = {'persistentId': datasetPID, 'type': versionType}
-    req = requests.post(
-        url,
-        params=params,
-        headers={
-            'X-Dataverse-key': apikey
-        })
     count += 1
 
+    # The client retries the call only if the repository didn't get it, so a failed call
+    # is reported and the script moves on to the next dataset
+    try:
+        req = client.post(url, params=params)
+    except Exception as e:
+        print('Failure: %s! %s of %s (%s)' % (datasetPID, count, total, e))
+        continue
+
     if req.status_code == 200:
         print('Success: %s! %s of %s' % (datasetPID, count, total))
     else:
@@ -1,7 +1,12 @@
 # Removes datasets linked in a dataverse collection
 
 from csv import DictReader
-import requests
+from pathlib import Path
+import sys
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
 
 server = 'https://demo.dataverse.org'  # Dataverse repository URL, e.g. https://demo.dataverse.org
 apikey = ''  # API key of superuser account
@@ -27,19 +32,14 @@ total = len(datasetPIDs)
 removed_links = []
 not_removed_links = []
 
+client = get_installation_client(server, apikey)
+
 print('Trying to remove dataset links...')
 
 for datasetPID in datasetPIDs:
     try:
         url = '%s/api/datasets/:persistentId/deleteLink/%s/?persistentId=%s' % (server, dataverseAlias, datasetPID)
-        headers = {
-            'X-Dataverse-key': apikey}
-
-        req = requests.delete(
-            url,
-            headers={
-                'X-Dataverse-key': apikey
-            })
+        req = client.delete(url)
 
         print('%s destroyed' % (datasetPID))
         removed_links.append(datasetPID)
@@ -1,7 +1,12 @@
 # Replace dataset metadata in given datasets
 import csv
 from csv import DictReader
-import requests
+from pathlib import Path
+import sys
+
+# Use the curation assistant's client for calling the repository's APIs
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'dataverse_repository_curation_assistant'))
+from dataverse_repository_curation_assistant_functions import get_installation_client
 
 server = 'https://demo.dataverse.org'  # Enter name of server url, which is home page URL of the Dataverse installation, e.g. https://demo.dataverse.org
 apikey = ''  # Enter API token of Dataverse account that has edit privileges on the datasets
@@ -12,6 +17,8 @@ datasetPIDs = ''  # Path to CSV file with list of dataset PIDs
 reader = csv.reader(open(datasetPIDs))
 total = len(list(reader)) - 1
 
+client = get_installation_client(server, apikey)
+
 count = 0
 with open(datasetPIDs, mode='r', encoding='utf-8') as f:
     csv_dict_reader = DictReader(f, delimiter=',')
@@ -77,13 +84,12 @@ with open(datasetPIDs, mode='r', encoding='utf-8') as f:
         datasetPID = row['persistent_id'].rstrip()
         url = '%s/api/datasets/:persistentId/editMetadata' % (server)
         params = {'persistentId': datasetPID, 'replace': 'true'}
-        r = requests.put(
+        r = client.put(
             url,
             # data=open(metadatafile, 'rb'),
             json=metadataValues,
             params=params,
             headers={
-                'X-Dataverse-key': apikey,
                 'content-type': 'application/json'
             })
         count += 1